@@ -1,26 +1,52 @@
 import os
 import asyncio
+import logging
 from typing import Literal, Optional, List
 
 from nicegui import ui, app, run, events, binding
 from fastapi import Request
 import pandas as pd
 
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 
 from utils.python_utils import localeText
-from components.user_db import get_table_data
-from components.vector_db import get_vector_data, add_vector_data, get_specific_vector_data, remove_vector
+from components.user_db import aget_table_data
+from components.qa_import import import_qa_file, save_upload
+from components.near_duplicates import find_near_duplicates
+from components.admin_store import AdminVectorStore, ADMIN_GRID_CLIENT_ROWS_LIMIT, get_admin_store, get_infinite_datasource, get_row_id
+from components.vector_db import acollect_vector_data, add_vector_data, get_specific_vector_data, remove_vector, set_namespace_backend
 
 import google_oauth
 from google_oauth import is_authenticated, session_info
 
+logger = logging.getLogger(__name__)
+
+# Number of namespaces downloaded at the same time, Upstash requests are also rate limited in vector_db
+ADMIN_DOWNLOAD_CONCURRENCY = int(os.getenv('ADMIN_DOWNLOAD_CONCURRENCY', '4'))
+
+@app.post('/admin/api/vectors/{store_id}')
+async def admin_vector_rows(store_id: str, request: Request):
+    # Blocks of rows for the infinite row model of the Q&A grid, only for the session that owns the store
+    if not is_authenticated(request):
+        return JSONResponse({'detail': 'Not authenticated'}, status_code=401)
+    store = get_admin_store(store_id, request.session.get('id'))
+    if store is None:
+        return JSONResponse({'detail': 'Not found'}, status_code=404)
+
+    params = await request.json()
+    start = max(int(params.get('start', 0)), 0)
+    end = max(int(params.get('end', start + 100)), start)
+    rows, row_count = store.get_block(start, end, params.get('sort_model'), params.get('filter_model'))
+    return JSONResponse({'rows': rows, 'row_count': row_count})
+
+
 @ui.page('/admin', favicon='🚀', title='AIサポートデスク管理画面')
 async def admin_page(request: Request):
     # ======================================== Checking session login status ========================================
     if not is_authenticated(request):
         return RedirectResponse('/login?next=/admin')
-    session = session_info[request.session['id']]
+    session_id = request.session['id']
+    session = session_info[session_id]
 
     # -------------------------- Starting app loding -------------------------- #
     with ui.card().tight().classes('fixed-center') as startup_element:
@@ -30,9 +56,15 @@ async def admin_page(request: Request):
     await ui.context.client.connected(timeout=120)
 
     # -------------------------- Initialize database -------------------------- #
-    shop_information = await run.io_bound(get_table_data, 'users')
+    shop_information = await aget_table_data('users')
     if shop_information.empty:
         return
+    if 'vector_db_backend' in shop_information.columns:
+        for namespace, backend_name in shop_information[['vector_db_namespace', 'vector_db_backend']].dropna().itertuples(index=False):
+            try:
+                set_namespace_backend(namespace, backend_name)
+            except ValueError:
+                logger.warning('Ignoring the vector backend of %s', namespace, exc_info=True)
 
     # -------------------------- Dialog section -------------------------- #
     with ui.dialog().props('persistent') as reset_dialog, ui.card():
@@ -48,13 +80,16 @@ async def admin_page(request: Request):
             with ui.linear_progress(value=0, size='25px', show_value=False, color='warning').props('stripe rounded') as downloading_account_progress:
                 with ui.row(align_items='center').classes('absolute-center'):
                     progress_text_percentage = ui.badge(color='white', text_color='accent')
+            progress_details = ui.label().classes('text-white text-lg whitespace-pre-line')
     
     def flash_screen(
             progress: Optional[float] = None, 
             progress_text: Optional[int] = None,
             status: Optional[Literal['open', 'close']] = None, 
+            details: Optional[str] = None,
         ):
         if status == 'open':
+            progress_details.set_text('')
             waiting_downloding_account.open()
         elif status == 'close':
             waiting_downloding_account.close()
@@ -66,6 +101,9 @@ async def admin_page(request: Request):
             downloading_account_progress.set_value(progress)
             progress_text_percentage.set_text(f'{progress_text}%')
 
+        if details is not None:
+            progress_details.set_text(details)
+
     # -------------------------- Header section -------------------------- #
     with ui.header(bordered=True).classes('items-center text-black bg-white h-[5rem]'), ui.column(align_items='center').classes('w-full mx-auto'):
         with ui.row(align_items='center').classes('w-full no-wrap items-center'):
@@ -250,7 +288,7 @@ async def admin_page(request: Request):
 
                 class AllVectorData:
                     def __init__(self):
-                        self.df_all_vector_data = pd.DataFrame()
+                        self.vector_store = AdminVectorStore(session_id=session_id)
                         self.df_selected_account = pd.DataFrame()
                         self.list_namespaces: Optional[List[str]] = None
                     
@@ -265,39 +303,99 @@ async def admin_page(request: Request):
 
                             database_name_select.set_options(self.list_namespaces)
                             shop_name_en_select.set_options(self.list_shop_name_en)
+                            import_database_name_select.set_options(self.list_namespaces)
+                            import_shop_name_en_select.set_options(self.list_shop_name_en)
 
                             flash_screen(progress=0, progress_text=0, status='open')
+                            # Show the database step right away, the grid fills up behind the progress screen
+                            self.vector_store.clear()
+                            self.set_row_model()
+                            stepper.next()
 
-                            list_df_account_vector = []
-                            for row_index, account in self.df_selected_account.iterrows():
-                                shop_name_en = account['shop_name_en']
-                                account_id = account['id']
-                                namespace = account['vector_db_namespace']
-
-                                vector_database = await run.io_bound(get_vector_data, namespace)
-                                await asyncio.sleep(2.5)
-
-                                vector_database['account_id'] = account_id
-                                vector_database['shop_name_en'] = shop_name_en
-                                vector_database['vector_db_namespace'] = namespace
-
-                                list_df_account_vector.append(vector_database)
+                            await self.download_namespaces(self.df_selected_account)
 
-                                progress_value = float((row_index + 1) / len(self.df_selected_account.index))
-                                flash_screen(progress=progress_value, progress_text=int(progress_value*100))
-
-                            self.df_all_vector_data = pd.concat(list_df_account_vector)
+                            flash_screen(status='close')
+                        else:
+                            stepper.next()
+
+                    def set_row_model(self) -> None:
+                        """Client-side rows for normal tables, blocks served by /admin/api/vectors for large ones."""
+                        # The rows never stay in the options, the grid holds them and gets deltas afterwards
+                        vector_table.options.pop('rowData', None)
+                        if len(self.vector_store) > ADMIN_GRID_CLIENT_ROWS_LIMIT:
+                            vector_table.options['rowModelType'] = 'infinite'
+                            vector_table.options[':datasource'] = get_infinite_datasource(self.vector_store)
+                            vector_table.update()
+                        else:
+                            vector_table.options.pop(':datasource', None)
+                            vector_table.options['rowModelType'] = 'clientSide'
+                            vector_table.update()
+                            # Runs after the grid is rebuilt by update()
+                            vector_table.run_grid_method('setGridOption', 'rowData', list(self.vector_store.rows.values()))
+
+                    def apply_transaction(self, transaction: dict) -> None:
+                        """Send only the changed rows to the grid."""
+                        is_infinite = vector_table.options['rowModelType'] == 'infinite'
+                        if is_infinite != (len(self.vector_store) > ADMIN_GRID_CLIENT_ROWS_LIMIT):
+                            self.set_row_model()
+                        elif is_infinite:
+                            vector_table.run_grid_method('refreshInfiniteCache')
+                        else:
+                            vector_table.run_grid_method('applyTransaction', transaction)
+
+                    async def download_namespaces(self, df_accounts: pd.DataFrame) -> None:
+                        """
+                        Download the namespaces of `df_accounts` concurrently (ADMIN_DOWNLOAD_CONCURRENCY at a time).
+                        Each namespace is added to the grid as soon as it is complete, a failing one is reported and skipped.
+                        """
+                        semaphore = asyncio.Semaphore(ADMIN_DOWNLOAD_CONCURRENCY)
+                        namespaces = df_accounts['vector_db_namespace'].unique().tolist()
+                        namespace_status = {namespace: '待機中' for namespace in namespaces}
+
+                        def report() -> None:
+                            finished = sum(status.endswith(('件', 'エラー')) for status in namespace_status.values())
+                            progress_value = float(finished / len(namespaces))
+                            flash_screen(
+                                progress=progress_value,
+                                progress_text=int(progress_value*100),
+                                details='\n'.join(f'{namespace}: {status}' for namespace, status in namespace_status.items()),
+                            )
 
-                        vector_table.options.update(
-                            {
-                                "rowData": self.df_all_vector_data.to_dict('records'),
-                            }
-                        )
-                        vector_table.update()
-                        
-                        await asyncio.sleep(2.5)
-                        flash_screen(status='close')
-                        stepper.next()
+                        def on_progress(namespace: str, row_count: int) -> None:
+                            namespace_status[namespace] = f'ダウンロード中 ({row_count}件)'
+                            report()
+
+                        async def download(namespace: str) -> None:
+                            async with semaphore:
+                                namespace_status[namespace] = 'ダウンロード中'
+                                report()
+                                try:
+                                    vector_database = await acollect_vector_data(
+                                        namespace,
+                                        on_progress=lambda row_count: on_progress(namespace, row_count),
+                                    )
+                                except Exception:
+                                    logger.exception('Downloading namespace %s failed', namespace)
+                                    namespace_status[namespace] = 'エラー'
+                                    report()
+                                    return
+
+                            # Accounts sharing a namespace download it only once
+                            for _, account in df_accounts[df_accounts['vector_db_namespace'] == namespace].iterrows():
+                                df_account_vector = vector_database.copy()
+                                df_account_vector['account_id'] = account['id']
+                                df_account_vector['shop_name_en'] = account['shop_name_en']
+                                df_account_vector['vector_db_namespace'] = namespace
+                                self.apply_transaction(self.vector_store.upsert_dataframe(df_account_vector))
+
+                            namespace_status[namespace] = f'{len(vector_database.index)}件'
+                            report()
+
+                        await asyncio.gather(*(download(namespace) for namespace in namespaces))
+
+                        failed_namespaces = [namespace for namespace, status in namespace_status.items() if status == 'エラー']
+                        if failed_namespaces:
+                            ui.notify(f'ダウンロードに失敗しました: {", ".join(failed_namespaces)}', type='negative')
 
                 all_vector_data = AllVectorData()
 
@@ -422,6 +520,7 @@ async def admin_page(request: Request):
                         },
                     ],
                     "rowData": [],
+                    ":getRowId": "(params) => params.data.row_id",
                     "suppressDragLeaveHidesColumns": True,
                     "rowModelType": "clientSide",
                     "rowSelection": "multiple",
@@ -467,20 +566,17 @@ async def admin_page(request: Request):
                         flash_screen(progress=0, progress_text=0, status='open')
 
                         list_added_id = await run.io_bound(add_vector_data, namespace, qa_text, service)
-                        await asyncio.sleep(1)
                         new_added_data = await run.io_bound(get_specific_vector_data, namespace, list_added_id)
                         new_added_data['shop_name_en'] = shop_name_en
                         # new_added_data['account_id'] = ??? Need to be rectify
                         new_added_data['vector_db_namespace'] = namespace
 
-                        df_concat = pd.concat([all_vector_data.df_all_vector_data, new_added_data])
-                        all_vector_data.df_all_vector_data = df_concat
+                        transaction = all_vector_data.vector_store.upsert_dataframe(new_added_data)
                        
                         flash_screen(progress=1, progress_text=100)
-                        vector_table.run_grid_method("setGridOption", "rowData",  all_vector_data.df_all_vector_data.to_dict("records"), timeout=10)
+                        all_vector_data.apply_transaction(transaction)
                         # vector_table.run_grid_method('ensureIndexVisible', df_concat.index[-1], 'bottom')
                         # grid_target.run_grid_method('flashCells', { "columns": [column_name] })
-                        await asyncio.sleep(2.5)
                         flash_screen(status='close')
                         ui.notify('Q&Aの追加が完了しました！', type='positive')
 
@@ -497,15 +593,14 @@ async def admin_page(request: Request):
                         self.id = ''
 
                     async def remove_vector(self, vector_table: ui.aggrid):
-                        selected_vectors = await ui.run_javascript(f'getElement({vector_table.id}).api.getSelectedNodes().map(node => node.data.vector_id)')
-                        selected_vectors_index = [item for item in selected_vectors]
+                        selected_vectors = await ui.run_javascript(f'getElement({vector_table.id}).api.getSelectedNodes().map(node => node.data.row_id)')
+                        selected_rows = all_vector_data.vector_store.get_rows(selected_vectors)
 
-                        if not selected_vectors_index or len(selected_vectors_index) < 1:
+                        if not selected_rows:
                             ui.notify("削除したいQ&A内容を選択してください！", type="warning")
                             return
 
-                        df_all_vector_data_temp = all_vector_data.df_all_vector_data.copy(deep=True)
-                        df_selected_rows = df_all_vector_data_temp[df_all_vector_data_temp['vector_id'].isin(selected_vectors_index)]
+                        df_selected_rows = pd.DataFrame(selected_rows)
                         list_namespaces = df_selected_rows['vector_db_namespace'].unique().tolist()
 
                         delete_prompt = await dialog_remove_vector
@@ -517,24 +612,68 @@ async def admin_page(request: Request):
                                 delete_id = df_one_namespace['vector_id'].unique().tolist()
 
                                 delete_is_success = await run.io_bound(remove_vector, delete_id, namespace)
-                                await asyncio.sleep(1)
                                 if delete_is_success:
-                                    index_tobe_deleted = all_vector_data.df_all_vector_data[all_vector_data.df_all_vector_data['vector_id'].isin(delete_id)].index
-                                    new_df_all_vector_data = all_vector_data.df_all_vector_data.drop(index_tobe_deleted)
-                                    all_vector_data.df_all_vector_data = new_df_all_vector_data
+                                    all_vector_data.apply_transaction(all_vector_data.vector_store.remove(namespace, delete_id))
 
                                 progress_value = float((index + 1) / len(list_namespaces))
                                 flash_screen(progress=progress_value, progress_text=int(progress_value*100))
 
-                            vector_table.run_grid_method("setGridOption", "rowData", all_vector_data.df_all_vector_data.to_dict("records"), timeout=10)
-                            
                             # vector_table.run_grid_method('ensureIndexVisible', df_concat.index[-1], 'bottom')
                             # grid_target.run_grid_method('flashCells', { "columns": [column_name] })
-                            await asyncio.sleep(2.5)
                             flash_screen(status='close')
                 
                 remove_vector_object = RemoveVector()
 
+                class ImportVectors:
+                    async def import_vectors(self, event: events.UploadEventArguments, shop_name_en: str, namespace: str, service: str):
+                        upload_element.reset()
+                        if not shop_name_en or not namespace:
+                            ui.notify("ドメインとQ&Aデータベースを選択してください！", type="warning")
+                            return
+                        if not event.name.lower().endswith(('.csv', '.xlsx')):
+                            ui.notify("CSVまたはExcel(.xlsx)ファイルを選択してください！", type="warning")
+                            return
+
+                        dialog_import_vector.close()
+                        flash_screen(progress=0, progress_text=0, status='open')
+
+                        path = await run.io_bound(lambda: save_upload(event.name, event.content.read()))
+
+                        def on_progress(imported_rows: int, total_rows: int, failed_batches: int) -> None:
+                            progress_value = min(float(imported_rows / total_rows), 1.0) if total_rows else 1.0
+                            details = f'{imported_rows}/{total_rows}件'
+                            if failed_batches:
+                                details += f'（失敗したバッチ: {failed_batches}）'
+                            flash_screen(progress=progress_value, progress_text=int(progress_value*100), details=details)
+
+                        try:
+                            result = await import_qa_file(path, namespace, default_service=service or '', on_progress=on_progress)
+                        except Exception:
+                            logger.exception('Importing %s into %s failed', event.name, namespace)
+                            flash_screen(status='close')
+                            ui.notify('インポートに失敗しました！', type='negative')
+                            return
+                        if result.file_error:
+                            flash_screen(status='close')
+                            ui.notify(f'インポートに失敗しました！{result.file_error}', type='negative', multi_line=True)
+                            return
+
+                        if not result.added.empty:
+                            result.added['shop_name_en'] = shop_name_en
+                            result.added['vector_db_namespace'] = namespace
+                            all_vector_data.apply_transaction(all_vector_data.vector_store.upsert_dataframe(result.added))
+
+                        flash_screen(status='close')
+                        if result.errors:
+                            lines = ', '.join(str(error.line) for error in result.errors[:10])
+                            ui.notify(f'{len(result.errors)}行をスキップしました（行: {lines}{" …" if len(result.errors) > 10 else ""}）', type='warning')
+                        if result.failed_batches:
+                            ui.notify('一部のQ&Aを追加できませんでした。同じファイルをもう一度アップロードすると続きから再開します。', type='negative', multi_line=True)
+                        else:
+                            ui.notify(f'{len(result.added.index)}件のQ&Aのインポートが完了しました！', type='positive')
+
+                import_vector_object = ImportVectors()
+
                 with ui.dialog().props('persistent transition-show="scale" transition-hide="scale"') as dialog_add_vector, ui.card().classes('!max-w-full'):
                     with ui.column().classes('w-full'):
                         ui.label('Q&Aを追加')
@@ -568,6 +707,35 @@ async def admin_page(request: Request):
                                 )
                             )
 
+                with ui.dialog().props('persistent transition-show="scale" transition-hide="scale"') as dialog_import_vector, ui.card().classes('!max-w-full'):
+                    with ui.column().classes('w-full'):
+                        ui.label('Q&Aを一括インポート（CSV / Excel）')
+                        ui.markdown('列: `text`（または `質問` と `回答`）、`service`（任意）').classes('text-sm')
+                        with ui.row(align_items='baseline').classes('w-full'):
+                            ui.label('ドメイン：')
+                            ui.space()
+                            import_shop_name_en_select = ui.select(options=[]).props('outlined').classes('w-64')
+                        with ui.row(align_items='baseline').classes('w-full'):
+                            ui.label('商材（既定値）：')
+                            ui.space()
+                            import_service_input = ui.input().props('outlined').classes('w-64')
+                        with ui.row(align_items='baseline').classes('w-full'):
+                            ui.label('Q&Aデータベース：')
+                            ui.space()
+                            import_database_name_select = ui.select(options=[]).props('outlined').classes('w-64')
+                        upload_element = ui.upload(
+                            auto_upload=True,
+                            on_upload=lambda event: import_vector_object.import_vectors(
+                                event,
+                                shop_name_en=import_shop_name_en_select.value,
+                                namespace=import_database_name_select.value,
+                                service=import_service_input.value,
+                            ),
+                        ).props('accept=".csv,.xlsx" flat bordered').classes('w-full')
+                        with ui.row(align_items='center').classes('w-full'):
+                            ui.space()
+                            ui.button('キャンセル', on_click=lambda: dialog_import_vector.close())
+
                 with ui.dialog().props('persistent transition-show="scale" transition-hide="scale"') as dialog_remove_vector, ui.card().classes('!max-w-full'):
                     ui.label('選択したQ&Aの内容を削除しますか？')
                     with ui.row().classes('w-full'):
@@ -579,7 +747,107 @@ async def admin_page(request: Request):
                     ui.button('編集')
                     ui.space()
                     ui.button('Q&A追加', color='teal', on_click=lambda: dialog_add_vector.open())
+                    ui.button('Q&A一括インポート', color='teal', on_click=lambda: dialog_import_vector.open())
                     ui.button('Q&A削除', color='red', on_click=lambda: remove_vector_object.remove_vector(vector_table=vector_table))
 
+        with ui.step('重複チェック', icon='content_copy'):
+            with ui.column(align_items='center').classes('w-full mx-auto'):
+                duplicates_table_options = {
+                    "defaultColDef": {
+                        "editable": False,
+                        "minWidth": 120,
+                        "resizable": True,
+                        "sortable": True,
+                        "floatingFilter": True,
+                        "headerClass": "font-bold",
+                    },
+                    "columnDefs": [
+                        {'headerName': 'グループ', 'field': 'duplicate_group', 'filter': 'agNumberColumnFilter', 'maxWidth': 140},
+                        {'headerName': '残す', 'field': 'keep', 'editable': True, 'cellDataType': 'boolean', 'maxWidth': 120},
+                        {'headerName': 'Q&Aのデータベース', 'field': 'vector_db_namespace', 'filter': True},
+                        {'headerName': 'Q&A内容', 'field': 'text', 'filter': True, 'minWidth': 400, 'wrapText': True, 'autoHeight': True},
+                        {'headerName': '追加日付', 'field': 'added_date', 'filter': True},
+                        {'headerName': 'ID', 'field': 'vector_id', 'filter': True},
+                    ],
+                    "rowData": [],
+                    ":getRowId": "(params) => params.data.row_id",
+                    "suppressDragLeaveHidesColumns": True,
+                    "animateRows": True,
+                    "alwaysShowHorizontalScroll": True,
+                    "localeText": localeText,
+                }
+                duplicates_table = ui.aggrid(duplicates_table_options, theme='material', auto_size_columns=True).classes('h-[calc(100vh-300px)]')
+
+                class DuplicateVectors:
+                    def __init__(self):
+                        self.df_duplicates = pd.DataFrame()
+
+                    async def detect_duplicates(self):
+                        if not len(all_vector_data.vector_store):
+                            ui.notify("先にデータベースをダウンロードしてください！", type="warning")
+                            return
+
+                        flash_screen(progress=0, progress_text=0, status='open', details='重複を検出中…')
+                        # CPU heavy, runs in a worker process
+                        df_duplicates = await run.cpu_bound(find_near_duplicates, all_vector_data.vector_store.to_dataframe())
+                        df_duplicates['row_id'] = [get_row_id(row) for row in df_duplicates.to_dict('records')]
+                        self.df_duplicates = df_duplicates.set_index('row_id', drop=False)
+
+                        duplicates_table.run_grid_method('setGridOption', 'rowData', self.df_duplicates[
+                            ['row_id', 'duplicate_group', 'keep', 'vector_db_namespace', 'text', 'added_date', 'vector_id']
+                        ].to_dict('records') if not self.df_duplicates.empty else [])
+
+                        flash_screen(progress=1, progress_text=100, status='close')
+                        group_count = self.df_duplicates['duplicate_group'].nunique() if not self.df_duplicates.empty else 0
+                        ui.notify(f'{group_count}件の重複グループが見つかりました', type='info')
+
+                    def set_keep(self, event: events.GenericEventArguments):
+                        row_id = event.args['data']['row_id']
+                        if event.args.get('colId') == 'keep' and row_id in self.df_duplicates.index:
+                            self.df_duplicates.loc[row_id, 'keep'] = bool(event.args['newValue'])
+
+                    async def remove_duplicates(self):
+                        if self.df_duplicates.empty:
+                            ui.notify("削除する重複がありません！", type="warning")
+                            return
+
+                        df_remove = self.df_duplicates[~self.df_duplicates['keep'].astype(bool)]
+                        if df_remove.empty:
+                            ui.notify("「残す」以外の行がありません！", type="warning")
+                            return
+
+                        delete_prompt = await dialog_remove_vector
+                        if delete_prompt != '削除':
+                            return
+
+                        flash_screen(progress=0, progress_text=0, status='open')
+                        list_namespaces = df_remove['vector_db_namespace'].unique().tolist()
+                        for index, namespace in enumerate(list_namespaces):
+                            df_one_namespace = df_remove[df_remove['vector_db_namespace'] == namespace]
+                            delete_id = df_one_namespace['vector_id'].tolist()
+
+                            delete_is_success = await run.io_bound(remove_vector, delete_id, namespace)
+                            if delete_is_success:
+                                all_vector_data.apply_transaction(all_vector_data.vector_store.remove(namespace, delete_id))
+                                duplicates_table.run_grid_method('applyTransaction', {'remove': [{'row_id': row_id} for row_id in df_one_namespace.index]})
+                                self.df_duplicates = self.df_duplicates.drop(df_one_namespace.index)
+                            else:
+                                ui.notify(f'{namespace}の一部のQ&Aを削除できませんでした', type='negative')
+
+                            progress_value = float((index + 1) / len(list_namespaces))
+                            flash_screen(progress=progress_value, progress_text=int(progress_value*100))
+
+                        flash_screen(status='close')
+                        ui.notify('重複の削除が完了しました！', type='positive')
+
+                duplicate_vectors_object = DuplicateVectors()
+                duplicates_table.on('cellValueChanged', duplicate_vectors_object.set_keep)
+
+                with ui.row(align_items='center').classes('w-full'):
+                    ui.label('各グループで「残す」以外の行を削除します').classes('text-sm text-gray-500')
+                    ui.space()
+                    ui.button('重複を検出', color='teal', on_click=duplicate_vectors_object.detect_duplicates)
+                    ui.button('重複を一括削除', color='red', on_click=duplicate_vectors_object.remove_duplicates)
+
 
     startup_element.clear()
\ No newline at end of file
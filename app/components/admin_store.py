@@ -0,0 +1,131 @@
+import os
+import uuid
+import weakref
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+
+# Above this many rows the admin grid switches to the infinite row model
+ADMIN_GRID_CLIENT_ROWS_LIMIT = int(os.getenv('ADMIN_GRID_CLIENT_ROWS_LIMIT', '20000'))
+
+# AG Grid identifies rows with this field, so transactions only carry the changed rows
+ROW_ID_FIELD = 'row_id'
+
+
+def get_row_id(row: Dict[str, Any]) -> str:
+    # The same namespace may be downloaded for several accounts
+    return f"{row.get('vector_db_namespace', '')}:{row.get('shop_name_en', '')}:{row.get('vector_id', '')}"
+
+
+def clean_value(value: Any) -> Any:
+    # NaN/NaT from pandas are not valid JSON
+    return None if value is not None and not isinstance(value, (list, dict)) and pd.isna(value) else value
+
+
+class AdminVectorStore:
+    """
+    Rows of the admin Q&A grid keyed by `row_id`.
+
+    Every change returns the matching AG Grid transaction (`add`/`update`/`remove`), the
+    full table is never sent again. Stores are registered by id so the infinite row model
+    endpoint can serve blocks of rows to the page that owns them.
+    """
+    def __init__(self, session_id: Optional[str] = None) -> None:
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        admin_stores[self.id] = self
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def clear(self) -> Dict[str, List[Dict[str, Any]]]:
+        transaction = {'remove': [{ROW_ID_FIELD: row_id} for row_id in self.rows]}
+        self.rows.clear()
+        return transaction
+
+    def upsert(self, records: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        transaction = {'add': [], 'update': []}
+        for record in records:
+            row = {key: clean_value(value) for key, value in record.items()}
+            row[ROW_ID_FIELD] = get_row_id(row)
+            transaction['update' if row[ROW_ID_FIELD] in self.rows else 'add'].append(row)
+            self.rows[row[ROW_ID_FIELD]] = row
+        return transaction
+
+    def upsert_dataframe(self, df: pd.DataFrame) -> Dict[str, List[Dict[str, Any]]]:
+        return self.upsert(df.to_dict('records'))
+
+    def remove(self, namespace: str, vector_ids: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Remove the vectors of `namespace` from every account showing them."""
+        vector_ids = set(vector_ids)
+        removed = [
+            row_id for row_id, row in self.rows.items()
+            if row.get('vector_db_namespace') == namespace and row.get('vector_id') in vector_ids
+        ]
+        for row_id in removed:
+            del self.rows[row_id]
+        return {'remove': [{ROW_ID_FIELD: row_id} for row_id in removed]}
+
+    def get_rows(self, row_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return [self.rows[row_id] for row_id in row_ids if row_id in self.rows]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(list(self.rows.values()))
+
+    def get_block(
+            self,
+            start: int,
+            end: int,
+            sort_model: Optional[List[Dict[str, str]]] = None,
+            filter_model: Optional[Dict[str, Dict[str, Any]]] = None,
+        ) -> Tuple[List[Dict[str, Any]], int]:
+        """Rows `start:end` after sorting and filtering, and the total row count, for the infinite row model."""
+        rows = list(self.rows.values())
+
+        for field, condition in (filter_model or {}).items():
+            # Only the text of simple conditions is supported, matched case-insensitively
+            text = str(condition.get('filter', '')).lower()
+            if text:
+                rows = [row for row in rows if text in str(row.get(field) or '').lower()]
+
+        for sort in reversed(sort_model or []):
+            rows.sort(
+                key=lambda row: (row.get(sort['colId']) is None, str(row.get(sort['colId']) or '')),
+                reverse=sort.get('sort') == 'desc',
+            )
+
+        return rows[start:end], len(rows)
+
+
+# Stores disappear with the admin page that created them
+admin_stores: 'weakref.WeakValueDictionary[str, AdminVectorStore]' = weakref.WeakValueDictionary()
+
+
+def get_admin_store(store_id: str, session_id: Optional[str]) -> Optional[AdminVectorStore]:
+    store = admin_stores.get(store_id)
+    if store is None or store.session_id != session_id:
+        return None
+    return store
+
+
+def get_infinite_datasource(store: AdminVectorStore) -> str:
+    """JavaScript datasource fetching the blocks of `store` from /admin/api/vectors."""
+    return f'''{{
+        getRows: (params) => {{
+            fetch("/admin/api/vectors/{store.id}", {{
+                method: "POST",
+                headers: {{"Content-Type": "application/json"}},
+                body: JSON.stringify({{
+                    start: params.startRow,
+                    end: params.endRow,
+                    sort_model: params.sortModel,
+                    filter_model: params.filterModel,
+                }}),
+            }})
+                .then((response) => response.ok ? response.json() : Promise.reject(response.status))
+                .then((block) => params.successCallback(block.rows, block.row_count))
+                .catch(() => params.failCallback());
+        }},
+    }}'''
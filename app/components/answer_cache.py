@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from components.text_embedding import NgramHashEmbeddings, normalize_text
+from components.vector_db import add_namespace_listener
+
+
+@dataclass
+class CachedAnswer:
+    vector: np.ndarray
+    answer: str
+    created_at: float
+
+
+def get_answer_scope(shop_name: str, openai_chat_prompt: Optional[str]) -> str:
+    """
+    Cache scope of a shop's answers. They are written with the shop's own prompt and persona,
+    so shops sharing a namespace never see each other's answers, nor answers of an older prompt.
+    """
+    prompt_hash = hashlib.sha256((openai_chat_prompt or '').encode()).hexdigest()[:16]
+    return f'{shop_name}:{prompt_hash}'
+
+
+class SemanticAnswerCache:
+    """
+    Cache of (question embedding -> final answer) per namespace and answer scope.
+
+    A question is served from the cache when the cosine similarity with a cached question
+    reaches `similarity_threshold`. Entries expire after `ttl_seconds` and each scope
+    keeps at most `max_entries` answers in LRU order. Invalidating a namespace drops
+    the answers of every scope in it.
+    """
+    def __init__(
+            self,
+            embeddings: NgramHashEmbeddings,
+            similarity_threshold: float = 0.93,
+            ttl_seconds: float = 6 * 60 * 60,
+            max_entries: int = 500,
+        ) -> None:
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # (namespace, scope) -> answers
+        self.scopes: Dict[Tuple[str, str], "OrderedDict[str, CachedAnswer]"] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def lookup(self, namespace: str, scope: str, question: str) -> Optional[str]:
+        self.loop = asyncio.get_running_loop()
+        entries = self.scopes.get((namespace, scope))
+        if not entries:
+            return None
+
+        now = time.monotonic()
+        for key in [key for key, entry in entries.items() if now - entry.created_at > self.ttl_seconds]:
+            entries.pop(key)
+        if not entries:
+            return None
+
+        keys = list(entries)
+        matrix = np.stack([entries[key].vector for key in keys])
+        similarities = matrix @ self.embeddings.embed_text(question)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        entries.move_to_end(keys[best])
+        return entries[keys[best]].answer
+
+    def store(self, namespace: str, scope: str, question: str, answer: str) -> None:
+        self.loop = asyncio.get_running_loop()
+        entries = self.scopes.setdefault((namespace, scope), OrderedDict())
+        key = normalize_text(question)
+        entries[key] = CachedAnswer(
+            vector=self.embeddings.embed_text(question),
+            answer=answer,
+            created_at=time.monotonic(),
+        )
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def drop_shop(self, shop_name: str) -> None:
+        """Drop the answers of a shop in every namespace, e.g. when its prompt changed."""
+        for key in [key for key in self.scopes if key[1].startswith(f'{shop_name}:')]:
+            del self.scopes[key]
+
+    def drop_namespace(self, namespace: str) -> None:
+        for key in [key for key in self.scopes if key[0] == namespace]:
+            del self.scopes[key]
+
+    def invalidate(self, namespace: str, *args, **kwargs) -> None:
+        # Admin edits run in a worker thread, the cache is only touched from the event loop
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.drop_namespace, namespace)
+        else:
+            self.drop_namespace(namespace)
+
+
+answer_cache = SemanticAnswerCache(
+    embeddings=NgramHashEmbeddings(),
+    similarity_threshold=float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.93')),
+    ttl_seconds=float(os.getenv('ANSWER_CACHE_TTL_SECONDS', '21600')),
+)
+
+# Answers are stale as soon as the Q&A data of their namespace changes
+add_namespace_listener(answer_cache.invalidate)
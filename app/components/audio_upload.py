@@ -0,0 +1,131 @@
+import os
+import secrets
+import weakref
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from nicegui import app, background_tasks
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+# Whisper rejects files above 25 MB
+AUDIO_UPLOAD_MAX_BYTES = int(os.getenv('AUDIO_UPLOAD_MAX_BYTES', str(25 * 1024 * 1024)))
+
+
+@dataclass
+class Recording:
+    chunks: List[bytes] = field(default_factory=list)
+    size: int = 0
+
+
+class AudioUploadSession:
+    """
+    Upload target of one chat page.
+
+    The recorder posts the raw MediaRecorder chunks in order to
+    /audio/{token}/{recording_id}/chunks/{seq}, then /audio/{token}/{recording_id}/finish
+    hands the whole recording to `on_audio(audio, mime_type, duration, recording_id)`.
+    With `on_chunk`, every chunk is also handed to `on_chunk(recording_id, chunk, mime_type)`
+    as it arrives, in order, so it can be transcribed while the user speaks.
+
+    The random token is only known to that page, and the session disappears together
+    with the page's State.
+    """
+    def __init__(
+            self,
+            on_audio: Callable[[bytes, str, float, str], Awaitable[None]],
+            max_bytes: int = AUDIO_UPLOAD_MAX_BYTES,
+            on_chunk: Optional[Callable[[str, bytes, str], Awaitable[None]]] = None,
+        ) -> None:
+        self.token = secrets.token_urlsafe(24)
+        self.on_audio = on_audio
+        self.on_chunk = on_chunk
+        self.max_bytes = max_bytes
+        self.recording_id: Optional[str] = None
+        self.recording = Recording()
+        audio_sessions[self.token] = self
+
+    @property
+    def upload_url(self) -> str:
+        return f'/audio/{self.token}'
+
+    def add_chunk(self, recording_id: str, seq: int, data: bytes) -> None:
+        if recording_id != self.recording_id:
+            if seq != 0:
+                raise LookupError('Unknown recording')
+            # A new recording replaces the previous one, only the latest one is transcribed
+            self.recording_id = recording_id
+            self.recording = Recording()
+
+        if seq != len(self.recording.chunks):
+            raise LookupError('Chunk out of order')
+        if self.recording.size + len(data) > self.max_bytes:
+            raise OverflowError('Recording too large')
+
+        self.recording.chunks.append(data)
+        self.recording.size += len(data)
+
+    def get_audio(self) -> bytes:
+        """The current recording so far."""
+        return b''.join(self.recording.chunks)
+
+    def finish(self, recording_id: str) -> bytes:
+        if recording_id != self.recording_id:
+            raise LookupError('Unknown recording')
+
+        audio = self.get_audio()
+        self.recording_id = None
+        self.recording = Recording()
+        return audio
+
+
+audio_sessions: 'weakref.WeakValueDictionary[str, AudioUploadSession]' = weakref.WeakValueDictionary()
+
+
+async def read_body(request: Request, max_bytes: int) -> Optional[bytes]:
+    """The raw request body, None when it exceeds `max_bytes`."""
+    body = bytearray()
+    async for data in request.stream():
+        body.extend(data)
+        if len(body) > max_bytes:
+            return None
+    return bytes(body)
+
+
+@app.post('/audio/{token}/{recording_id}/chunks/{seq}')
+async def upload_audio_chunk(token: str, recording_id: str, seq: int, request: Request, mime_type: str = 'audio/webm'):
+    session = audio_sessions.get(token)
+    if session is None:
+        return JSONResponse({'detail': 'Not found'}, status_code=404)
+
+    data = await read_body(request, session.max_bytes)
+    if data is None:
+        return JSONResponse({'detail': 'Recording too large'}, status_code=413)
+
+    try:
+        session.add_chunk(recording_id, seq, data)
+    except LookupError as error:
+        return JSONResponse({'detail': str(error)}, status_code=409)
+    except OverflowError as error:
+        return JSONResponse({'detail': str(error)}, status_code=413)
+
+    if session.on_chunk is not None:
+        # Only the new chunk, joining the recording so far for every chunk is quadratic
+        background_tasks.create(session.on_chunk(recording_id, data, mime_type), name='audio_chunk')
+    return Response(status_code=204)
+
+
+@app.post('/audio/{token}/{recording_id}/finish')
+async def finish_audio_upload(token: str, recording_id: str, mime_type: str = 'audio/webm', duration: float = 0.0):
+    session = audio_sessions.get(token)
+    if session is None:
+        return JSONResponse({'detail': 'Not found'}, status_code=404)
+
+    try:
+        audio = session.finish(recording_id)
+    except LookupError as error:
+        return JSONResponse({'detail': str(error)}, status_code=409)
+
+    # The transcription updates the page by itself, the browser does not wait for it
+    background_tasks.create(session.on_audio(audio, mime_type, duration, recording_id), name='audio_upload')
+    return Response(status_code=202)
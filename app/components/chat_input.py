@@ -1,14 +1,17 @@
 import re
+import asyncio
 from typing import Literal, Union, List, Optional
 
 from nicegui import ui, app, run
 
 from state import State
+from langchain_core.messages import AIMessage, HumanMessage
 from langgraph.graph.graph import CompiledGraph
 
-from components.user_db import get_shop_information, User
+from components.user_db import User
 from utils.custom_css import slide_up_bounce, message_hover_animation, pulse_custom
 from components.chat_message import Message
+from components.answer_cache import answer_cache, get_answer_scope
 from state import State
 
 def is_japanese(text: str) -> bool:
@@ -87,18 +90,47 @@ class ChatInput(ui.row):
         }
 
         response = ''
-        
-        async for msg, metadata in self.client_state.graph.astream(inputs, stream_mode="messages", config=self.client_state.memory_config):
-            if (
-                msg.content 
-                and (metadata["langgraph_node"] == 'generate' or metadata["langgraph_node"] == 'query_or_respond')
-            ):
-                response += msg.content
-                with response_message.add_slot('default'):
-                    response_message.stored_text = response
-                    ui.markdown(response)
-                ui.run_javascript('window.scrollTo(0, document.body.scrollHeight)')
-
+        namespace = self.client_state.vector_db_namespace
+        answer_scope = get_answer_scope(self.client_state.shop_name, self.client_state.openai_chat_prompt)
+
+        # Only an opening question is context free, follow-ups depend on the conversation
+        cached_answer = None
+        if self.client_state.answered_turns == 0:
+            cached_answer = answer_cache.lookup(namespace, answer_scope, question)
+
+        if cached_answer:
+            # Stream the cached answer so it looks the same as a generated one
+            for index in range(0, len(cached_answer), 4):
+                response_message.stream_text(cached_answer[index:index + 4])
+                await asyncio.sleep(0.02)
+
+            # Keep the conversation history complete for the next turns
+            await self.client_state.graph.aupdate_state(
+                self.client_state.memory_config,
+                {"messages": [HumanMessage(question), AIMessage(cached_answer)]},
+                as_node="generate",
+            )
+        else:
+            answered_by = None
+            retrieved = False
+            async for msg, metadata in self.client_state.graph.astream(inputs, stream_mode="messages", config=self.client_state.memory_config):
+                # The tools node emits the ToolMessage of the retrieve call
+                if metadata["langgraph_node"] == 'tools':
+                    retrieved = True
+                if (
+                    msg.content 
+                    and (metadata["langgraph_node"] == 'generate' or metadata["langgraph_node"] == 'query_or_respond')
+                ):
+                    response += msg.content
+                    answered_by = metadata["langgraph_node"]
+                    response_message.stream_text(msg.content)
+
+            # Only answers grounded on the Q&A data are worth reusing, the respond route also ends in generate
+            if answered_by == 'generate' and retrieved and self.client_state.answered_turns == 0:
+                answer_cache.store(namespace, answer_scope, question, response)
+
+        response_message.finish_stream()
+        self.client_state.answered_turns += 1
         self.send_button.props(remove='disable loading')
 
 
@@ -121,7 +153,7 @@ class ChatInput(ui.row):
             self.input_question.update()
 
             # Star the js for recording
-            ui.run_javascript("startRecording()")
+            ui.run_javascript(f"startRecording('{self.client_state.audio_upload.upload_url}')")
         else:
             # Initialize
             self.client_state.toggle_recording_status()
@@ -137,7 +169,6 @@ class ChatInput(ui.row):
             # Enabled send button for safety
             self.send_button.props(remove='disable')
 
-            # Change input placeholder
-            self.input_question.set_value('')
+            # Change input placeholder, the partial transcript stays until the final one replaces it
             self.input_question._props['placeholder'] = '質問を入力してください！'
             self.input_question.update()
\ No newline at end of file
@@ -4,6 +4,7 @@ from typing import Literal, Union, List, Optional
 from nicegui import ui
 
 from components.openai_text_to_speech import text_to_speech
+from components.streaming_markdown import StreamingMarkdown
 from state import State
 
 class Message(ui.chat_message):
@@ -32,6 +33,7 @@ class Message(ui.chat_message):
         self.message_audio_path = message_audio_path
         self.message_audio_to_text = message_audio_to_text
         self.client_state = client_state
+        self.streaming_markdown: Optional[StreamingMarkdown] = None
 
         with self.add_slot('name'):
             with ui.row(align_items='center').classes('w-full').style('gap: 0rem'):
@@ -43,6 +45,28 @@ class Message(ui.chat_message):
                     self.tts_trigger_button = tts_trigger_button
 
 
+    def stream_text(self, delta: str) -> None:
+        """Append streamed text to the message, the first delta replaces the loading spinner."""
+        if self.streaming_markdown is None:
+            with self.add_slot('default'):
+                self.streaming_markdown = StreamingMarkdown()
+        self.stored_text += delta
+        self.streaming_markdown.append(delta)
+
+
+    def type_text(self, text: str, interval: float = 0.06) -> None:
+        """Show `text` with a typing animation played in the browser."""
+        with self.add_slot('default'):
+            self.streaming_markdown = StreamingMarkdown(content=text, typewriter_interval=interval)
+        self.stored_text = text
+
+
+    def finish_stream(self) -> None:
+        """Send the text still waiting for the next flush and render the whole message once."""
+        if self.streaming_markdown is not None:
+            self.streaming_markdown.finish()
+
+
     async def get_audio_from_text_file_path(self):
         self.tts_trigger_button.props(add='disable loading')
         if not self.message_audio_path:
@@ -0,0 +1,292 @@
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import MemorySaver
+
+
+def get_payload_size(value: Any) -> int:
+    """Approximate the memory held by a serialized checkpoint entry (its bytes/str leaves)."""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(get_payload_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(get_payload_size(item) for item in value.values())
+    return 0
+
+
+class BoundedCheckpointSaver(MemorySaver):
+    """
+    MemorySaver with a per-process memory budget.
+
+    The checkpoints, the pending writes and the channel values (`blobs`, where the
+    messages live) of a thread are counted, evicted and persisted together.
+
+    - Threads are kept in LRU order and evicted when the budget is exceeded
+      or when they have been idle longer than `idle_ttl_seconds`.
+    - Only the latest `max_checkpoints_per_thread` checkpoints of a thread are kept,
+      a chat only ever resumes from its newest one.
+    - When `sqlite_path` is given, changed threads are written behind to SQLite by a
+      background thread and evicted threads are reloaded from there on demand.
+      Without it, evicted conversations are simply forgotten.
+    """
+    def __init__(
+            self,
+            *,
+            memory_budget_bytes: int = 256 * 1024 * 1024,
+            idle_ttl_seconds: float = 60 * 60,
+            max_checkpoints_per_thread: int = 8,
+            sqlite_path: Optional[str] = None,
+            flush_interval_seconds: float = 5.0,
+        ) -> None:
+        super().__init__()
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+
+        # thread_id -> approximate bytes, ordered from least to most recently used
+        self.thread_sizes: "OrderedDict[str, int]" = OrderedDict()
+        self.last_access: Dict[str, float] = {}
+        self.thread_writes: Dict[str, Set[Tuple[str, str, str]]] = defaultdict(set)
+        self.thread_blobs: Dict[str, Set[Tuple[str, str, str, Any]]] = defaultdict(set)
+        self.total_size = 0
+
+        # Write-behind state, shared with the flusher thread
+        self.lock = threading.RLock()
+        self.db_lock = threading.Lock()
+        self.dirty: Set[str] = set()
+        self.pending: Dict[str, Optional[bytes]] = {}
+
+        self.connection: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self.connection = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "thread_id TEXT PRIMARY KEY, payload BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.connection.commit()
+
+            self.stop_event = threading.Event()
+            self.flush_interval_seconds = flush_interval_seconds
+            self.flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flusher", daemon=True)
+            self.flusher.start()
+
+    # -------------------------- Checkpointer interface -------------------------- #
+    def get_tuple(self, config: RunnableConfig):
+        thread_id = config["configurable"]["thread_id"]
+        with self.lock:
+            self._touch(thread_id)
+            checkpoint_tuple = super().get_tuple(config)
+            self._track_writes(checkpoint_tuple)
+            return checkpoint_tuple
+
+    def list(self, config: Optional[RunnableConfig], **kwargs):
+        # Threads that are evicted and not loaded are not listed when config is None
+        if config is not None:
+            with self.lock:
+                self._touch(config["configurable"]["thread_id"])
+        for checkpoint_tuple in super().list(config, **kwargs):
+            with self.lock:
+                self._track_writes(checkpoint_tuple)
+            yield checkpoint_tuple
+
+    def put(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.lock:
+            self._touch(thread_id)
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+
+            checkpoints = self.storage[thread_id][checkpoint_ns]
+            self._grow(thread_id, get_payload_size(checkpoints[checkpoint["id"]]))
+            for channel, version in new_versions.items():
+                key = (thread_id, checkpoint_ns, channel, version)
+                if key in self.blobs and key not in self.thread_blobs[thread_id]:
+                    self.thread_blobs[thread_id].add(key)
+                    self._grow(thread_id, get_payload_size(self.blobs[key]))
+            self._prune(thread_id, checkpoint_ns)
+            self.dirty.add(thread_id)
+            self._enforce_budget(keep=thread_id)
+
+        return next_config
+
+    def put_writes(self, config: RunnableConfig, writes, task_id: str, *args, **kwargs) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        key = (
+            thread_id,
+            config["configurable"].get("checkpoint_ns", ""),
+            config["configurable"]["checkpoint_id"],
+        )
+        with self.lock:
+            self._touch(thread_id)
+            size_before = get_payload_size(self.writes.get(key, {}))
+            super().put_writes(config, writes, task_id, *args, **kwargs)
+
+            self.thread_writes[thread_id].add(key)
+            self._grow(thread_id, get_payload_size(self.writes.get(key, {})) - size_before)
+            self.dirty.add(thread_id)
+            self._enforce_budget(keep=thread_id)
+
+    # -------------------------- Memory accounting -------------------------- #
+    def _track_writes(self, checkpoint_tuple) -> None:
+        # Reading a checkpoint creates an empty `writes` entry for it (defaultdict), evict it with the thread
+        if checkpoint_tuple is None:
+            return
+        configurable = checkpoint_tuple.config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"])
+        if key in self.writes and configurable["thread_id"] in self.thread_sizes:
+            self.thread_writes[configurable["thread_id"]].add(key)
+
+    def _touch(self, thread_id: str) -> None:
+        if thread_id not in self.thread_sizes:
+            self.thread_sizes[thread_id] = 0
+            self._load(thread_id)
+        self.thread_sizes.move_to_end(thread_id)
+        self.last_access[thread_id] = time.monotonic()
+
+    def _grow(self, thread_id: str, size: int) -> None:
+        self.thread_sizes[thread_id] += size
+        self.total_size += size
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        # Checkpoint ids are inserted in creation order, the oldest come first
+        while len(checkpoints) > self.max_checkpoints_per_thread:
+            checkpoint_id = next(iter(checkpoints))
+            self._grow(thread_id, -get_payload_size(checkpoints.pop(checkpoint_id)))
+
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            if key in self.writes:
+                self._grow(thread_id, -get_payload_size(self.writes.pop(key)))
+            self.thread_writes[thread_id].discard(key)
+
+        # Channel values no remaining checkpoint points to
+        live_blobs = {
+            (thread_id, checkpoint_ns, channel, version)
+            for saved_checkpoint, _, _ in checkpoints.values()
+            for channel, version in self.serde.loads_typed(saved_checkpoint)["channel_versions"].items()
+        }
+        for key in [key for key in self.thread_blobs[thread_id] if key[1] == checkpoint_ns and key not in live_blobs]:
+            self.thread_blobs[thread_id].discard(key)
+            if key in self.blobs:
+                self._grow(thread_id, -get_payload_size(self.blobs.pop(key)))
+
+    def _enforce_budget(self, keep: str) -> None:
+        # LRU order is also last-access order, so idle threads sit at the front
+        now = time.monotonic()
+        while self.thread_sizes:
+            thread_id = next(iter(self.thread_sizes))
+            if thread_id == keep or now - self.last_access[thread_id] <= self.idle_ttl_seconds:
+                break
+            self._evict(thread_id)
+
+        while self.total_size > self.memory_budget_bytes:
+            thread_id = next(iter(self.thread_sizes))
+            if thread_id == keep:
+                break
+            self._evict(thread_id)
+
+    def _evict(self, thread_id: str) -> None:
+        if self.connection is not None and thread_id in self.dirty:
+            self.pending[thread_id] = self._dump(thread_id)
+        self.dirty.discard(thread_id)
+
+        self.storage.pop(thread_id, None)
+        for key in self.thread_writes.pop(thread_id, set()):
+            self.writes.pop(key, None)
+        for key in self.thread_blobs.pop(thread_id, set()):
+            self.blobs.pop(key, None)
+
+        self.total_size -= self.thread_sizes.pop(thread_id)
+        self.last_access.pop(thread_id, None)
+
+    # -------------------------- Persistence -------------------------- #
+    def _dump(self, thread_id: str) -> Optional[bytes]:
+        checkpoints = {
+            checkpoint_ns: dict(entries)
+            for checkpoint_ns, entries in self.storage.get(thread_id, {}).items()
+            if entries
+        }
+        if not checkpoints:
+            return None
+
+        writes = {key: dict(self.writes[key]) for key in self.thread_writes.get(thread_id, ()) if key in self.writes}
+        blobs = {key: self.blobs[key] for key in self.thread_blobs.get(thread_id, ()) if key in self.blobs}
+        return pickle.dumps((checkpoints, writes, blobs), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _load(self, thread_id: str) -> None:
+        if self.connection is None:
+            return
+
+        if thread_id in self.pending:
+            # The memory copy becomes the source of truth again
+            payload = self.pending.pop(thread_id)
+            self.dirty.add(thread_id)
+        else:
+            with self.db_lock:
+                row = self.connection.execute(
+                    "SELECT payload FROM checkpoints WHERE thread_id = ?", (thread_id,)
+                ).fetchone()
+            payload = row[0] if row else None
+
+        if payload is None:
+            return
+
+        checkpoints, writes, *rest = pickle.loads(payload)
+        # Rows written before channel values were persisted have no blobs
+        blobs = rest[0] if rest else {}
+        for checkpoint_ns, entries in checkpoints.items():
+            self.storage[thread_id][checkpoint_ns].update(entries)
+        for key, value in writes.items():
+            self.writes[key] = value
+            self.thread_writes[thread_id].add(key)
+        for key, value in blobs.items():
+            self.blobs[key] = value
+            self.thread_blobs[thread_id].add(key)
+
+        self._grow(thread_id, get_payload_size(checkpoints) + get_payload_size(writes) + get_payload_size(blobs))
+
+    def flush(self) -> None:
+        """Write every changed or evicted thread to SQLite."""
+        if self.connection is None:
+            return
+
+        with self.lock:
+            payloads = dict(self.pending)
+            for thread_id in self.dirty:
+                payloads[thread_id] = self._dump(thread_id)
+            self.dirty.clear()
+
+        now = time.time()
+        rows = [(thread_id, payload, now) for thread_id, payload in payloads.items() if payload is not None]
+        if rows:
+            with self.db_lock:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, payload, updated_at) VALUES (?, ?, ?)",
+                    rows,
+                )
+                self.connection.commit()
+
+        with self.lock:
+            for thread_id, payload in payloads.items():
+                # Keep entries that were evicted again while we were writing
+                if thread_id in self.pending and self.pending[thread_id] is payload:
+                    self.pending.pop(thread_id)
+
+    def _flush_loop(self) -> None:
+        while not self.stop_event.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        self.stop_event.set()
+        self.flush()
+        with self.db_lock:
+            self.connection.close()
+        self.connection = None
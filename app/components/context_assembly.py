@@ -0,0 +1,97 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import List, Set, Tuple
+
+from langchain.docstore.document import Document
+
+from components.conversation_window import token_counter
+from components.keyword_index import get_char_ngrams
+
+logger = logging.getLogger(__name__)
+
+# Default number of tokens of retrieved Q&A pasted into the system prompt per turn
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+
+# Metadata that helps the model answer, dates and bot type only cost tokens
+USEFUL_METADATA_FIELDS: Tuple[str, ...] = ('service',)
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    documents: List[Document]
+    tokens: int
+    saved_tokens: int
+
+
+def get_shingles(text: str) -> Set[str]:
+    return set(get_char_ngrams(text, ngram_sizes=(3,)))
+
+
+def format_document(document: Document) -> str:
+    labels = [
+        str(document.metadata[field])
+        for field in USEFUL_METADATA_FIELDS
+        if document.metadata.get(field)
+    ]
+    prefix = "".join(f"[{label}]" for label in labels)
+    return f"{prefix} {document.page_content}" if prefix else document.page_content
+
+
+def assemble_context(
+        scored_documents: List[Tuple[Document, float]],
+        token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+        duplicate_threshold: float = 0.8,
+    ) -> AssembledContext:
+    """
+    Build the retrieved context of one turn from `(document, score)` pairs.
+
+    Documents are taken by descending score, so the token budget always cuts the worst
+    ones. Near-duplicate chunks (Jaccard similarity of character trigrams above
+    `duplicate_threshold`) are dropped, only useful metadata is kept and documents stop
+    being added once `token_budget` is reached. The best document is always kept.
+    """
+    # Stable, documents with the same score keep their order
+    documents = [document for document, _ in sorted(scored_documents, key=lambda item: item[1], reverse=True)]
+
+    # What the retrieve tool used to send, to report the saving
+    naive_text = "\n\n".join(
+        f"Source: {document.metadata}\nContent: {document.page_content}"
+        for document in documents
+    )
+    naive_tokens = token_counter.count_text(naive_text)
+
+    kept_documents: List[Document] = []
+    kept_shingles: List[Set[str]] = []
+    parts: List[str] = []
+    tokens = 0
+    for document in documents:
+        shingles = get_shingles(document.page_content)
+        if any(
+            len(shingles & other) / (len(shingles | other) or 1) >= duplicate_threshold
+            for other in kept_shingles
+        ):
+            continue
+
+        part = format_document(document)
+        part_tokens = token_counter.count_text(part)
+        if kept_documents and tokens + part_tokens > token_budget:
+            break
+
+        kept_documents.append(document)
+        kept_shingles.append(shingles)
+        parts.append(part)
+        tokens += part_tokens
+
+    context = AssembledContext(
+        text="\n\n".join(parts),
+        documents=kept_documents,
+        tokens=tokens,
+        saved_tokens=max(naive_tokens - tokens, 0),
+    )
+    logger.info(
+        "Context assembled: %d/%d documents, %d tokens, %d tokens saved",
+        len(kept_documents), len(documents), context.tokens, context.saved_tokens,
+    )
+    return context
@@ -0,0 +1,106 @@
+import os
+from collections import OrderedDict
+from typing import List
+
+import tiktoken
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langgraph.constants import TAG_NOSTREAM
+
+# Default number of history tokens sent per turn when the shop has no own budget
+DEFAULT_CHAT_TOKEN_BUDGET = int(os.getenv('CHAT_TOKEN_BUDGET', '2000'))
+
+# Fixed cost of the role and separators of one chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+summary_instruction = """
+You maintain a running summary of a customer support chat between a customer and a shop's assistant.
+Merge the new messages into the current summary. Keep every fact the customer gave
+(car model, dates, names, requests) and every answer already promised by the assistant.
+Write the summary in Japanese and keep it under 400 characters.
+"""
+
+
+class TokenCounter:
+    """
+    Count tokens of chat messages, remembering the result per message id.
+    The encoding is loaded on first use, tiktoken downloads its BPE file the first time.
+    """
+    def __init__(self, model: str = "gpt-4o-mini", max_entries: int = 100_000) -> None:
+        self.model = model
+        self._encoding = None
+        self.max_entries = max_entries
+        self.cache: "OrderedDict[str, int]" = OrderedDict()
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        if self._encoding is None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+        return self._encoding
+
+    def count_text(self, text: str) -> int:
+        return len(self.encoding.encode(text)) if text else 0
+
+    def count(self, message: BaseMessage) -> int:
+        if message.id and message.id in self.cache:
+            return self.cache[message.id]
+
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        tokens = self.count_text(content) + MESSAGE_OVERHEAD_TOKENS
+
+        if message.id:
+            self.cache[message.id] = tokens
+            if len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return tokens
+
+
+token_counter = TokenCounter()
+
+
+def count_messages_to_fold(
+        messages: List[BaseMessage],
+        token_budget: int,
+        reserved_tokens: int = 0,
+        keep_ratio: float = 0.5,
+    ) -> int:
+    """
+    Return how many of the oldest `messages` have to be folded into the summary.
+
+    Nothing is folded while the messages fit in `token_budget`. Once they overflow,
+    only the newest messages filling `keep_ratio` of the budget are kept, so the summary
+    is refreshed every few turns instead of on every turn. The newest message is always kept.
+    """
+    sizes = [token_counter.count(message) for message in messages]
+    if reserved_tokens + sum(sizes) <= token_budget:
+        return 0
+
+    kept_tokens = reserved_tokens
+    index = len(messages)
+    for size in reversed(sizes):
+        if index < len(messages) and kept_tokens + size > token_budget * keep_ratio:
+            break
+        kept_tokens += size
+        index -= 1
+
+    return index
+
+
+async def summarize_messages(llm: BaseChatModel, summary: str, messages: List[BaseMessage]) -> str:
+    """Fold `messages` into the existing `summary` with one LLM call."""
+    transcript = "\n".join(
+        f"{'Customer' if message.type == 'human' else 'Assistant'}: {message.content}"
+        for message in messages
+        if message.type != "system"
+    )
+    prompt = [
+        SystemMessage(summary_instruction),
+        HumanMessage(f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"),
+    ]
+
+    # Keep the summary out of the tokens streamed to the chat window
+    response = await llm.ainvoke(prompt, config={"tags": [TAG_NOSTREAM]})
+    return response.content
@@ -0,0 +1,184 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from components.text_embedding import normalize_text
+from components.vector_db import acollect_vector_data, add_namespace_listener
+
+logger = logging.getLogger(__name__)
+
+# First wait before rebuilding an index whose build failed, doubled after each failure
+KEYWORD_INDEX_RETRY_SECONDS = float(os.getenv('KEYWORD_INDEX_RETRY_SECONDS', '30'))
+KEYWORD_INDEX_MAX_RETRY_SECONDS = 600
+
+
+def get_char_ngrams(text: str, ngram_sizes: Tuple[int, ...] = (2, 3)) -> List[str]:
+    """Character bigrams and trigrams, Japanese text has no spaces to split words on."""
+    text = normalize_text(text)
+    return [
+        text[start:start + n]
+        for n in ngram_sizes
+        for start in range(len(text) - n + 1)
+        if " " not in text[start:start + n]
+    ]
+
+
+class KeywordIndex:
+    """BM25 inverted index over character n-grams of one namespace."""
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.documents: Dict[str, Document] = {}
+        self.term_freqs: Dict[str, Counter] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.total_length = 0
+
+    def add(self, doc_id: str, document: Document) -> None:
+        self.remove(doc_id)
+
+        term_freqs = Counter(get_char_ngrams(document.page_content))
+        self.documents[doc_id] = document
+        self.term_freqs[doc_id] = term_freqs
+        self.doc_lengths[doc_id] = sum(term_freqs.values())
+        self.total_length += self.doc_lengths[doc_id]
+        for term, freq in term_freqs.items():
+            self.postings[term][doc_id] = freq
+
+    def remove(self, doc_id: str) -> None:
+        term_freqs = self.term_freqs.pop(doc_id, None)
+        if term_freqs is None:
+            return
+
+        self.documents.pop(doc_id)
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in term_freqs:
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Document, float]]:
+        document_count = len(self.documents)
+        if not document_count:
+            return []
+
+        average_length = self.total_length / document_count
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(get_char_ngrams(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[doc_id], score) for doc_id, score in best]
+
+
+def reciprocal_rank_fusion(
+        result_lists: List[List[Document]],
+        k: int = 10,
+        rank_constant: int = 60,
+    ) -> List[Tuple[Document, float]]:
+    """Merge ranked lists with RRF, the same Q&A found by both searches counts once. Best fused score first."""
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document.page_content
+            scores[key] += 1 / (rank_constant + rank + 1)
+            documents.setdefault(key, document)
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(documents[key], score) for key, score in best]
+
+
+class KeywordIndexRegistry:
+    """
+    One KeywordIndex per namespace, built in the background from `acollect_vector_data`
+    the first time the namespace is searched and then kept in sync with admin edits.
+    """
+    def __init__(self) -> None:
+        self.indexes: Dict[str, KeywordIndex] = {}
+        self.building: Dict[str, asyncio.Task] = {}
+        # Changes received while an index is being built, replayed once it is ready
+        self.pending_changes: Dict[str, List[Tuple[Dict[str, Document], List[str]]]] = defaultdict(list)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Failed builds in a row and when the next one may start, per namespace
+        self.failures: Dict[str, Tuple[int, float]] = {}
+
+    def get(self, namespace: str) -> Optional[KeywordIndex]:
+        """Return the index of a namespace, or None while it is still being built or cooling down."""
+        index = self.indexes.get(namespace)
+        if index is None and namespace not in self.building:
+            failure_count, retry_at = self.failures.get(namespace, (0, 0.0))
+            if time.monotonic() < retry_at:
+                return None
+            self.loop = asyncio.get_running_loop()
+            task = asyncio.create_task(self.build(namespace))
+            task.add_done_callback(lambda task: self.on_build_done(namespace, failure_count, task))
+            self.building[namespace] = task
+        return index
+
+    def on_build_done(self, namespace: str, failure_count: int, task: asyncio.Task) -> None:
+        # Cleared here rather than in build, so no search starts another build before the failure is recorded
+        self.building.pop(namespace, None)
+        self.pending_changes.pop(namespace, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            self.failures.pop(namespace, None)
+            return
+
+        # Searches keep using the vector results alone until the next try
+        delay = min(KEYWORD_INDEX_RETRY_SECONDS * 2 ** failure_count, KEYWORD_INDEX_MAX_RETRY_SECONDS)
+        self.failures[namespace] = (failure_count + 1, time.monotonic() + delay)
+        logger.error('Building the keyword index of %s failed, retrying in %.0f s', namespace, delay, exc_info=error)
+
+    async def build(self, namespace: str) -> None:
+        df_namespace_data = await acollect_vector_data(namespace)
+
+        index = KeywordIndex()
+        for row in df_namespace_data.to_dict('records'):
+            metadata = {key: value for key, value in row.items() if key not in ('vector_id', 'text')}
+            index.add(row['vector_id'], Document(page_content=row.get('text') or '', metadata=metadata))
+
+        for added, removed_ids in self.pending_changes.pop(namespace, []):
+            self.apply_change(index, added, removed_ids)
+        self.indexes[namespace] = index
+
+    @staticmethod
+    def apply_change(index: KeywordIndex, added: Dict[str, Document], removed_ids: List[str]) -> None:
+        for doc_id in removed_ids:
+            index.remove(doc_id)
+        for doc_id, document in added.items():
+            index.add(doc_id, document)
+
+    def on_namespace_change(self, namespace: str, added: Dict[str, Document], removed_ids: List[str]) -> None:
+        # Admin edits run in a worker thread, the index is only touched from the event loop
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._on_namespace_change, namespace, added, removed_ids)
+        else:
+            self._on_namespace_change(namespace, added, removed_ids)
+
+    def _on_namespace_change(self, namespace: str, added: Dict[str, Document], removed_ids: List[str]) -> None:
+        if namespace in self.indexes:
+            self.apply_change(self.indexes[namespace], added, removed_ids)
+        elif namespace in self.building:
+            self.pending_changes[namespace].append((added, removed_ids))
+
+
+keyword_indexes = KeywordIndexRegistry()
+
+add_namespace_listener(keyword_indexes.on_namespace_change)
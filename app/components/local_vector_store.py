@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import uuid
+import threading
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from nicegui import run
+from upstash_vector.types import Data
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain.docstore.document import Document
+
+from components.text_embedding import default_embeddings
+from components.vector_db import VectorBackend
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Equality filter on metadata, a list value matches any of its items."""
+    for key, expected in (filter or {}).items():
+        value = metadata.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class LocalCollection:
+    """
+    Vectors and rows of one namespace searched by brute force.
+
+    The unit-normalized float32 matrix makes a search one matrix-vector product. With a
+    directory the collection is saved as vectors.npy plus a rows.json sidecar after
+    every change, otherwise it only lives in memory.
+    """
+    def __init__(self, embeddings: Embeddings, directory: Optional[str] = None) -> None:
+        self.embeddings = embeddings
+        self.directory = directory
+        self.ids: List[str] = []
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.lock = threading.Lock()
+
+        if directory is not None:
+            self.load()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, 'vectors.npy')
+
+    @property
+    def rows_path(self) -> str:
+        return os.path.join(self.directory, 'rows.json')
+
+    def load(self) -> None:
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.rows_path)):
+            return
+
+        with open(self.rows_path, encoding='utf-8') as f:
+            rows = json.load(f)
+        self.ids = [row['id'] for row in rows]
+        self.rows = {row['id']: {'text': row['text'], 'metadata': row['metadata']} for row in rows}
+        self.matrix = np.load(self.vectors_path)
+
+    def save(self) -> None:
+        if self.directory is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        rows = [{'id': vector_id, **self.rows[vector_id]} for vector_id in self.ids]
+        np.save(self.vectors_path + '.tmp.npy', self.matrix)
+        with open(self.rows_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False)
+        os.replace(self.vectors_path + '.tmp.npy', self.vectors_path)
+        os.replace(self.rows_path + '.tmp', self.rows_path)
+
+    def upsert(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        if not ids:
+            return
+
+        # Embedding is the slow part, done before taking the lock
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            if not len(self.ids):
+                self.matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+
+            new_rows = []
+            for vector_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                self.rows[vector_id] = {'text': text, 'metadata': dict(metadata)}
+                if vector_id in positions:
+                    self.matrix[positions[vector_id]] = vector
+                else:
+                    positions[vector_id] = len(self.ids)
+                    self.ids.append(vector_id)
+                    new_rows.append(vector)
+
+            if new_rows:
+                self.matrix = np.vstack([self.matrix, np.asarray(new_rows, dtype=np.float32)])
+            self.save()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        with self.lock:
+            removed = set(ids) & self.rows.keys()
+            if not removed:
+                return 0
+
+            keep = np.array([vector_id not in removed for vector_id in self.ids], dtype=bool)
+            self.matrix = self.matrix[keep]
+            self.ids = [vector_id for vector_id in self.ids if vector_id not in removed]
+            for vector_id in removed:
+                del self.rows[vector_id]
+            self.save()
+            return len(removed)
+
+    def get_rows(self, ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Rows in the shape the admin grid uses: metadata plus `text` and `vector_id`."""
+        with self.lock:
+            ids = self.ids if ids is None else [vector_id for vector_id in ids if vector_id in self.rows]
+            return [
+                {**self.rows[vector_id]['metadata'], 'text': self.rows[vector_id]['text'], 'vector_id': vector_id}
+                for vector_id in ids
+            ]
+
+    def search(
+            self,
+            query_vector: np.ndarray,
+            k: int,
+            filter: Optional[Dict[str, Any]] = None,
+        ) -> List[Tuple[Document, float]]:
+        with self.lock:
+            if not len(self.ids):
+                return []
+
+            scores = self.matrix @ (query_vector / (np.linalg.norm(query_vector) or 1))
+            if filter:
+                allowed = np.array([matches_filter(self.rows[vector_id]['metadata'], filter) for vector_id in self.ids])
+                scores = np.where(allowed, scores, -np.inf)
+                k = min(k, int(allowed.sum()))
+            k = min(k, len(scores))
+            if k <= 0:
+                return []
+
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (Document(page_content=self.rows[self.ids[i]]['text'], metadata=dict(self.rows[self.ids[i]]['metadata'])), float(scores[i]))
+                for i in top
+            ]
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain vector store over a LocalCollection, `filter` is an equality match on metadata."""
+    def __init__(self, collection: LocalCollection) -> None:
+        self.collection = collection
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.collection.embeddings
+
+    def add_texts(
+            self,
+            texts: Iterable[str],
+            metadatas: Optional[List[dict]] = None,
+            ids: Optional[List[str]] = None,
+            **kwargs: Any,
+        ) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        self.collection.upsert(ids, texts, metadatas or [{} for _ in texts])
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        return self.collection.delete(ids or []) == len(ids or [])
+
+    def similarity_search_with_score(
+            self,
+            query: str,
+            k: int = 4,
+            filter: Optional[Dict[str, Any]] = None,
+            **kwargs: Any,
+        ) -> List[Tuple[Document, float]]:
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return self.collection.search(query_vector, k, filter)
+
+    def similarity_search(
+            self,
+            query: str,
+            k: int = 4,
+            filter: Optional[Dict[str, Any]] = None,
+            **kwargs: Any,
+        ) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter)]
+
+    @classmethod
+    def from_texts(
+            cls,
+            texts: List[str],
+            embedding: Embeddings,
+            metadatas: Optional[List[dict]] = None,
+            **kwargs: Any,
+        ) -> 'LocalVectorStore':
+        store = cls(LocalCollection(embedding))
+        store.add_texts(texts, metadatas, ids=kwargs.get('ids'))
+        return store
+
+
+class LocalBackend(VectorBackend):
+    """In-process backend, one LocalCollection per namespace (saved under `directory` when given)."""
+    def __init__(self, embeddings: Embeddings, directory: Optional[str] = None, name: str = 'local') -> None:
+        self.name = name
+        self.embeddings = embeddings
+        self.directory = directory
+        self.collections: Dict[str, LocalCollection] = {}
+        self.lock = threading.Lock()
+
+    def get_collection(self, namespace: str) -> LocalCollection:
+        with self.lock:
+            if namespace not in self.collections:
+                directory = None
+                if self.directory is not None:
+                    safe_name = re.sub(r'[^0-9A-Za-z_.-]', '_', namespace) or '_default'
+                    directory = os.path.join(self.directory, safe_name)
+                self.collections[namespace] = LocalCollection(self.embeddings, directory)
+            return self.collections[namespace]
+
+    def get_vector_store(self, namespace: str) -> LocalVectorStore:
+        return LocalVectorStore(self.get_collection(namespace))
+
+    def get_vector_data(self, namespace: str) -> pd.DataFrame:
+        return pd.DataFrame(self.get_collection(namespace).get_rows())
+
+    def get_specific_vector_data(self, namespace: str, list_id: List[str]) -> pd.DataFrame:
+        return pd.DataFrame(self.get_collection(namespace).get_rows(list_id))
+
+    def remove_vectors(self, namespace: str, vector_ids: List[str]) -> bool:
+        return self.get_collection(namespace).delete(vector_ids) == len(vector_ids)
+
+    async def aiter_vector_data(self, namespace: str, page_size: int = 1000, **kwargs) -> AsyncIterator[List[dict]]:
+        rows = await run.io_bound(self.get_collection(namespace).get_rows)
+        for start in range(0, len(rows), page_size):
+            yield rows[start:start + page_size]
+
+    async def aupsert_vector_data(self, namespace: str, vectors: List[Data]) -> None:
+        metadatas = [
+            {key: value for key, value in (vector.metadata or {}).items() if key != 'text'}
+            for vector in vectors
+        ]
+        await run.io_bound(
+            self.get_collection(namespace).upsert,
+            [vector.id for vector in vectors],
+            [vector.data for vector in vectors],
+            metadatas,
+        )
+
+
+def get_local_embeddings() -> Embeddings:
+    """OpenAI embeddings when LOCAL_VECTOR_DB_EMBEDDING_MODEL is set, the local n-gram embedding otherwise."""
+    model = os.getenv('LOCAL_VECTOR_DB_EMBEDDING_MODEL')
+    if not model:
+        return default_embeddings
+
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=model)
@@ -0,0 +1,157 @@
+import os
+import zlib
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from components.text_embedding import normalize_text, default_embeddings
+
+# Estimated Jaccard similarity of character trigrams above which two Q&A are duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.7'))
+
+
+class MinHasher:
+    """
+    MinHash signatures of the character trigrams of many texts at once.
+
+    Trigrams are packed from code points with numpy instead of being built as strings, and
+    repeated trigrams need no deduplication since they do not change a minimum.
+    """
+    def __init__(self, num_perm: int = 64, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: the high 32 bits of a*x+b mod 2^64
+        self.a = rng.integers(1, 2**64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**64, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def get_shingles(self, texts: List[str]):
+        """Trigram codes of all texts and the index of the text each one belongs to."""
+        texts = [normalize_text(text) for text in texts]
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        # Code points are below 2^21, three of them fit in a uint64
+        codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        char_docs = np.repeat(np.arange(len(texts)), lengths)
+
+        valid = (
+            (char_docs[:-2] == char_docs[2:])
+            & (codes[:-2] != 32) & (codes[1:-1] != 32) & (codes[2:] != 32)
+        ) if len(codes) > 2 else np.zeros(0, dtype=bool)
+        trigrams = (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+        shingles, shingle_docs = trigrams[valid], char_docs[:-2][valid]
+
+        # Texts too short for a trigram are represented by their whole text
+        missing = np.setdiff1d(np.arange(len(texts)), shingle_docs)
+        if len(missing):
+            whole = np.array([zlib.crc32(texts[i].encode('utf-8')) | (1 << 63) for i in missing], dtype=np.uint64)
+            shingles = np.concatenate([shingles, whole])
+            shingle_docs = np.concatenate([shingle_docs, missing])
+            order = np.argsort(shingle_docs, kind='stable')
+            shingles, shingle_docs = shingles[order], shingle_docs[order]
+        return shingles, shingle_docs
+
+    def signatures(self, texts: List[str], chunk_size: int = 8192) -> np.ndarray:
+        signatures = np.full((len(texts), self.num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+        if not texts:
+            return signatures
+
+        all_hashes, doc_index = self.get_shingles(texts)
+        for start in range(0, len(all_hashes), chunk_size):
+            chunk_docs = doc_index[start:start + chunk_size]
+            # One row per permutation keeps the reduction below on contiguous memory
+            with np.errstate(over='ignore'):
+                permuted = (self.a[:, None] * all_hashes[start:start + chunk_size] + self.b[:, None]) >> np.uint64(32)
+            # Shingles of a text are contiguous, reduce them per text
+            starts = np.flatnonzero(np.r_[True, chunk_docs[1:] != chunk_docs[:-1]])
+            docs = chunk_docs[starts]
+            signatures[docs] = np.minimum(signatures[docs], np.minimum.reduceat(permuted, starts, axis=1).T)
+        return signatures
+
+
+def find_parent(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_signatures(
+        signatures: np.ndarray,
+        groups: np.ndarray,
+        threshold: float,
+        bands: int = 16,
+        texts: Optional[List[str]] = None,
+        confirm_threshold: Optional[float] = None,
+    ) -> np.ndarray:
+    """
+    Cluster labels from LSH banding over the signatures, only texts of the same group are compared.
+
+    Each band buckets the texts by (group, band values). Members of a bucket are compared
+    with the first member only, keeping the work linear even for very large buckets. A
+    candidate pair is kept when the fraction of equal signature values reaches `threshold`,
+    and, with `confirm_threshold`, when the cosine similarity of the local embedding does too.
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    parent = np.arange(n)
+
+    for band in range(bands):
+        keys = np.column_stack([groups.astype(np.uint64), signatures[:, band * rows:(band + 1) * rows]])
+        keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+        _, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+
+        order = np.argsort(inverse, kind='stable')
+        starts = np.flatnonzero(np.r_[True, inverse[order][1:] != inverse[order][:-1]])
+        representative = order[starts][inverse]
+
+        candidates = np.flatnonzero(representative != np.arange(n))
+        if not len(candidates):
+            continue
+        similarity = (signatures[candidates] == signatures[representative[candidates]]).mean(axis=1)
+        for i, j in zip(candidates[similarity >= threshold], representative[candidates[similarity >= threshold]]):
+            root_i, root_j = find_parent(parent, i), find_parent(parent, j)
+            if root_i == root_j:
+                continue
+            if confirm_threshold is not None and texts is not None:
+                if float(default_embeddings.embed_text(texts[i]) @ default_embeddings.embed_text(texts[j])) < confirm_threshold:
+                    continue
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return np.array([find_parent(parent, i) for i in range(n)])
+
+
+def find_near_duplicates(
+        df_vectors: pd.DataFrame,
+        threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        confirm_threshold: Optional[float] = None,
+    ) -> pd.DataFrame:
+    """
+    Near-duplicate Q&A of each namespace in `df_vectors` (columns vector_db_namespace, vector_id, text).
+
+    Returns the rows belonging to a cluster of two or more, with `duplicate_group` and
+    `keep`, which marks the most recently added row of each cluster.
+    """
+    df = df_vectors.dropna(subset=['text'])
+    df = df[df['text'].astype(str).str.strip() != '']
+    df = df.drop_duplicates(subset=['vector_db_namespace', 'vector_id']).reset_index(drop=True)
+    if df.empty:
+        return df.assign(duplicate_group=pd.Series(dtype=int), keep=pd.Series(dtype=bool))
+
+    texts = df['text'].astype(str).tolist()
+    signatures = MinHasher().signatures(texts)
+    groups = pd.factorize(df['vector_db_namespace'])[0]
+    labels = cluster_signatures(signatures, groups, threshold, texts=texts, confirm_threshold=confirm_threshold)
+
+    df['duplicate_group'] = labels
+    df = df[df.groupby('duplicate_group')['duplicate_group'].transform('size') > 1].copy()
+    if df.empty:
+        return df.assign(keep=pd.Series(dtype=bool))
+
+    added_at = df.get('added_date', pd.Series('', index=df.index)).fillna('').astype(str) + ' ' + df.get('added_time', pd.Series('', index=df.index)).fillna('').astype(str)
+    df['keep'] = False
+    df.loc[added_at.groupby(df['duplicate_group']).idxmax(), 'keep'] = True
+
+    # Number the clusters 1, 2, ... for display
+    df['duplicate_group'] = pd.factorize(df['duplicate_group'], sort=True)[0] + 1
+    return df.sort_values(['duplicate_group', 'keep'], ascending=[True, False]).reset_index(drop=True)
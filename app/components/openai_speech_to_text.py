@@ -1,45 +1,161 @@
+import os
+import re
+import logging
 from io import BytesIO
-from openai import OpenAI
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
 
-client = OpenAI()
+from openai import AsyncOpenAI
 
-def transcribe_file(audio_file: BytesIO) -> str:
+logger = logging.getLogger(__name__)
+
+client = AsyncOpenAI()
+
+# When the gpt-4o-mini correction runs: always, or auto to skip it for transcripts that look clean
+CORRECTION_POLICIES = ('always', 'auto')
+# Every transcript is corrected, as before the heuristic existed; shops opt in to auto
+# with their stt_correction_policy column
+STT_CORRECTION_POLICY = os.getenv('STT_CORRECTION_POLICY', 'always')
+if STT_CORRECTION_POLICY not in CORRECTION_POLICIES:
+    raise ValueError(f"STT_CORRECTION_POLICY must be one of {', '.join(CORRECTION_POLICIES)}, got {STT_CORRECTION_POLICY!r}")
+
+# Whisper loops on a phrase or invents outros on silence, the correction cleans those up
+WHISPER_HALLUCINATIONS = ('ご視聴ありがとうございました', 'チャンネル登録', 'お疲れ様でした', '字幕')
+FILLERS = ('えーと', 'えっと', 'えー', 'あのー', 'あの、', 'うーん', 'まあ、')
+# Katakana and latin words, where product and brand names get misheard
+NAME_PATTERN = re.compile(r'[ァ-ヺー]{2,}|[A-Za-zＡ-Ｚａ-ｚ][A-Za-zＡ-Ｚａ-ｚ0-9０-９.\-]*')
+REPEATED_PATTERN = re.compile(r'(.{2,}?)\1{2,}')
+
+
+class CorrectionCache:
+    """LRU cache of corrected transcripts keyed by (shop speech prompt, transcript)."""
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+    def get(self, openai_speech_prompt: str, transcription_text: str) -> Optional[str]:
+        key = (openai_speech_prompt, transcription_text)
+        corrected_text = self.entries.get(key)
+        if corrected_text is not None:
+            self.entries.move_to_end(key)
+        return corrected_text
+
+    def store(self, openai_speech_prompt: str, transcription_text: str, corrected_text: str) -> None:
+        self.entries[(openai_speech_prompt, transcription_text)] = corrected_text
+        self.entries.move_to_end((openai_speech_prompt, transcription_text))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+correction_cache = CorrectionCache(max_entries=int(os.getenv('STT_CORRECTION_CACHE_SIZE', '256')))
+
+
+async def transcribe_file(audio_file: BytesIO, prompt: str = '') -> str:
     """
     Converts speech to text using Whisper (ja = Japanese).
+    `prompt` carries the text of the previous segments when a recording is transcribed in parts.
     """
-    transcription = client.audio.transcriptions.create(
+    transcription = await client.audio.transcriptions.create(
         model="whisper-1",
         file=audio_file,
         language="ja",
+        prompt=prompt,
     )
     return transcription.text
 
-def generate_corrected_transcript(audio_file: BytesIO, openai_speech_prompt : str) -> str:
+def get_correction_policy(policy: Optional[str]) -> str:
+    """The shop's correction policy, STT_CORRECTION_POLICY when it has none."""
+    if policy and policy not in CORRECTION_POLICIES:
+        # A typo in one shop's row must not change how its transcripts are corrected
+        logger.error("Unknown transcript correction policy %r, using %r", policy, STT_CORRECTION_POLICY)
+        policy = None
+    return policy or STT_CORRECTION_POLICY
+
+def needs_correction(transcription_text: str, openai_speech_prompt: Optional[str], policy: Optional[str] = None) -> bool:
+    """
+    Whether the correction runs for a transcript under the shop's `policy`. With auto, a cheap
+    local check skips it for transcripts without fillers, repeated phrases or Whisper's typical
+    hallucinations whose katakana and latin words all appear in the shop's speech prompt as they are.
+    """
+    if not transcription_text.strip() or not openai_speech_prompt:
+        return False
+    if get_correction_policy(policy) == 'always':
+        return True
+
+    if any(phrase in transcription_text for phrase in WHISPER_HALLUCINATIONS + FILLERS):
+        return True
+    if REPEATED_PATTERN.search(transcription_text):
+        return True
+    return any(name not in openai_speech_prompt for name in NAME_PATTERN.findall(transcription_text))
+
+async def correct_transcript(
+    transcription_text: str,
+    openai_speech_prompt: Optional[str],
+    on_delta: Optional[Callable[[str], None]] = None,
+    policy: Optional[str] = None,
+) -> str:
+    """
+    Pass the transcription to ChatGPT with the system prompt,
+    and get back the corrected text.
+    With `on_delta`, the answer is streamed and `on_delta` gets the text received so far.
+    `policy` is the shop's correction policy, see needs_correction.
+    """
+    transcription_text = transcription_text.strip()
+    if not needs_correction(transcription_text, openai_speech_prompt, policy):
+        return transcription_text
+
+    corrected_text = correction_cache.get(openai_speech_prompt, transcription_text)
+    if corrected_text is not None:
+        return corrected_text
+
+    messages = [
+        {
+            "role": "system",
+            "content": openai_speech_prompt
+        },
+        {
+            "role": "user",
+            "content": transcription_text
+        }
+    ]
+
+    if on_delta is None:
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",  # or whichever GPT-based model you have
+            temperature=0,
+            messages=messages,
+        )
+        # Return only the corrected text
+        corrected_text = response.choices[0].message.content or ''
+    else:
+        stream = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            temperature=0,
+            messages=messages,
+            stream=True,
+        )
+        corrected_text = ''
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                corrected_text += chunk.choices[0].delta.content
+                on_delta(corrected_text)
+
+    correction_cache.store(openai_speech_prompt, transcription_text, corrected_text)
+    return corrected_text
+
+async def generate_corrected_transcript(
+    audio_file: BytesIO,
+    openai_speech_prompt: Optional[str],
+    on_delta: Optional[Callable[[str], None]] = None,
+    policy: Optional[str] = None,
+) -> str:
     """
     1. Convert speech to text (Japanese).
-    2. Use langdetect to check if the text is Japanese.
-    3. If not Japanese, return "日本語で質問してください！".
-    4. Otherwise, pass the transcription to ChatGPT with the system prompt,
+    2. Pass the transcription to ChatGPT with the system prompt when it needs a correction,
        and get back the corrected text.
     """
     # Step 1: Transcribe
-    transcription_text = transcribe_file(audio_file)
+    transcription_text = await transcribe_file(audio_file)
 
     # Step 2: Send to ChatGPT for correction
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",  # or whichever GPT-based model you have
-        temperature=0,
-        messages=[
-            {
-                "role": "system",
-                "content": openai_speech_prompt
-            },
-            {
-                "role": "user",
-                "content": transcription_text
-            }
-        ]
-    )
-
-    # Step 3: Return only the corrected text
-    return response.choices[0].message.content
\ No newline at end of file
+    return await correct_transcript(transcription_text, openai_speech_prompt, on_delta, policy)
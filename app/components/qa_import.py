@@ -0,0 +1,325 @@
+import os
+import csv
+import json
+import uuid
+import codecs
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from nicegui import run
+from upstash_vector.types import Data
+from langchain.docstore.document import Document
+
+from components.text_embedding import normalize_text
+from components.vector_db import japan_tz, aupsert_vector_data, notify_namespace_change
+
+logger = logging.getLogger(__name__)
+
+QA_IMPORT_DIR = os.getenv('QA_IMPORT_DIR', os.path.join(os.path.dirname(__file__), '..', '.qa_import'))
+QA_IMPORT_BATCH_SIZE = int(os.getenv('QA_IMPORT_BATCH_SIZE', '100'))
+QA_IMPORT_CONCURRENCY = int(os.getenv('QA_IMPORT_CONCURRENCY', '4'))
+MAX_QA_TEXT_LENGTH = 4000
+
+# Accepted headers, the Japanese ones match the admin grid
+TEXT_COLUMNS = ('text', 'Q&A内容')
+QUESTION_COLUMNS = ('question', '質問')
+ANSWER_COLUMNS = ('answer', '回答')
+SERVICE_COLUMNS = ('service', '商材')
+
+# Tried in order: utf-8-sig also drops the BOM Excel puts in front of CSV exports,
+# cp932 is what Excel on Japanese Windows saves as "CSV"
+CSV_ENCODINGS = ('utf-8-sig', 'cp932')
+
+
+@dataclass
+class RowError:
+    line: int
+    message: str
+
+
+@dataclass
+class ImportResult:
+    added: pd.DataFrame
+    errors: List[RowError] = field(default_factory=list)
+    resumed_batches: int = 0
+    failed_batches: int = 0
+    # Set when the file could not be read at all, nothing was imported then
+    file_error: Optional[str] = None
+
+
+def get_vector_id(namespace: str, text: str) -> str:
+    """Deterministic ID, importing the same Q&A again overwrites it instead of adding a duplicate."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f'{namespace}:{normalize_text(text)}'))
+
+
+def save_upload(file_name: str, content: bytes) -> str:
+    """Store an upload under the hash of its content, so uploading the same file again resumes it."""
+    extension = os.path.splitext(file_name)[1].lower()
+    os.makedirs(QA_IMPORT_DIR, exist_ok=True)
+    path = os.path.join(QA_IMPORT_DIR, hashlib.sha256(content).hexdigest() + extension)
+    if not os.path.exists(path):
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def detect_encoding(path: str, chunk_size: int = 1 << 16) -> Optional[str]:
+    """First of CSV_ENCODINGS that decodes the whole file, None when none does."""
+    for encoding in CSV_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(chunk_size):
+                    decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return None
+
+
+def is_blank_row(values) -> bool:
+    return not any(str(value).strip() for value in values if value is not None)
+
+
+def iter_file_rows(path: str, encoding: str = 'utf-8-sig') -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    (line, row) of a CSV or XLSX file, rows as dicts keyed by header, read without loading the whole file.
+
+    `line` is the line the row ends on in the file, blank CSV lines are skipped but still counted.
+    """
+    if path.endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(value or '').strip() for value in next(rows, [])]
+            for line, values in enumerate(rows, start=2):
+                yield line, {key: '' if value is None else str(value) for key, value in zip(header, values)}
+        finally:
+            workbook.close()
+    else:
+        with open(path, encoding=encoding, newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Values past the header end up in a list under None, they have no column to go to
+                yield reader.line_num, {key.strip(): value or '' for key, value in row.items() if key is not None}
+
+
+def count_file_rows(path: str, encoding: str = 'utf-8-sig') -> int:
+    """Data rows of the file, blank rows are not counted since they are not imported either."""
+    if path.endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            next(rows, None)
+            return sum(1 for values in rows if not is_blank_row(values))
+        finally:
+            workbook.close()
+
+    with open(path, encoding=encoding, newline='') as f:
+        rows = csv.reader(f)
+        next(rows, None)
+        return sum(1 for values in rows if not is_blank_row(values))
+
+
+def get_column(row: Dict[str, str], names: tuple) -> str:
+    for name in names:
+        if row.get(name):
+            return row[name].strip()
+    return ''
+
+
+def iter_batches(
+        path: str,
+        namespace: str,
+        default_service: str,
+        errors: List[RowError],
+        batch_size: int = QA_IMPORT_BATCH_SIZE,
+        encoding: str = 'utf-8-sig',
+    ) -> Iterator[List[Data]]:
+    """
+    Validate the rows of `path` and group them into upsert batches, invalid rows go to `errors`.
+
+    A file that turns out to be broken part way (e.g. a malformed CSV quote) ends the
+    batches with an error on the line reached; the rows before it are still imported.
+    """
+    local_date = datetime.now(japan_tz).strftime("%Y/%m/%d")
+    local_time = datetime.now(japan_tz).strftime("%H:%M:%S")
+
+    batch: List[Data] = []
+    seen_ids = set()
+    rows = iter_file_rows(path, encoding)
+    # Line 1 is the header
+    line = 1
+    while True:
+        try:
+            line, row = next(rows, (line, None))
+        except Exception as e:
+            logger.exception('Reading %s stopped after line %d', path, line)
+            errors.append(RowError(line + 1, f'ファイルを読み込めません: {e}'))
+            break
+        if row is None:
+            break
+
+        text = get_column(row, TEXT_COLUMNS) or get_column(row, QUESTION_COLUMNS) + get_column(row, ANSWER_COLUMNS)
+        service = get_column(row, SERVICE_COLUMNS) or default_service
+
+        if not text:
+            if any(value.strip() for value in row.values()):
+                errors.append(RowError(line, 'Q&A内容がありません'))
+            continue
+        if len(text) > MAX_QA_TEXT_LENGTH:
+            errors.append(RowError(line, f'Q&A内容が{MAX_QA_TEXT_LENGTH}文字を超えています'))
+            continue
+        if not service:
+            errors.append(RowError(line, '商材がありません'))
+            continue
+
+        vector_id = get_vector_id(namespace, text)
+        if vector_id in seen_ids:
+            errors.append(RowError(line, '重複したQ&Aです'))
+            continue
+        seen_ids.add(vector_id)
+
+        batch.append(Data(
+            id=vector_id,
+            data=text,
+            # Same metadata as add_vector_data, `text` is where the LangChain store reads the content
+            metadata={
+                "text": text,
+                "service": service,
+                "chat_bot_type": "q_and_a",
+                "added_date": local_date,
+                "added_time": local_time,
+            },
+        ))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class ImportProgress:
+    """Batches already upserted for one file and namespace, kept next to the upload."""
+    def __init__(self, path: str, namespace: str, batch_size: int) -> None:
+        self.path = f'{path}.{hashlib.sha256(namespace.encode()).hexdigest()[:16]}.progress.json'
+        self.batch_size = batch_size
+        self.completed: set = set()
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+            # Batches only line up again with the same batch size
+            if saved.get('batch_size') == batch_size:
+                self.completed = set(saved.get('completed', []))
+
+    def mark_completed(self, batch_index: int) -> None:
+        self.completed.add(batch_index)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'batch_size': self.batch_size, 'completed': sorted(self.completed)}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def delete(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def import_qa_file(
+        path: str,
+        namespace: str,
+        default_service: str = '',
+        batch_size: int = QA_IMPORT_BATCH_SIZE,
+        concurrency: int = QA_IMPORT_CONCURRENCY,
+        on_progress: Optional[Callable[[int, int, int], None]] = None,
+    ) -> ImportResult:
+    """
+    Import the Q&A rows of a CSV/XLSX file into `namespace` with batched upserts.
+
+    The file is parsed batch by batch in a worker thread while up to `concurrency`
+    batches are upserted. `on_progress(imported_rows, total_rows, failed_batches)` is
+    called after each batch. Completed batches are recorded so that importing the same
+    file again skips them; the IDs are deterministic, so replaying a batch is harmless.
+    The returned frame holds the IDs and metadata of every imported row, no re-fetch needed.
+    """
+    errors: List[RowError] = []
+    result = ImportResult(added=pd.DataFrame(), errors=errors)
+
+    encoding = 'utf-8-sig'
+    if not path.endswith('.xlsx'):
+        encoding = await run.io_bound(detect_encoding, path)
+        if encoding is None:
+            result.file_error = f'文字コードを判別できません（{" / ".join(CSV_ENCODINGS)}で読めません）'
+            return result
+    try:
+        total_rows = await run.io_bound(count_file_rows, path, encoding)
+    except Exception as e:
+        logger.exception('Reading %s failed', path)
+        result.file_error = f'ファイルを読み込めません: {e}'
+        return result
+
+    progress = await run.io_bound(ImportProgress, path, namespace, batch_size)
+    batches = iter_batches(path, namespace, default_service, errors, batch_size, encoding)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    imported: List[Data] = []
+
+    def report() -> None:
+        if on_progress is not None:
+            on_progress(len(imported), total_rows, result.failed_batches)
+
+    async def upsert(batch_index: int, batch: List[Data]) -> None:
+        try:
+            await aupsert_vector_data(namespace, batch)
+        except Exception:
+            logger.exception('Importing batch %d into %s failed', batch_index, namespace)
+            result.failed_batches += 1
+        else:
+            progress.mark_completed(batch_index)
+            imported.extend(batch)
+        finally:
+            semaphore.release()
+        report()
+
+    tasks = []
+    batch_index = 0
+    while True:
+        batch = await run.io_bound(next, batches, None)
+        if batch is None:
+            break
+
+        if batch_index in progress.completed:
+            result.resumed_batches += 1
+            imported.extend(batch)
+            report()
+        else:
+            # Parsing waits here while `concurrency` batches are in flight
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(upsert(batch_index, batch)))
+        batch_index += 1
+
+    await asyncio.gather(*tasks)
+
+    if imported:
+        notify_namespace_change(namespace, added={
+            vector.id: Document(page_content=vector.data, metadata={
+                key: value for key, value in vector.metadata.items() if key != 'text'
+            })
+            for vector in imported
+        })
+    if not result.failed_batches:
+        await run.io_bound(progress.delete)
+
+    result.added = pd.DataFrame([{**vector.metadata, 'vector_id': vector.id} for vector in imported])
+    return result
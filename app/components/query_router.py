@@ -0,0 +1,71 @@
+import os
+import re
+import logging
+from typing import List, Literal, Optional
+
+from components.text_embedding import normalize_text
+
+logger = logging.getLogger(__name__)
+
+RouterMode = Literal['llm', 'always', 'keywords']
+RouteDecision = Literal['retrieve', 'respond', 'llm']
+ROUTER_MODES = ('llm', 'always', 'keywords')
+
+# Shops without their own mode keep the LLM deciding, as before the router existed
+DEFAULT_ROUTER_MODE: RouterMode = os.getenv('CHAT_ROUTER_MODE', 'llm')
+if DEFAULT_ROUTER_MODE not in ROUTER_MODES:
+    raise ValueError(f"CHAT_ROUTER_MODE must be one of {', '.join(ROUTER_MODES)}, got {DEFAULT_ROUTER_MODE!r}")
+
+# Greetings and thanks never need the Q&A data
+small_talk_pattern = re.compile(
+    r'^(こんにちは|こんばんは|おはよう|はじめまして|よろしく|ありがとう|どうも|了解|わかりました|hello|hi|thanks?)'
+    r'[ 、。!！?？~〜ー]*(ございます|ございました|お願いします|お願いいたします)?[ 、。!！?？~〜ー]*$'
+)
+
+
+class QueryRouter:
+    """
+    Decide locally whether a question needs retrieval, so most turns skip the
+    tool-calling LLM hop of query_or_respond.
+
+    - `llm`: always defer to query_or_respond (the original behaviour).
+    - `always`: retrieve for every question.
+    - `keywords`: retrieve when one of the shop's keywords appears, answer small talk
+      without retrieval, and defer anything else to query_or_respond.
+    """
+    def __init__(self, mode: Optional[str] = None, keywords: Optional[List[str]] = None) -> None:
+        if mode and mode not in ROUTER_MODES:
+            # A typo in one shop's row must not take its chat down
+            logger.error("Unknown chat router mode %r, using %r", mode, DEFAULT_ROUTER_MODE)
+            mode = None
+        self.mode = mode or DEFAULT_ROUTER_MODE
+        self.keywords = [normalize_text(keyword) for keyword in keywords or [] if keyword.strip()]
+
+    @classmethod
+    def from_config(cls, mode: Optional[str], keywords: Optional[str]) -> "QueryRouter":
+        """Build a router from the shop columns, keywords being a comma separated string."""
+        return cls(mode=mode, keywords=re.split(r'[,、\n]', keywords) if keywords else None)
+
+    def route(self, question: str) -> RouteDecision:
+        if self.mode == 'always':
+            return 'retrieve'
+        if self.mode != 'keywords':
+            return 'llm'
+
+        normalized_question = normalize_text(question)
+        if any(keyword in normalized_question for keyword in self.keywords):
+            return 'retrieve'
+        if small_talk_pattern.match(normalized_question):
+            return 'respond'
+        return 'llm'
+
+
+def build_retrieval_query(questions: List[str], min_length: int = 15) -> str:
+    """
+    Build the search query from the customer's latest questions.
+    A short follow-up ("料金は？") is searched together with the question before it.
+    """
+    query = questions[-1]
+    if len(query) < min_length and len(questions) > 1:
+        query = f"{questions[-2]} {query}"
+    return query
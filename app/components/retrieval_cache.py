@@ -0,0 +1,86 @@
+import os
+import asyncio
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from components.text_embedding import normalize_text
+from components.vector_db import add_namespace_listener
+
+
+class RetrievalCache:
+    """
+    Process-wide cache of vector search results keyed by (namespace, normalized query, k).
+
+    - Every session of a shop shares the same entries, bounded by `max_entries` in LRU order.
+    - Concurrent identical lookups share one in-flight search (single-flight).
+    - Each namespace has a generation bumped by every Q&A change; results fetched
+      under an older generation are never served.
+    """
+    def __init__(self, max_entries: int = 2000) -> None:
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str, int], Tuple[int, List[Document]]]" = OrderedDict()
+        self.in_flight: Dict[Tuple[str, str, int, int], asyncio.Future] = {}
+        self.generations: Dict[str, int] = defaultdict(int)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bump_generation(self, namespace: str, *args, **kwargs) -> None:
+        # Admin edits run in a worker thread, the generations are only touched from the event loop
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._bump_generation, namespace)
+        else:
+            self._bump_generation(namespace)
+
+    def _bump_generation(self, namespace: str) -> None:
+        self.generations[namespace] += 1
+
+    async def get_or_fetch(
+            self,
+            namespace: str,
+            query: str,
+            k: int,
+            fetch: Callable[[], Awaitable[List[Document]]],
+        ) -> List[Document]:
+        self.loop = asyncio.get_running_loop()
+        key = (namespace, normalize_text(query), k)
+        generation = self.generations[namespace]
+
+        cached = self.entries.get(key)
+        if cached and cached[0] == generation:
+            self.entries.move_to_end(key)
+            return cached[1]
+
+        flight_key = key + (generation,)
+        future = self.in_flight.get(flight_key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, generation, fetch))
+            self.in_flight[flight_key] = future
+
+        # A cancelled waiter must not cancel the search shared with other sessions
+        return await asyncio.shield(future)
+
+    async def _fetch(
+            self,
+            key: Tuple[str, str, int],
+            generation: int,
+            fetch: Callable[[], Awaitable[List[Document]]],
+        ) -> List[Document]:
+        try:
+            documents = await fetch()
+        finally:
+            self.in_flight.pop(key + (generation,), None)
+
+        # Data changed while searching, the result may already be stale
+        if self.generations[key[0]] == generation:
+            self.entries[key] = (generation, documents)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return documents
+
+
+retrieval_cache = RetrievalCache(max_entries=int(os.getenv('RETRIEVAL_CACHE_MAX_ENTRIES', '2000')))
+
+add_namespace_listener(retrieval_cache.bump_generation)
@@ -0,0 +1,51 @@
+// Markdown bubble fed with HTML rendered on the server.
+// Complete blocks are appended once, only the block still being written is replaced on each flush.
+
+export default {
+  template: `
+    <div class="nicegui-markdown">
+      <div ref="done"></div>
+      <div ref="tail"></div>
+    </div>
+  `,
+  props: {
+    html: String,
+    content: String,
+    typewriter_interval: Number,
+  },
+  mounted() {
+    if (this.typewriter_interval) this.typewrite(this.content || "", this.typewriter_interval);
+    else this.replace(this.html || "");
+  },
+  unmounted() {
+    clearInterval(this.typewriter);
+  },
+  methods: {
+    typewrite(text, interval) {
+      // Typing effect played by the browser as plain text, the rendered HTML replaces it at the end
+      const characters = Array.from(text);
+      const tail = this.$refs.tail;
+      tail.style.whiteSpace = "pre-wrap";
+      let index = 0;
+      this.typewriter = setInterval(() => {
+        if (index >= characters.length) {
+          clearInterval(this.typewriter);
+          tail.style.whiteSpace = "";
+          this.replace(this.html || "");
+          return;
+        }
+        tail.textContent += characters[index++];
+        window.scrollTo(0, document.body.scrollHeight);
+      }, interval);
+    },
+    append(doneHtml, tailHtml, scroll) {
+      if (doneHtml) this.$refs.done.insertAdjacentHTML("beforeend", doneHtml);
+      this.$refs.tail.innerHTML = tailHtml;
+      if (scroll) window.scrollTo(0, document.body.scrollHeight);
+    },
+    replace(html) {
+      this.$refs.done.innerHTML = html;
+      this.$refs.tail.innerHTML = "";
+    },
+  },
+};
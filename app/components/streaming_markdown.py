@@ -0,0 +1,103 @@
+import re
+import asyncio
+from typing import Optional
+
+from nicegui import ui
+from nicegui.elements.markdown import prepare_content
+
+# Same rendering as ui.markdown
+MARKDOWN_EXTRAS = 'fenced-code-blocks tables'
+
+fence_pattern = re.compile(r'^ {0,3}(```|~~~)')
+# Lines that may continue the block before a blank line: list items, indented text, table rows
+continuation_pattern = re.compile(r'^(\s|[-*+・]\s|\d+[.)]\s|\|)')
+
+
+def find_block_boundary(text: str, start: int = 0) -> int:
+    """
+    Offset after the last complete block of `text[start:]`, `start` when there is none yet.
+
+    A block ends at a blank line outside fenced code that is followed by a complete line
+    which cannot continue it, so a list, table or code block is never cut in two.
+    """
+    boundary = start
+    in_fence = False
+    after_blank = False
+    offset = start
+    for line in text[start:].splitlines(keepends=True):
+        if not line.endswith('\n'):
+            # The line still being written cannot be judged yet
+            break
+        if fence_pattern.match(line):
+            if not in_fence and after_blank:
+                boundary = offset
+            in_fence = not in_fence
+            after_blank = False
+        elif not in_fence:
+            if not line.strip():
+                after_blank = True
+            else:
+                if after_blank and not continuation_pattern.match(line):
+                    boundary = offset
+                after_blank = False
+        offset += len(line)
+    return boundary
+
+
+class StreamingMarkdown(ui.element, component='streaming_markdown.js'):
+    """
+    Markdown element that receives text as appended deltas.
+
+    Deltas are coalesced and rendered at most once per `flush_interval` seconds with the
+    markdown2 renderer of ui.markdown. Complete blocks are rendered and sent once, only the
+    block still being written is rendered again on each flush, and `finish` renders the
+    whole text once so the final message is exactly what ui.markdown would show.
+    With `typewriter_interval` (seconds per character) the browser types `content` out by itself.
+    """
+    def __init__(self, content: str = '', flush_interval: float = 0.05, typewriter_interval: Optional[float] = None) -> None:
+        super().__init__()
+        self._props['html'] = prepare_content(content, extras=MARKDOWN_EXTRAS) if content else ''
+        if typewriter_interval:
+            self._props['content'] = content
+            self._props['typewriter_interval'] = int(typewriter_interval * 1000)
+        self.content = content
+        self.rendered_length = len(content)
+        self.rendered_html = self._props['html']
+        self.pending = False
+        self.flush_interval = flush_interval
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def append(self, delta: str) -> None:
+        self.content += delta
+        self.pending = True
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+        self.pending = False
+
+        boundary = find_block_boundary(self.content, self.rendered_length)
+        done_html = ''
+        if boundary > self.rendered_length:
+            done_html = prepare_content(self.content[self.rendered_length:boundary], extras=MARKDOWN_EXTRAS)
+            self.rendered_html += done_html
+            self.rendered_length = boundary
+        tail = self.content[boundary:]
+        tail_html = prepare_content(tail, extras=MARKDOWN_EXTRAS) if tail.strip() else ''
+
+        # Keeps the text if the element is rendered again (e.g. after a reconnect)
+        self._props['html'] = self.rendered_html + tail_html
+        self.run_method('append', done_html, tail_html, True)
+
+    def finish(self) -> None:
+        """Render the whole text once, blocks rendered apart can differ (e.g. reference links)."""
+        self.flush()
+        html = prepare_content(self.content, extras=MARKDOWN_EXTRAS) if self.content.strip() else ''
+        if html != self._props['html']:
+            self._props['html'] = html
+            self.run_method('replace', html)
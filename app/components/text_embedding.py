@@ -0,0 +1,55 @@
+import zlib
+import unicodedata
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-normalize, lowercase and collapse whitespace (全角/半角 variants compare equal)."""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+class NgramHashEmbeddings(Embeddings):
+    """
+    Deterministic local embedding made of hashed character n-grams.
+
+    It needs no API call, which makes it cheap enough to embed every incoming question.
+    It captures surface similarity only, which is what matters for near-identical
+    Japanese FAQ questions.
+    """
+    def __init__(self, dimensions: int = 512, ngram_range: Tuple[int, int] = (1, 3)) -> None:
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+
+    def embed_text(self, text: str) -> np.ndarray:
+        text = normalize_text(text)
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for start in range(len(text) - n + 1):
+                # crc32 is stable across processes, unlike hash()
+                hashed = zlib.crc32(text[start:start + n].encode("utf-8"))
+                sign = 1.0 if hashed & 0x80000000 else -1.0
+                vector[hashed % self.dimensions] += sign * n
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_text(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_text(text).tolist()
+
+
+default_embeddings = NgramHashEmbeddings()
+
+
+def text_similarity(text_a: str, text_b: str) -> float:
+    """Cosine similarity of two texts under the local n-gram embedding."""
+    return float(default_embeddings.embed_text(text_a) @ default_embeddings.embed_text(text_b))
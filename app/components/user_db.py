@@ -1,13 +1,22 @@
 import os
-from typing import Optional, Dict, List
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
 
 import pandas as pd
 
-from supabase import create_client, Client
+from supabase import create_client, Client, acreate_client, AsyncClient
 from pydantic import BaseModel
 
 supabase: Client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_ANON_KEY'))
 
+# Async client created on first use, its HTTP connection pool is shared by every page handler
+async_supabase: Optional[AsyncClient] = None
+async_supabase_lock = asyncio.Lock()
+# Upper bound of Supabase queries running at the same time
+supabase_semaphore = asyncio.Semaphore(int(os.getenv('SUPABASE_MAX_CONCURRENCY', '20')))
+
 class User(BaseModel):
     shop_name_en: str
     shop_name_jp: str
@@ -18,6 +27,12 @@ class User(BaseModel):
     openai_chat_prompt: Optional[str] = None
     openai_speech_prompt: Optional[str] = None
     first_message: Optional[str] = None
+    chat_token_budget: Optional[int] = None
+    chat_router_mode: Optional[str] = None
+    chat_router_keywords: Optional[str] = None
+    context_token_budget: Optional[int] = None
+    vector_db_backend: Optional[str] = None
+    stt_correction_policy: Optional[str] = None
 
 def get_shop_information(shop_name_en: str) -> Optional[User]:
     """
@@ -29,7 +44,9 @@ def get_shop_information(shop_name_en: str) -> Optional[User]:
     if not data:
         return None
 
-    row = data[0]
+    return create_user(data[0])
+
+def create_user(row: dict) -> User:
     user = User(
         shop_name_en=row.get('shop_name_en'),
         shop_name_jp=row.get('shop_name_jp'),
@@ -39,7 +56,13 @@ def get_shop_information(shop_name_en: str) -> Optional[User]:
         vector_db_namespace=row.get('vector_db_namespace'),
         openai_chat_prompt=row.get('openai_chat_prompt'),
         openai_speech_prompt=row.get('openai_speech_prompt'),
-        first_message=row.get('first_message')
+        first_message=row.get('first_message'),
+        chat_token_budget=row.get('chat_token_budget'),
+        chat_router_mode=row.get('chat_router_mode'),
+        chat_router_keywords=row.get('chat_router_keywords'),
+        context_token_budget=row.get('context_token_budget'),
+        vector_db_backend=row.get('vector_db_backend'),
+        stt_correction_policy=row.get('stt_correction_policy'),
     )
 
     return user
@@ -76,5 +99,159 @@ def update_table_data(table_name: str, filter_conditions: dict, new_values: dict
     # Retrieve the data from the response; adjust depending on the response format
     data = response.data if hasattr(response, 'data') else response.get('data', [])
     
+    # Cached shop settings must not outlive an edit of the users table
+    if table_name == "users":
+        shop_config_cache.invalidate()
+
     # Convert the result into a pandas DataFrame (optional)
-    return pd.DataFrame(data)
\ No newline at end of file
+    return pd.DataFrame(data)
+
+
+# -------------------------- Async data layer -------------------------- #
+async def get_async_supabase() -> AsyncClient:
+    global async_supabase
+    if async_supabase is None:
+        async with async_supabase_lock:
+            if async_supabase is None:
+                async_supabase = await acreate_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_ANON_KEY'))
+    return async_supabase
+
+async def aget_shop_information(shop_name_en: str) -> Optional[User]:
+    """
+    Async variant of `get_shop_information`, awaited directly by the page handlers.
+    """
+    client = await get_async_supabase()
+    async with supabase_semaphore:
+        response = await client.table("users").select("*").eq("shop_name_en", shop_name_en).execute()
+
+    data = response.data
+    if not data:
+        return None
+
+    return create_user(data[0])
+
+async def aget_table_data(table_name : str) -> pd.DataFrame:
+    client = await get_async_supabase()
+    async with supabase_semaphore:
+        response = await client.table(table_name).select("*").execute()
+
+    return pd.DataFrame(response.data)
+
+async def aupdate_table_data(table_name: str, filter_conditions: dict, new_values: dict) -> pd.DataFrame:
+    """
+    Async variant of `update_table_data`.
+    """
+    client = await get_async_supabase()
+    async with supabase_semaphore:
+        response = await client.table(table_name).update(new_values).match(filter_conditions).execute()
+
+    # Same check as update_table_data
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Error updating data: {response.error.message}")
+
+    if table_name == "users":
+        shop_config_cache.invalidate()
+
+    return pd.DataFrame(response.data)
+
+
+class ShopConfigCache:
+    """
+    In-process cache of `get_shop_information` keyed by shop_name_en.
+
+    - Entries expire after `ttl_seconds`, at most `max_entries` shops are kept and
+      the least recently used are dropped first.
+    - Unknown shop names are remembered apart, for a short `negative_ttl_seconds` and
+      at most `max_negative_entries`, so bots hitting random URLs neither reach Supabase
+      nor evict real shops, and a newly created shop is found soon.
+    - Concurrent page loads of the same shop share one query.
+    """
+    def __init__(
+            self,
+            ttl_seconds: float = 60,
+            negative_ttl_seconds: float = 10,
+            max_entries: int = 10_000,
+            max_negative_entries: int = 1_000,
+        ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.max_negative_entries = max_negative_entries
+        self.entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        # shop_name_en -> expiry of an unknown name
+        self.misses: "OrderedDict[str, float]" = OrderedDict()
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.generation = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def get(self, shop_name_en: str) -> Optional[User]:
+        self.loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        entry = self.entries.get(shop_name_en)
+        if entry and entry[0] > now:
+            self.entries.move_to_end(shop_name_en)
+            return entry[1]
+        if self.misses.get(shop_name_en, 0) > now:
+            return None
+
+        future = self.in_flight.get(shop_name_en)
+        if future is None:
+            future = asyncio.ensure_future(self._load(shop_name_en))
+            self.in_flight[shop_name_en] = future
+        return await asyncio.shield(future)
+
+    async def _load(self, shop_name_en: str) -> Optional[User]:
+        generation = self.generation
+        task = asyncio.current_task()
+        try:
+            user = await aget_shop_information(shop_name_en)
+        finally:
+            # An invalidation may already have replaced this query with a newer one
+            if self.in_flight.get(shop_name_en) is task:
+                self.in_flight.pop(shop_name_en)
+
+        # Skip caching a row read before an invalidation, it may be outdated
+        if generation == self.generation:
+            if user:
+                self.misses.pop(shop_name_en, None)
+                self.entries[shop_name_en] = (time.monotonic() + self.ttl_seconds, user)
+                self.entries.move_to_end(shop_name_en)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.pop(shop_name_en, None)
+                self.misses[shop_name_en] = time.monotonic() + self.negative_ttl_seconds
+                self.misses.move_to_end(shop_name_en)
+                while len(self.misses) > self.max_negative_entries:
+                    self.misses.popitem(last=False)
+
+        return user
+
+    def invalidate(self, shop_name_en: Optional[str] = None) -> None:
+        """Forget one shop, or every shop when no name is given. Safe to call from worker threads."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # update_table_data runs in run.io_bound, the cache is only touched from the event loop
+            if self.loop is not None and self.loop.is_running():
+                self.loop.call_soon_threadsafe(self.drop, shop_name_en)
+                return
+        self.drop(shop_name_en)
+
+    def drop(self, shop_name_en: Optional[str] = None) -> None:
+        self.generation += 1
+        # Later callers start a new query instead of joining one from before the change
+        if shop_name_en is None:
+            self.entries.clear()
+            self.misses.clear()
+            self.in_flight.clear()
+        else:
+            self.entries.pop(shop_name_en, None)
+            self.misses.pop(shop_name_en, None)
+            self.in_flight.pop(shop_name_en, None)
+
+
+shop_config_cache = ShopConfigCache(
+    ttl_seconds=float(os.getenv('SHOP_CONFIG_TTL_SECONDS', '60')),
+    negative_ttl_seconds=float(os.getenv('SHOP_CONFIG_NEGATIVE_TTL_SECONDS', '10')),
+)
\ No newline at end of file
@@ -1,83 +1,408 @@
+import os
+import re
+import json
 import time
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import List
+from typing import AsyncIterator, Callable, Dict, List, Optional
 
 import pandas as pd
-from upstash_vector import Index
+from upstash_vector import Index, AsyncIndex
+from upstash_vector.types import Data
+from upstash_vector.errors import UpstashError
 
+from langchain_core.vectorstores import VectorStore
 from langchain_community.vectorstores.upstash import UpstashVectorStore
 from langchain.docstore.document import Document
 
 
+logger = logging.getLogger(__name__)
+
 # Set Japan timezone
 japan_tz = ZoneInfo("Asia/Tokyo")
 
+# Called as listener(namespace, added, removed_ids) whenever the Q&A data of a namespace changes
+namespace_listeners: List[Callable[..., None]] = []
 
-def get_vector_store(namespace : str) -> UpstashVectorStore:
-    vector_store = UpstashVectorStore(
-        embedding=True,
-        namespace=namespace,
-    )
 
-    return vector_store
+def add_namespace_listener(listener: Callable[..., None]) -> None:
+    namespace_listeners.append(listener)
 
 
-def get_specific_vector_data(namespace: str, list_id: List[str]) -> pd.DataFrame:
-    index = Index.from_env()
-    
-    responses = index.fetch(
-        ids=list_id,
-        namespace=namespace,
-        include_vectors=False,
-        include_metadata=True,
-        include_data=True
-    )
+def notify_namespace_change(
+        namespace: str,
+        added: Optional[Dict[str, Document]] = None,
+        removed_ids: Optional[List[str]] = None,
+    ) -> None:
+    for listener in namespace_listeners:
+        listener(namespace, added or {}, removed_ids or [])
 
-    all_vectors_metadata = []
-    for res in responses:
-        vector_id = res.id
-        metadata = res.metadata
-        metadata['vector_id'] = vector_id
 
-        all_vectors_metadata.append(metadata)
-    
-    df_specific_vector = pd.DataFrame(all_vectors_metadata)
+class RateLimiter:
+    """Token bucket shared by every concurrent Upstash request of this process."""
+    def __init__(self, requests_per_second: float, burst: Optional[int] = None) -> None:
+        self.requests_per_second = requests_per_second
+        self.burst = burst or max(1, int(requests_per_second))
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
 
-    return df_specific_vector
+    async def acquire(self) -> None:
+        if self.requests_per_second <= 0:
+            return
 
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.requests_per_second)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.requests_per_second)
 
-def get_vector_data(namespace: str) -> pd.DataFrame:
-    index = Index.from_env()
-    all_vectors_metadata = []
-    cursor = ''  # Start with an empty cursor
 
-    while True:
-        res = index.range(
+# 0 disables the limit
+upstash_rate_limiter = RateLimiter(float(os.getenv('UPSTASH_REQUESTS_PER_SECOND', '10')))
+
+
+class VectorBackend(ABC):
+    """Storage of the Q&A vectors of a namespace, selected per shop with `set_namespace_backend`."""
+    name = ''
+
+    @abstractmethod
+    def get_vector_store(self, namespace: str) -> VectorStore:
+        """LangChain vector store searching the namespace."""
+
+    @abstractmethod
+    def get_vector_data(self, namespace: str) -> pd.DataFrame:
+        """Every row of the namespace: metadata plus `text` and `vector_id`."""
+
+    @abstractmethod
+    def get_specific_vector_data(self, namespace: str, list_id: List[str]) -> pd.DataFrame:
+        """The rows of `list_id`, in the shape of get_vector_data."""
+
+    @abstractmethod
+    def remove_vectors(self, namespace: str, vector_ids: List[str]) -> bool:
+        """Delete vectors, True when every one of them was removed."""
+
+    @abstractmethod
+    def aiter_vector_data(self, namespace: str, **kwargs) -> AsyncIterator[List[dict]]:
+        """Rows of the namespace page by page."""
+
+    @abstractmethod
+    async def aupsert_vector_data(self, namespace: str, vectors: List[Data]) -> None:
+        """Insert or overwrite vectors by ID."""
+
+    async def aclose(self) -> None:
+        """Release the clients of the backend."""
+
+
+# Upstash words its limits as "max requests limit exceeded", "Exceeded max requests per second", ...
+rate_limit_pattern = re.compile(r'\b429\b|too many requests|rate[ -]?limit|requests? limit|max requests', re.IGNORECASE)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    Rate-limit errors of Upstash. A body that is not JSON (e.g. a plain-text 429 from the proxy)
+    fails in the client's response.json() and is treated the same, retrying it is harmless.
+    """
+    if isinstance(error, json.JSONDecodeError):
+        return True
+    return isinstance(error, UpstashError) and rate_limit_pattern.search(str(error)) is not None
+
+
+def get_backoff_seconds(retries: int) -> float:
+    return min(0.5 * 2 ** retries, 30) * random.uniform(0.8, 1.2)
+
+
+class UpstashBackend(VectorBackend):
+    """
+    Hosted Upstash index with built-in embedding.
+    One sync and one async client are shared by the whole process, so their connections are reused.
+    """
+    name = 'upstash'
+
+    def __init__(self) -> None:
+        self.index: Optional[Index] = None
+        self.async_index: Optional[AsyncIndex] = None
+
+    def get_index(self) -> Index:
+        if self.index is None:
+            self.index = Index.from_env()
+        return self.index
+
+    def get_async_index(self) -> AsyncIndex:
+        if self.async_index is None:
+            self.async_index = AsyncIndex.from_env()
+        return self.async_index
+
+    async def aclose(self) -> None:
+        # upstash-vector 0.7 has no close method, its httpx clients are closed directly
+        if self.async_index is not None:
+            await self.async_index._client.aclose()
+            self.async_index = None
+        if self.index is not None:
+            self.index._client.close()
+            self.index = None
+
+    def get_vector_store(self, namespace: str) -> UpstashVectorStore:
+        vector_store = UpstashVectorStore(
+            embedding=True,
+            namespace=namespace,
+        )
+
+        return vector_store
+
+    def get_specific_vector_data(self, namespace: str, list_id: List[str]) -> pd.DataFrame:
+        index = self.get_index()
+        
+        responses = index.fetch(
+            ids=list_id,
             namespace=namespace,
-            cursor=cursor,
-            limit=100,
             include_vectors=False,
             include_metadata=True,
-            include_data=True,
+            include_data=True
+        )
+
+        all_vectors_metadata = []
+        for res in responses:
+            vector_id = res.id
+            metadata = res.metadata
+            metadata['vector_id'] = vector_id
+
+            all_vectors_metadata.append(metadata)
+        
+        df_specific_vector = pd.DataFrame(all_vectors_metadata)
+
+        return df_specific_vector
+
+    def get_vector_data(self, namespace: str, max_retries: int = 6) -> pd.DataFrame:
+        index = self.get_index()
+        all_vectors_metadata = []
+        cursor = ''  # Start with an empty cursor
+        retries = 0
+
+        while True:
+            try:
+                res = index.range(
+                    namespace=namespace,
+                    cursor=cursor,
+                    limit=100,
+                    include_vectors=False,
+                    include_metadata=True,
+                    include_data=True,
+                )
+            except (UpstashError, json.JSONDecodeError) as error:
+                # Only wait when Upstash asks for it instead of after every page
+                if not is_rate_limited(error) or retries >= max_retries:
+                    raise
+                time.sleep(get_backoff_seconds(retries))
+                retries += 1
+                continue
+            retries = 0
+
+            for vector in res.vectors:
+                vector_id = vector.id
+                vector_metadata = vector.metadata
+                vector_metadata['vector_id'] = vector_id
+
+                all_vectors_metadata.append(vector_metadata)
+
+            if res.next_cursor == "":
+                break
+
+            cursor = res.next_cursor
+
+        df_namespace_data = pd.DataFrame(all_vectors_metadata)
+        return df_namespace_data
+
+    def remove_vectors(self, namespace: str, vector_ids: List[str]) -> bool:
+        index = self.get_index()
+
+        res = index.delete(
+            ids=vector_ids,
+            namespace=namespace,
+        )
+
+        return len(vector_ids) == res.deleted
+
+    async def aiter_vector_data(
+            self,
+            namespace: str,
+            page_size: int = 100,
+            min_page_size: int = 25,
+            max_page_size: int = 1000,
+            max_retries: int = 6,
+            include_vectors: bool = False,
+        ) -> AsyncIterator[List[dict]]:
+        """
+        Yield the rows of a namespace page by page as they arrive.
+
+        The page size doubles after each successful page (up to `max_page_size`) and halves
+        when Upstash answers with a rate-limit error, in which case the page is retried
+        after an exponential backoff instead of sleeping a fixed time between pages.
+        With `include_vectors` each row also holds its embedding under `vector`.
+        """
+        index = self.get_async_index()
+        cursor = ''  # Start with an empty cursor
+        retries = 0
+
+        while True:
+            await upstash_rate_limiter.acquire()
+            try:
+                res = await index.range(
+                    namespace=namespace,
+                    cursor=cursor,
+                    limit=page_size,
+                    include_vectors=include_vectors,
+                    include_metadata=True,
+                    include_data=True,
+                )
+            except (UpstashError, json.JSONDecodeError) as error:
+                if not is_rate_limited(error) or retries >= max_retries:
+                    raise
+                page_size = max(min_page_size, page_size // 2)
+                await asyncio.sleep(get_backoff_seconds(retries))
+                retries += 1
+                continue
+
+            retries = 0
+            rows = []
+            for vector in res.vectors:
+                vector_metadata = dict(vector.metadata or {})
+                vector_metadata['vector_id'] = vector.id
+                if include_vectors:
+                    vector_metadata['vector'] = vector.vector
+                rows.append(vector_metadata)
+            yield rows
+
+            if res.next_cursor == "":
+                break
+
+            cursor = res.next_cursor
+            page_size = min(max_page_size, page_size * 2)
+
+    async def aupsert_vector_data(self, namespace: str, vectors: List[Data], max_retries: int = 6) -> None:
+        """Upsert one batch (embedded by Upstash from `data`), retried with backoff when rate limited."""
+        index = self.get_async_index()
+        retries = 0
+        while True:
+            await upstash_rate_limiter.acquire()
+            try:
+                await index.upsert(vectors=vectors, namespace=namespace)
+                return
+            except (UpstashError, json.JSONDecodeError) as error:
+                if not is_rate_limited(error) or retries >= max_retries:
+                    raise
+                await asyncio.sleep(get_backoff_seconds(retries))
+                retries += 1
+
+
+# ---- Backend selection ---- #
+VECTOR_DB_BACKENDS = ('upstash', 'local', 'memory')
+DEFAULT_VECTOR_DB_BACKEND = os.getenv('VECTOR_DB_BACKEND', 'upstash')
+if DEFAULT_VECTOR_DB_BACKEND not in VECTOR_DB_BACKENDS:
+    raise ValueError(f"VECTOR_DB_BACKEND must be one of {', '.join(VECTOR_DB_BACKENDS)}, got {DEFAULT_VECTOR_DB_BACKEND!r}")
+
+vector_backends: Dict[str, VectorBackend] = {}
+# namespace -> backend name, from the `vector_db_backend` setting of the shops using it
+namespace_backends: Dict[str, str] = {}
+
+
+def create_backend(name: str) -> VectorBackend:
+    if name == 'upstash':
+        return UpstashBackend()
+
+    from components.local_vector_store import LocalBackend, get_local_embeddings
+    if name == 'local':
+        return LocalBackend(
+            embeddings=get_local_embeddings(),
+            directory=os.getenv('LOCAL_VECTOR_DB_DIR', os.path.join(os.path.dirname(__file__), '..', '.local_vector_db')),
         )
+    if name == 'memory':
+        # Nothing is saved and the embedding is the deterministic n-gram one, for tests
+        from components.text_embedding import NgramHashEmbeddings
+        return LocalBackend(embeddings=NgramHashEmbeddings(), directory=None, name='memory')
+
+    raise ValueError(f"Unknown vector backend '{name}', expected one of {VECTOR_DB_BACKENDS}")
+
+
+def set_namespace_backend(namespace: str, backend_name: Optional[str]) -> None:
+    if not backend_name:
+        namespace_backends.pop(namespace, None)
+        return
+    if backend_name not in VECTOR_DB_BACKENDS:
+        # A typo in one shop's row must not take its chat down
+        logger.error("Unknown vector backend %r for namespace %r, using %r", backend_name, namespace, DEFAULT_VECTOR_DB_BACKEND)
+        namespace_backends.pop(namespace, None)
+        return
+    namespace_backends[namespace] = backend_name
 
-        for vector in res.vectors:
-            vector_id = vector.id
-            vector_metadata = vector.metadata
-            vector_metadata['vector_id'] = vector_id
 
-            all_vectors_metadata.append(vector_metadata)
+def get_backend(namespace: str) -> VectorBackend:
+    name = namespace_backends.get(namespace, DEFAULT_VECTOR_DB_BACKEND)
+    if name not in vector_backends:
+        vector_backends[name] = create_backend(name)
+    return vector_backends[name]
 
-        time.sleep(0.5)
 
-        if res.next_cursor == "":
-            break
+async def aclose_vector_backends() -> None:
+    for backend in vector_backends.values():
+        await backend.aclose()
 
-        cursor = res.next_cursor
 
-    df_namespace_data = pd.DataFrame(all_vectors_metadata)
-    return df_namespace_data
+def get_vector_store(namespace : str) -> VectorStore:
+    return get_backend(namespace).get_vector_store(namespace)
+
+
+def get_specific_vector_data(namespace: str, list_id: List[str]) -> pd.DataFrame:
+    return get_backend(namespace).get_specific_vector_data(namespace, list_id)
+
+
+def get_vector_data(namespace: str) -> pd.DataFrame:
+    return get_backend(namespace).get_vector_data(namespace)
+
+
+def aiter_vector_data(namespace: str, **kwargs) -> AsyncIterator[List[dict]]:
+    """Rows of a namespace page by page, see `UpstashBackend.aiter_vector_data`."""
+    return get_backend(namespace).aiter_vector_data(namespace, **kwargs)
+
+
+async def aupsert_vector_data(namespace: str, vectors: List[Data]) -> None:
+    await get_backend(namespace).aupsert_vector_data(namespace, vectors)
+
+
+async def acollect_vector_data(
+        namespace: str,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> pd.DataFrame:
+    """
+    Collect a whole namespace into a DataFrame, built column by column.
+    `on_progress` is called with the number of rows received so far after each page.
+    """
+    columns: Dict[str, list] = defaultdict(list)
+    row_count = 0
+    async for rows in aiter_vector_data(namespace):
+        for row in rows:
+            for key, value in row.items():
+                column = columns[key]
+                # Pad columns missing from the previous rows
+                column.extend([None] * (row_count - len(column)))
+                column.append(value)
+            row_count += 1
+        if on_progress is not None:
+            on_progress(row_count)
+
+    return pd.DataFrame({
+        key: column + [None] * (row_count - len(column))
+        for key, column in columns.items()
+    })
 
 
 def create_document(page_content : str, metadata : dict) ->Document:
@@ -106,18 +431,15 @@ def add_vector_data(namespace: str, qa_text: str, service: str) -> List[str]:
     store = get_vector_store(namespace=namespace)
     list_added_id = store.add_documents(documents=[doc])
 
+    notify_namespace_change(namespace, added=dict(zip(list_added_id, [doc])))
+
     return list_added_id
 
 
 def remove_vector(vector_ids: List[str], namespace: str) -> bool:
-    index = Index.from_env()
-
-    res = index.delete(
-        ids=vector_ids,
-        namespace=namespace,
-    )
+    all_deleted = get_backend(namespace).remove_vectors(namespace, vector_ids)
 
-    all_deleted = len(vector_ids) == res.deleted
+    notify_namespace_change(namespace, removed_ids=vector_ids)
 
     return all_deleted
 
@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from nicegui import run
+from langchain_core.embeddings import Embeddings
+from langchain.docstore.document import Document
+
+from components.vector_db import UpstashBackend, add_namespace_listener, get_backend
+
+logger = logging.getLogger(__name__)
+
+
+class NamespaceMirror:
+    """Local copy of one namespace: a memory-mapped float32 matrix plus a JSON metadata sidecar."""
+    def __init__(self, directory: str, namespace: str) -> None:
+        safe_name = re.sub(r'[^0-9A-Za-z_.-]', '_', namespace) or '_default'
+        self.directory = os.path.join(directory, safe_name)
+        self.vectors_path = os.path.join(self.directory, 'vectors.npy')
+        self.metadata_path = os.path.join(self.directory, 'metadata.json')
+
+        self.matrix: Optional[np.ndarray] = None
+        self.documents: List[Document] = []
+        self.synced_at = 0.0
+        self.generation = -1
+
+    def load(self) -> bool:
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.metadata_path)):
+            return False
+
+        with open(self.metadata_path, encoding='utf-8') as f:
+            sidecar = json.load(f)
+        self.matrix = np.load(self.vectors_path, mmap_mode='r')
+        self.documents = [Document(page_content=row['text'], metadata=row['metadata']) for row in sidecar['rows']]
+        self.synced_at = sidecar['synced_at']
+        return True
+
+    async def sync(self, namespace: str, backend: UpstashBackend) -> None:
+        """
+        Pull every vector of the namespace from Upstash and replace the files atomically.
+        The pages go through the backend's export, so its rate limiter and 429 backoff apply.
+        """
+        vectors, rows = [], []
+        async for page in backend.aiter_vector_data(namespace, include_vectors=True):
+            for row in page:
+                vectors.append(row.pop('vector'))
+                vector_id = row.pop('vector_id')
+                rows.append({'id': vector_id, 'text': row.pop('text', ''), 'metadata': row})
+
+        await run.io_bound(self.save, namespace, vectors, rows)
+
+    def save(self, namespace: str, vectors: List[List[float]], rows: List[dict]) -> None:
+        matrix = np.asarray(vectors, dtype=np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        # Unit rows turn the dot product into the cosine similarity Upstash uses
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        os.makedirs(self.directory, exist_ok=True)
+        synced_at = time.time()
+        np.save(self.vectors_path + '.tmp.npy', matrix)
+        with open(self.metadata_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'namespace': namespace, 'synced_at': synced_at, 'rows': rows}, f, ensure_ascii=False)
+        os.replace(self.vectors_path + '.tmp.npy', self.vectors_path)
+        os.replace(self.metadata_path + '.tmp', self.metadata_path)
+
+        self.load()
+
+    def search(self, query_vector: np.ndarray, k: int) -> List[Document]:
+        if self.matrix is None or not len(self.documents):
+            return []
+
+        scores = self.matrix @ (query_vector / (np.linalg.norm(query_vector) or 1))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.documents[i] for i in top]
+
+
+class VectorMirrorRegistry:
+    """
+    Optional local mirrors answering the vector search without a network round trip.
+
+    A mirror is only used while it is fresh: synced after the last admin edit of its
+    namespace and younger than `max_age_seconds` (edits made outside this process are not
+    seen). Otherwise `search` returns None, the caller falls back to Upstash and a
+    background sync is started.
+    """
+    def __init__(self, directory: str, embeddings: Optional[Embeddings], max_age_seconds: float = 3600) -> None:
+        self.directory = directory
+        self.embeddings = embeddings
+        self.max_age_seconds = max_age_seconds
+
+        self.mirrors: Dict[str, NamespaceMirror] = {}
+        self.generations: Dict[str, int] = defaultdict(int)
+        self.syncing: Dict[str, asyncio.Task] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def search(self, namespace: str, query: str, k: int) -> Optional[List[Document]]:
+        # Local backends are already searched in-process
+        if self.embeddings is None or not isinstance(get_backend(namespace), UpstashBackend):
+            return None
+        self.loop = asyncio.get_running_loop()
+
+        mirror = self.mirrors.get(namespace)
+        if mirror is None:
+            # A mirror left on disk by a previous run is reused until it gets too old
+            mirror = NamespaceMirror(self.directory, namespace)
+            if await run.io_bound(mirror.load):
+                mirror.generation = self.generations[namespace]
+                self.mirrors[namespace] = mirror
+
+        if (
+            mirror.matrix is None
+            or mirror.generation != self.generations[namespace]
+            or time.time() - mirror.synced_at > self.max_age_seconds
+        ):
+            self.schedule_sync(namespace)
+            return None
+
+        query_vector = np.asarray(await self.embeddings.aembed_query(query), dtype=np.float32)
+        if query_vector.shape[0] != mirror.matrix.shape[1]:
+            # The embedder does not match the index, the mirror can never be used
+            return None
+
+        return mirror.search(query_vector, k)
+
+    def schedule_sync(self, namespace: str) -> None:
+        if namespace not in self.syncing:
+            self.syncing[namespace] = asyncio.create_task(self.sync(namespace))
+
+    async def sync(self, namespace: str) -> None:
+        try:
+            backend = get_backend(namespace)
+            if not isinstance(backend, UpstashBackend):
+                return
+            generation = self.generations[namespace]
+            mirror = NamespaceMirror(self.directory, namespace)
+            await mirror.sync(namespace, backend)
+            mirror.generation = generation
+            self.mirrors[namespace] = mirror
+        except Exception:
+            # Searches keep falling back to Upstash, the next stale search tries again
+            logger.exception('Syncing the mirror of %s failed', namespace)
+        finally:
+            self.syncing.pop(namespace, None)
+
+    def on_namespace_change(self, namespace: str, *args, **kwargs) -> None:
+        self.generations[namespace] += 1
+        # Admin edits run in a worker thread, resync from the event loop
+        if namespace in self.mirrors and self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.schedule_sync, namespace)
+
+
+def get_mirror_embeddings() -> Optional[Embeddings]:
+    """
+    The mirror needs the query vector on our side, which requires an embedder matching
+    the index. Indexes with Upstash's built-in embedding have none, so the mirror stays off
+    unless VECTOR_MIRROR_EMBEDDING_MODEL names the OpenAI model the index was built with.
+    """
+    model = os.getenv('VECTOR_MIRROR_EMBEDDING_MODEL')
+    if not model:
+        return None
+
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=model)
+
+
+vector_mirrors = VectorMirrorRegistry(
+    directory=os.getenv('VECTOR_MIRROR_DIR', os.path.join(os.path.dirname(__file__), '..', '.vector_mirror')),
+    embeddings=get_mirror_embeddings(),
+    max_age_seconds=float(os.getenv('VECTOR_MIRROR_MAX_AGE_SECONDS', '3600')),
+)
+
+add_namespace_listener(vector_mirrors.on_namespace_change)
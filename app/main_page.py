@@ -11,12 +11,13 @@ env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 load_dotenv(dotenv_path=env_path, override=True)
 
 from state import State
-from utils.python_utils import handle_audio_data
+from utils.python_utils import handle_audio_data, handle_audio_chunk
 from utils.js_utils import audio_and_lenght_recording_utils
 from utils.custom_css import slide_up_bounce, message_hover_animation, pulse_custom
-from components.user_db import get_shop_information
+from components.user_db import shop_config_cache
 from components.chat_message import Message
 from components.chat_input import ChatInput
+from components.audio_upload import AudioUploadSession
 
 import admin_page
 
@@ -41,7 +42,7 @@ async def page(shop_name : str, request: Request):
     if shop_name is None:
         return
 
-    shop_information = await run.io_bound(get_shop_information, shop_name)
+    shop_information = await shop_config_cache.get(shop_name)
     if (
         not shop_information 
         or shop_information.disabled 
@@ -54,7 +55,6 @@ async def page(shop_name : str, request: Request):
     ui.add_head_html(slide_up_bounce)
     ui.add_head_html(audio_and_lenght_recording_utils)
     ui.add_head_html(pulse_custom)
-    ui.on('audio_data', lambda e: handle_audio_data(event=e, client_state=client_state, chat_input=chat_input))
 
     ui.add_css(r'a:link, a:visited {color: inherit !important; text-decoration: none; font-weight: 500}')
     ui.query('.q-page').classes('flex')
@@ -90,6 +90,12 @@ async def page(shop_name : str, request: Request):
         openai_chat_prompt=shop_information.openai_chat_prompt,
         openai_speech_prompt=shop_information.openai_speech_prompt,
         player_pop_up=player_pop_up,
+        chat_token_budget=shop_information.chat_token_budget,
+        chat_router_mode=shop_information.chat_router_mode,
+        chat_router_keywords=shop_information.chat_router_keywords,
+        context_token_budget=shop_information.context_token_budget,
+        vector_db_backend=shop_information.vector_db_backend,
+        stt_correction_policy=shop_information.stt_correction_policy,
     )
     await client_state.initialize()
         
@@ -112,17 +118,30 @@ async def page(shop_name : str, request: Request):
     message_container = ui.column().classes('w-full max-w-2xl mx-auto flex-grow items-stretch')
     with message_container:
         response_first_message = Message(avatar='/icon/bot_icon.png', name=shop_information.bot_name, stamp=client_state.get_time_stamp(), sent=False, client_state=client_state).classes(message_hover_animation)
-        response_first_text = ''
-        async for i in client_state.stream_manual_message(message=shop_information.first_message):
-            response_first_text += i
-            with response_first_message.add_slot('default'):
-                response_first_message.stored_text = response_first_text
-                ui.markdown(response_first_text)
+        response_first_message.type_text(shop_information.first_message or '')
 
     # -------------------------- Footer section -------------------------- #
     with ui.footer(bordered=True).classes('bg-white').style('animation: slideUpBounce 0.5s ease-in-out forwards;'), ui.column(align_items='center').classes('w-full max-w-3xl mx-auto'):
         chat_input =  ChatInput(message_container=message_container, shop_information=shop_information, client_state=client_state)
 
+    # Recordings are uploaded as raw bytes to this session's /audio route
+    client_state.audio_upload = AudioUploadSession(
+        on_audio=lambda audio, mime_type, duration, recording_id: handle_audio_data(
+            audio=audio,
+            mime_type=mime_type,
+            audio_length=duration,
+            client_state=client_state,
+            chat_input=chat_input,
+            recording_id=recording_id,
+        ),
+        on_chunk=lambda recording_id, chunk, mime_type: handle_audio_chunk(
+            recording_id=recording_id,
+            chunk=chunk,
+            client_state=client_state,
+            chat_input=chat_input,
+        ),
+    )
+
 
 if __name__ in {"__main__", "__mp_main__"}:
     ui.run(reload=True, port=408, storage_secret=os.getenv('NICEGUI_SECRET_KEY'), language='ja')
\ No newline at end of file
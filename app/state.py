@@ -1,85 +1,236 @@
+import os
 import asyncio
+import logging
 from uuid import uuid4
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from typing import Dict, List, Optional, Tuple
 
-from nicegui import ui, binding
+from nicegui import ui, app, binding
 
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AIMessage, SystemMessage
 from langchain_core.tools import tool
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.runnables import RunnableConfig
+from langchain.docstore.document import Document
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.graph import END, StateGraph, MessagesState
+from langgraph.graph import END, START, StateGraph, MessagesState
 from langchain_openai import ChatOpenAI
 
-from components.vector_db import get_vector_store
+from components.vector_db import get_vector_store, set_namespace_backend, aclose_vector_backends
+from components.checkpoint_store import BoundedCheckpointSaver
+from components.answer_cache import answer_cache
+from components.retrieval_cache import retrieval_cache
+from components.query_router import QueryRouter, build_retrieval_query
+from components.keyword_index import keyword_indexes, reciprocal_rank_fusion
+from components.vector_mirror import vector_mirrors
+from components.context_assembly import DEFAULT_CONTEXT_TOKEN_BUDGET, assemble_context
+from components.text_embedding import text_similarity
+from components.conversation_window import (
+    DEFAULT_CHAT_TOKEN_BUDGET,
+    token_counter,
+    count_messages_to_fold,
+    summarize_messages,
+)
+
+logger = logging.getLogger(__name__)
 
 # Create a ZoneInfo object for Japan Standard Time
 japan_tz = ZoneInfo("Asia/Tokyo")
 
-class State:
+# One checkpointer for the whole process, conversations are separated by thread_id
+checkpoint_saver = BoundedCheckpointSaver(
+    memory_budget_bytes=int(os.getenv('CHECKPOINT_MEMORY_BUDGET_MB', '256')) * 1024 * 1024,
+    idle_ttl_seconds=float(os.getenv('CHECKPOINT_IDLE_TTL_SECONDS', '3600')),
+    sqlite_path=os.getenv('CHECKPOINT_SQLITE_PATH') or None,
+)
+app.on_shutdown(checkpoint_saver.close)
+app.on_shutdown(aclose_vector_backends)
+
+# Start the vector search on the raw question while query_or_respond is thinking
+SPECULATIVE_RETRIEVAL = os.getenv('SPECULATIVE_RETRIEVAL', 'true').lower() == 'true'
+# How close the model's rewritten query must stay to the raw question to reuse the search
+SPECULATIVE_QUERY_SIMILARITY = float(os.getenv('SPECULATIVE_QUERY_SIMILARITY', '0.75'))
+
+class ChatState(MessagesState):
+    # Rolling summary of the conversation messages that fell out of the token budget
+    summary: str
+    # Number of conversation messages already folded into the summary
+    summary_index: int
+
+class ShopGraph:
+    """Compiled LangGraph of one shop, shared by every chat session of that shop."""
     llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, top_p=0.1)
 
     def __init__(
-            self, shop_name : str, 
+            self, shop_name : str,
             vector_db_namespace : str,
-            openai_chat_prompt : str, 
-            openai_speech_prompt : str,
-            player_pop_up: ui.refreshable,
+            openai_chat_prompt : str,
+            memory : BaseCheckpointSaver,
+            chat_token_budget : Optional[int] = None,
+            chat_router_mode : Optional[str] = None,
+            chat_router_keywords : Optional[str] = None,
+            context_token_budget : Optional[int] = None,
+            vector_db_backend : Optional[str] = None,
         ) -> None:
         self.shop_name = shop_name
+        self.vector_db_namespace = vector_db_namespace
         self.openai_chat_prompt = openai_chat_prompt
-        self.openai_speech_prompt = openai_speech_prompt
+        self.chat_token_budget = chat_token_budget or DEFAULT_CHAT_TOKEN_BUDGET
+        self.context_token_budget = context_token_budget or DEFAULT_CONTEXT_TOKEN_BUDGET
+        self.router = QueryRouter.from_config(mode=chat_router_mode, keywords=chat_router_keywords)
 
+        set_namespace_backend(vector_db_namespace, vector_db_backend)
         self.vector_db_object = get_vector_store(namespace = vector_db_namespace)
-        
-        self.memory = MemorySaver()
-        self.memory_config = {"configurable": {"thread_id": str(uuid4())}}
+        self.memory = memory
 
-        self.last_text_from_speech = ''
-        self.is_recording =  False
-
-        self.player_pop_up = player_pop_up
+        # thread_id -> (raw question, search started for it) of the running turn
+        self.speculative_searches: Dict[str, Tuple[str, asyncio.Future]] = {}
 
         @tool(response_format="content_and_artifact")
-        async def retrieve(query: str):
+        async def retrieve(query: str, config: RunnableConfig):
             """Retrieve information related to a query."""
-            retrieved_docs = await self.vector_db_object.asimilarity_search(query=query, k=10)
-            serialized = "\n\n".join(
-                f"Source: {doc.metadata}\nContent: {doc.page_content}"
-                for doc in retrieved_docs
-            )
-            return serialized, retrieved_docs
-        
+            speculative = self.speculative_searches.pop(config["configurable"]["thread_id"], None)
+            retrieved_docs = None
+            if speculative and text_similarity(query, speculative[0]) >= SPECULATIVE_QUERY_SIMILARITY:
+                try:
+                    retrieved_docs = await speculative[1]
+                except Exception:
+                    logger.warning("Speculative search failed, searching again", exc_info=True)
+            elif speculative:
+                # The rewritten query diverged, the search on the raw question is not needed
+                speculative[1].cancel()
+            if retrieved_docs is None:
+                retrieved_docs = await self.search_documents(query)
+
+            # Deduplicated, compact and within the shop's context budget
+            context = assemble_context(retrieved_docs, token_budget=self.context_token_budget)
+            return context.text, context.documents
+
         self.retrieve = retrieve
 
 
     async def initialize(self):
         self.graph = await self.build_graph()
-    
 
-    def toggle_recording_status(self):
-        self.is_recording = not self.is_recording
 
+    async def search_documents(self, query: str, k: int = 10) -> List[Tuple[Document, float]]:
+        vector_search = asyncio.ensure_future(retrieval_cache.get_or_fetch(
+            namespace=self.vector_db_namespace,
+            query=query,
+            k=k,
+            fetch=lambda: self.vector_search(query=query, k=k),
+        ))
 
-    async def get_current_conversation(self, app):
-        state = await app.aget_state(self.memory_config).values
-        serialized = "\n\n".join(message for message in state["messages"])
+        # The local keyword search runs while the vector search is on the network
+        keyword_index = keyword_indexes.get(self.vector_db_namespace)
+        keyword_docs = [doc for doc, score in keyword_index.search(query, k=k)] if keyword_index else []
 
-        return serialized
+        return reciprocal_rank_fusion([await vector_search, keyword_docs], k=k)
+
+
+    async def vector_search(self, query: str, k: int):
+        # The local mirror answers when it is fresh, Upstash stays the source of truth
+        mirror_docs = await vector_mirrors.search(self.vector_db_namespace, query, k)
+        if mirror_docs is not None:
+            return mirror_docs
+        return await self.vector_db_object.asimilarity_search(query=query, k=k)
+
+
+    async def window_conversation(self, state: ChatState):
+        """
+        Keep the conversation inside the shop's token budget.
+        Messages falling out of the budget are folded into the rolling summary once,
+        later turns only pay for the messages added since.
+        """
+        conversation_messages = [
+            message
+            for message in state["messages"]
+            if message.type in ("human", "system")
+            or (message.type == "ai" and not message.tool_calls)
+        ]
+
+        summary = state.get("summary", "")
+        summary_index = state.get("summary_index", 0)
+        recent_messages = conversation_messages[summary_index:]
+
+        fold_count = count_messages_to_fold(
+            recent_messages,
+            token_budget=self.chat_token_budget,
+            reserved_tokens=token_counter.count_text(summary),
+        )
+        state_update = {}
+        if fold_count:
+            summary = await summarize_messages(self.llm, summary, recent_messages[:fold_count])
+            summary_index += fold_count
+            recent_messages = recent_messages[fold_count:]
+            state_update = {"summary": summary, "summary_index": summary_index}
+
+        if summary:
+            recent_messages = [SystemMessage(f"これまでの会話の要約:\n{summary}")] + recent_messages
+
+        return recent_messages, state_update
+
+
+    def route_query(self, state: ChatState) -> str:
+        """Pick the first node of the turn without calling the LLM when possible."""
+        decision = self.router.route(state["messages"][-1].content)
+        if decision == 'retrieve':
+            return "retrieve_directly"
+        if decision == 'respond':
+            return "generate"
+        return "query_or_respond"
+
+
+    # Generate the retrieve tool call locally, the tools node runs it as usual.
+    async def retrieve_directly(self, state: ChatState):
+        """Generate tool call for retrieval from the customer's question."""
+        questions = [message.content for message in state["messages"] if message.type == "human"]
+        response = AIMessage(
+            content="",
+            tool_calls=[{
+                "name": self.retrieve.name,
+                "args": {"query": build_retrieval_query(questions)},
+                "id": f"call_{uuid4().hex}",
+                "type": "tool_call",
+            }],
+        )
+        return {"messages": [response]}
 
 
     # Generate an AIMessage that may include a tool-call to be sent.
-    async def query_or_respond(self, state: MessagesState):
+    async def query_or_respond(self, state: ChatState, config: RunnableConfig):
         """Generate tool call for retrieval or respond."""
-        llm_with_tools = self.llm.bind_tools([self.retrieve])
-        response = await llm_with_tools.ainvoke(state["messages"])
+        thread_id = config["configurable"]["thread_id"]
+        if SPECULATIVE_RETRIEVAL:
+            question = state["messages"][-1].content
+            search = asyncio.ensure_future(self.search_documents(question))
+            # Nobody awaits the search when the model answers directly
+            search.add_done_callback(lambda future: future.cancelled() or future.exception())
+            previous = self.speculative_searches.pop(thread_id, None)
+            if previous:
+                previous[1].cancel()
+            self.speculative_searches[thread_id] = (question, search)
+
+        response = None
+        try:
+            conversation_messages, state_update = await self.window_conversation(state)
+
+            llm_with_tools = self.llm.bind_tools([self.retrieve])
+            response = await llm_with_tools.ainvoke(conversation_messages)
+        finally:
+            # The search is only kept for the retrieve call that follows
+            if response is None or not response.tool_calls:
+                speculative = self.speculative_searches.pop(thread_id, None)
+                if speculative:
+                    speculative[1].cancel()
+
         # MessagesState appends messages to state instead of overwriting
-        return {"messages": [response]}
+        return {"messages": [response], **state_update}
 
 
     # Generate a response using the retrieved content.
-    async def generate(self, state: MessagesState):
+    async def generate(self, state: ChatState):
         """Generate answer."""
         # Get generated ToolMessages
         recent_tool_messages = []
@@ -99,30 +250,31 @@ class State:
         {docs_content}
         """
 
-        conversation_messages = [
-            message
-            for message in state["messages"]
-            if message.type in ("human", "system")
-            or (message.type == "ai" and not message.tool_calls)
-        ]
+        conversation_messages, state_update = await self.window_conversation(state)
         prompt = [SystemMessage(system_message_content)] + conversation_messages
 
         # Run
         response = await self.llm.ainvoke(prompt)
-        return {"messages": [response]}
-    
+        return {"messages": [response], **state_update}
+
 
     async def build_graph(self):
         # Execute the retrieval.
         tools = ToolNode([self.retrieve])
 
-        graph_builder = StateGraph(MessagesState)
+        graph_builder = StateGraph(ChatState)
 
+        graph_builder.add_node(self.retrieve_directly)
         graph_builder.add_node(self.query_or_respond)
         graph_builder.add_node(tools)
         graph_builder.add_node(self.generate)
 
-        graph_builder.set_entry_point("query_or_respond")
+        graph_builder.add_conditional_edges(
+            START,
+            self.route_query,
+            ["retrieve_directly", "query_or_respond", "generate"],
+        )
+        graph_builder.add_edge("retrieve_directly", "tools")
         graph_builder.add_conditional_edges(
             "query_or_respond",
             tools_condition,
@@ -134,15 +286,125 @@ class State:
         graph = graph_builder.compile(checkpointer=self.memory)
 
         return graph
-    
+
+
+class GraphRegistry:
+    """
+    Process-wide registry holding one compiled graph per shop.
+
+    A shop's graph is rebuilt only when its prompt or namespace in Supabase differs
+    from the one it was compiled with. Every graph shares the same checkpointer,
+    so open conversations keep their history across rebuilds.
+    """
+    def __init__(self, memory : BaseCheckpointSaver) -> None:
+        self.memory = memory
+        self.graphs: Dict[str, Tuple[tuple, ShopGraph]] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    async def get_graph(self, shop_name : str, **graph_options) -> ShopGraph:
+        """Return the graph of a shop, `graph_options` are the ShopGraph settings read from Supabase."""
+        fingerprint = tuple(sorted(graph_options.items()))
+
+        cached = self.graphs.get(shop_name)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        # Only one coroutine compiles the graph when many visitors arrive at once
+        lock = self.locks.setdefault(shop_name, asyncio.Lock())
+        async with lock:
+            cached = self.graphs.get(shop_name)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+            if cached:
+                # The answers of the old prompt have their own scope and are never served again,
+                # drop them instead of waiting for them to expire
+                answer_cache.drop_shop(shop_name)
+
+            shop_graph = ShopGraph(shop_name=shop_name, memory=self.memory, **graph_options)
+            await shop_graph.initialize()
+            self.graphs[shop_name] = (fingerprint, shop_graph)
+
+        return shop_graph
+
+    def invalidate(self, shop_name : Optional[str] = None) -> None:
+        """Drop the compiled graph of a shop (or of every shop) so it is rebuilt on next use."""
+        if shop_name is None:
+            self.graphs.clear()
+        else:
+            self.graphs.pop(shop_name, None)
+
+
+graph_registry = GraphRegistry(memory=checkpoint_saver)
+
+
+class State:
+    def __init__(
+            self, shop_name : str,
+            vector_db_namespace : str,
+            openai_chat_prompt : str,
+            openai_speech_prompt : str,
+            player_pop_up: ui.refreshable,
+            chat_token_budget : Optional[int] = None,
+            chat_router_mode : Optional[str] = None,
+            chat_router_keywords : Optional[str] = None,
+            context_token_budget : Optional[int] = None,
+            vector_db_backend : Optional[str] = None,
+            stt_correction_policy : Optional[str] = None,
+        ) -> None:
+        self.shop_name = shop_name
+        self.vector_db_namespace = vector_db_namespace
+        self.openai_chat_prompt = openai_chat_prompt
+        self.openai_speech_prompt = openai_speech_prompt
+        self.chat_token_budget = chat_token_budget
+        self.chat_router_mode = chat_router_mode
+        self.chat_router_keywords = chat_router_keywords
+        self.context_token_budget = context_token_budget
+        self.vector_db_backend = vector_db_backend
+        self.stt_correction_policy = stt_correction_policy
+
+        # Each session only owns its thread, the graph itself is shared per shop
+        self.memory_config = {"configurable": {"thread_id": str(uuid4())}}
+
+        self.last_text_from_speech = ''
+        self.is_recording =  False
+        self.answered_turns = 0
+        # AudioUploadSession of the page, keeps its upload route alive
+        self.audio_upload = None
+        # IncrementalTranscriber of the recording in progress
+        self.transcriber = None
+
+        self.player_pop_up = player_pop_up
+
+
+    async def initialize(self):
+        self.shop_graph = await graph_registry.get_graph(
+            shop_name=self.shop_name,
+            vector_db_namespace=self.vector_db_namespace,
+            openai_chat_prompt=self.openai_chat_prompt,
+            chat_token_budget=self.chat_token_budget,
+            chat_router_mode=self.chat_router_mode,
+            chat_router_keywords=self.chat_router_keywords,
+            context_token_budget=self.context_token_budget,
+            vector_db_backend=self.vector_db_backend,
+        )
+        self.graph = self.shop_graph.graph
+        self.memory = self.shop_graph.memory
+
+
+    def toggle_recording_status(self):
+        self.is_recording = not self.is_recording
+
+
+    async def get_current_conversation(self, app):
+        state = await app.aget_state(self.memory_config).values
+        serialized = "\n\n".join(message for message in state["messages"])
+
+        return serialized
+
+
     def get_time_stamp(self) -> str:
         # Get the current time in Japan
         now_in_japan = datetime.now(japan_tz)
         time_str = now_in_japan.strftime("%H:%M")
-        
-        return time_str
 
-    async def stream_manual_message(self, message : str):
-        for i in message:
-            yield i
-            await asyncio.sleep(0.06)
\ No newline at end of file
+        return time_str
@@ -2,7 +2,8 @@ audio_and_lenght_recording_utils = """
 <script>
 let mediaRecorder;
 let mediaStream;
-let chunks = [];
+let uploadQueue = Promise.resolve();
+let recordingStartedAt = 0;
 
 // Detect iOS Safari
 const isIOSSafari = /iP(ad|hone|od)/.test(navigator.userAgent)
@@ -14,7 +15,15 @@ if (isIOSSafari) {
     mimeType = 'audio/mp4';
 }
 
-async function startRecording() {
+function postAudio(url, body) {
+    return fetch(url, { method: 'POST', body, headers: { 'Content-Type': 'application/octet-stream' } })
+        .then(response => {
+            if (!response.ok) throw new Error(`Audio upload failed with status ${response.status}`);
+        });
+}
+
+// uploadUrl is the /audio/{token} route of this chat session
+async function startRecording(uploadUrl) {
     mediaStream = await navigator.mediaDevices.getUserMedia({ audio: true });
 
     let options = { mimeType };
@@ -24,24 +33,32 @@ async function startRecording() {
     }
 
     mediaRecorder = new MediaRecorder(mediaStream, options);
-    chunks = [];
+    const recordingMimeType = mediaRecorder.mimeType || mimeType;
+    const recordingId = window.crypto && crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    let seq = 0;
+    uploadQueue = Promise.resolve();
 
+    // Raw chunks are uploaded one after another while recording, no base64 and no socket message
     mediaRecorder.ondataavailable = e => {
-        if (e.data.size > 0) chunks.push(e.data);
+        if (e.data.size === 0) return;
+        const chunk = e.data;
+        const index = seq++;
+        uploadQueue = uploadQueue.then(() => postAudio(`${uploadUrl}/${recordingId}/chunks/${index}?mime_type=${encodeURIComponent(recordingMimeType)}`, chunk));
     };
 
-    mediaRecorder.onstop = async () => {
-        const blob = new Blob(chunks, { type: mimeType });
-        const base64 = await blobToBase64(blob);
-        const duration = await getAudioDuration(blob);
-
+    mediaRecorder.onstop = () => {
+        const duration = (performance.now() - recordingStartedAt) / 1000;
         // Include the mimeType so Python knows how to decode
-        emitEvent('audio_data', { audio: base64, duration, mimeType });
-        console.log(`Audio data emitted. Duration: ${duration}, MIME: ${mimeType}`);
+        const params = new URLSearchParams({ mime_type: recordingMimeType, duration });
+        uploadQueue = uploadQueue
+            .then(() => postAudio(`${uploadUrl}/${recordingId}/finish?${params}`))
+            .then(() => console.log(`Audio uploaded. Duration: ${duration}, MIME: ${recordingMimeType}`))
+            .catch(error => console.error(error));
     };
 
-    mediaRecorder.start();
-    console.log(`Recording started with mimeType: ${mimeType}`);
+    recordingStartedAt = performance.now();
+    mediaRecorder.start(1000);
+    console.log(`Recording started with mimeType: ${recordingMimeType}`);
 }
 
 function stopRecording() {
@@ -52,28 +69,5 @@ function stopRecording() {
         }
     }
 }
-
-async function blobToBase64(blob) {
-    return new Promise((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onloadend = () => resolve(reader.result.split(',')[1]);
-        reader.onerror = reject;
-        reader.readAsDataURL(blob);
-    });
-}
-
-async function getAudioDuration(blob) {
-    return new Promise((resolve, reject) => {
-        const audioContext = new (window.AudioContext || window.webkitAudioContext)();
-        const reader = new FileReader();
-        reader.onloadend = () => {
-            audioContext.decodeAudioData(reader.result, (audioBuffer) => {
-                resolve(audioBuffer.duration);
-            }, reject);
-        };
-        reader.onerror = reject;
-        reader.readAsArrayBuffer(blob);
-    });
-}
 </script>
 """
\ No newline at end of file
@@ -1,15 +1,42 @@
+import os
+import asyncio
 import re
-import base64
+import time
+import queue
+import logging
+import threading
+import subprocess
 from io import BytesIO
 from datetime import datetime
+from typing import Callable, List, Literal, Optional, Tuple
 
+import numpy as np
 from pydub import AudioSegment
-from nicegui import run, events
+from nicegui import run, ui
 
-from components.openai_speech_to_text import generate_corrected_transcript
+from components.openai_speech_to_text import generate_corrected_transcript, transcribe_file, correct_transcript
 from state import State
 from components.chat_input import ChatInput
 
+logger = logging.getLogger(__name__)
+
+# How recordings are sent to Whisper: passthrough, flac, opus or smallest
+STT_AUDIO_POLICY = os.getenv('STT_AUDIO_POLICY', 'smallest')
+# Length of the segments transcribed while the user is still speaking, 0 transcribes only at the end
+STT_STREAMING_SEGMENT_SECONDS = float(os.getenv('STT_STREAMING_SEGMENT_SECONDS', '6'))
+# Longer recordings are split at pauses into pieces of at most this length and transcribed in parallel, 0 never splits
+STT_SPLIT_SECONDS = float(os.getenv('STT_SPLIT_SECONDS', '20'))
+# Voice activity detection: frames this far above the noise floor (and above the absolute minimum) are speech
+STT_VAD_MARGIN_DB = float(os.getenv('STT_VAD_MARGIN_DB', '12'))
+STT_VAD_MIN_DB = float(os.getenv('STT_VAD_MIN_DB', '-50'))
+# Voiced frames at least this loud are speech whatever the noise floor
+STT_VAD_SPEECH_DB = float(os.getenv('STT_VAD_SPEECH_DB', '-35'))
+# Recordings with less speech than this and no frame reaching STT_VAD_SPEECH_DB are not sent to Whisper at all
+STT_VAD_MIN_SPEECH_SECONDS = float(os.getenv('STT_VAD_MIN_SPEECH_SECONDS', '0.3'))
+SPEECH_SAMPLE_RATE = 16000
+# 30 ms analysis frames
+VAD_FRAME_LENGTH = 480
+
 localeText = {
     "lessThan": "未満(指定の値より小さい)",
     "greaterThan": "指定の値より大きい",
@@ -35,73 +62,529 @@ localeText = {
     "noRowsToShow": "アカウントをダウンロードしてください。"
 }
 
-def convert_base64_to_bytesio(byte_file: bytes, mime_type: str) -> BytesIO:
+def get_audio_extension(mime_type: str) -> str:
+    """File extension of a MediaRecorder mime type, Whisper detects the format from it."""
+    if "mp4" in mime_type:
+        return "mp4"
+    if "ogg" in mime_type:
+        return "ogg"
+    return "webm"
+
+def run_ffmpeg(data: bytes, input_args: List[str], output_args: List[str]) -> bytes:
+    """FFmpeg reading `data` from stdin and writing to stdout, nothing goes through a file."""
+    result = subprocess.run(
+        [AudioSegment.converter, "-hide_banner", "-loglevel", "error", *input_args, "-i", "pipe:0", *output_args, "pipe:1"],
+        input=data,
+        capture_output=True,
+        check=True,
+    )
+    return result.stdout
+
+def get_codec_args(codec: Literal["flac", "opus"]) -> List[str]:
+    if codec == "flac":
+        return ["-c:a", "flac", "-f", "flac"]
+    return ["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"]
+
+def encode_speech_audio(audio: bytes, codec: Literal["flac", "opus"]) -> bytes:
+    """Downmix to 16 kHz mono (what Whisper works with) and encode to FLAC or Opus."""
+    return run_ffmpeg(audio, [], ["-ac", "1", "-ar", str(SPEECH_SAMPLE_RATE), *get_codec_args(codec)])
+
+def decode_speech_pcm(audio: bytes) -> np.ndarray:
     """
-    Convert raw base64 data into a BytesIO with the correct file extension
-    based on the mime_type from the browser.
+    16 kHz mono float samples of a recording. A recording still being uploaded decodes
+    up to its last complete frame, later MediaRecorder chunks only make sense after the first one.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    # Decide extension based on mime type
-    ext = "webm"
-    if "mp4" in mime_type:
-        ext = "mp4"
+    try:
+        pcm = run_ffmpeg(audio, [], ["-ac", "1", "-ar", str(SPEECH_SAMPLE_RATE), "-f", "s16le"])
+    except subprocess.CalledProcessError as error:
+        # Truncated input still yields the samples decoded before the error
+        pcm = error.stdout or b""
+    return np.frombuffer(pcm[:len(pcm) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768
+
+class StreamingSpeechDecoder:
+    """
+    One FFmpeg process decoding a recording to 16 kHz mono samples while its chunks arrive.
+
+    MediaRecorder chunks after the first cannot be decoded on their own, so instead of
+    decoding the whole recording again for every chunk, each chunk is written once to the
+    stdin of a running FFmpeg and a reader thread collects the samples it outputs. Samples
+    before the position passed to `release` are dropped. If no chunk arrives for
+    `idle_seconds`, the recording was abandoned and FFmpeg is stopped.
+    """
+    def __init__(self, idle_seconds: float = 30) -> None:
+        self.process = subprocess.Popen(
+            [
+                AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-analyzeduration", "0", "-i", "pipe:0",
+                "-ac", "1", "-ar", str(SPEECH_SAMPLE_RATE), "-f", "s16le", "-flush_packets", "1", "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.idle_seconds = idle_seconds
+        self.chunks: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self.pcm = bytearray()
+        # Sample index of pcm[0]
+        self.offset = 0
+        self.pcm_lock = threading.Lock()
+        self.writer = threading.Thread(target=self.write_chunks, name="speech-decoder-writer", daemon=True)
+        self.reader = threading.Thread(target=self.read_samples, name="speech-decoder-reader", daemon=True)
+        self.writer.start()
+        self.reader.start()
+
+    def write_chunks(self) -> None:
+        try:
+            while True:
+                try:
+                    chunk = self.chunks.get(timeout=self.idle_seconds)
+                except queue.Empty:
+                    logger.info("No audio for %.0f s, stopping the speech decoder", self.idle_seconds)
+                    break
+                if chunk is None:
+                    break
+                self.process.stdin.write(chunk)
+                self.process.stdin.flush()
+        except OSError:
+            # FFmpeg gave up on the input, the samples decoded so far are kept
+            logger.warning("Speech decoder stopped reading", exc_info=True)
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+    def read_samples(self) -> None:
+        while data := self.process.stdout.read1(1 << 16):
+            with self.pcm_lock:
+                self.pcm.extend(data)
+
+    @property
+    def decoded_samples(self) -> int:
+        return self.offset + len(self.pcm) // 2
+
+    def feed(self, chunk: bytes) -> None:
+        """Queue the next chunk of the recording, in upload order."""
+        self.chunks.put(chunk)
+
+    def get_samples(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Float samples `start:end` of the recording decoded so far, only that part is copied."""
+        with self.pcm_lock:
+            stop = len(self.pcm) // 2 if end is None else min(end - self.offset, len(self.pcm) // 2)
+            pcm = bytes(self.pcm[max(start - self.offset, 0) * 2:stop * 2])
+        return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768
+
+    def release(self, position: int) -> None:
+        """Drop the samples before `position`, they are not read again."""
+        with self.pcm_lock:
+            del self.pcm[:max(position - self.offset, 0) * 2]
+            self.offset = max(position, self.offset)
+
+    def close(self, timeout: float = 30) -> None:
+        """Wait until FFmpeg has decoded every chunk fed so far. Blocking, run it in a thread."""
+        self.chunks.put(None)
+        self.writer.join()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.reader.join()
+
+    def cancel(self) -> None:
+        """Stop decoding without waiting for the rest."""
+        self.chunks.put(None)
+        self.process.kill()
 
-    file_name = f"audio_{timestamp}.{ext}"
-    audio_content = base64.b64decode(byte_file)
-    audio_file = BytesIO(audio_content)
-    audio_file.name = file_name
+def get_speech_codec(policy: str) -> Literal["flac", "opus"]:
+    """Codec of re-encoded speech under an STT_AUDIO_POLICY, Opus unless FLAC is asked for."""
+    return "flac" if policy == "flac" else "opus"
+
+def encode_speech_pcm(samples: np.ndarray, codec: Literal["flac", "opus"] = "opus") -> BytesIO:
+    """Encode 16 kHz mono samples into a file Whisper accepts."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes()
+    data = run_ffmpeg(pcm, ["-f", "s16le", "-ar", str(SPEECH_SAMPLE_RATE), "-ac", "1"], get_codec_args(codec))
+    audio_file = BytesIO(data)
+    audio_file.name = f"segment.{'flac' if codec == 'flac' else 'ogg'}"
     return audio_file
 
-def convert_to_wav(in_file: BytesIO, mime_type: str) -> BytesIO:
+def get_frames(samples: np.ndarray, frame_length: int = VAD_FRAME_LENGTH) -> np.ndarray:
+    """Non-overlapping frames as rows of a view, the incomplete last frame is left out."""
+    frame_count = len(samples) // frame_length
+    return samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+
+def get_frame_energy_db(frames: np.ndarray) -> np.ndarray:
+    return 10 * np.log10(np.square(frames).mean(axis=1) + 1e-10)
+
+def find_pause(samples: np.ndarray, start: int, end: int, frame_length: int = VAD_FRAME_LENGTH) -> int:
+    """Sample index of the quietest 30 ms frame between `start` and `end`, where a segment can be cut."""
+    frames = get_frames(samples[start:end], frame_length)
+    if not len(frames):
+        return end
+    return start + int(np.argmin(get_frame_energy_db(frames))) * frame_length + frame_length // 2
+
+def detect_speech_frames(
+    samples: np.ndarray,
+    margin_db: float = STT_VAD_MARGIN_DB,
+    min_db: float = STT_VAD_MIN_DB,
+    speech_db: float = STT_VAD_SPEECH_DB,
+    hangover_frames: int = 7,
+) -> np.ndarray:
     """
-    Use pydub + FFmpeg to convert the input file to .wav.
-    The 'format' param depends on the mime_type from the front end.
+    Speech mask of the 30 ms frames of 16 kHz samples, from frame energy and zero-crossing rate.
+
+    Voiced frames cross zero rarely (broadband noise such as breath or wind crosses zero
+    about every other sample) and are either loud relative to the recording's noise floor
+    (its 5th energy percentile) or above `speech_db` outright. The margin above the floor
+    shrinks to half the spread between quiet and loud frames, since a recording that is
+    speech throughout or speech close to the noise level has no 12 dB of room above it.
+    Quieter frames with many crossings are unvoiced consonants (s, sh, f), which only count
+    within `hangover_frames` of voiced speech.
     """
-    in_file.seek(0)
+    frames = get_frames(samples)
+    if not len(frames):
+        return np.zeros(0, dtype=bool)
 
-    # map our mime_type to pydub's format argument
-    if "mp4" in mime_type:
-        pydub_format = "mp4"
-    else:
-        pydub_format = "webm"
+    energy_db = get_frame_energy_db(frames)
+    signs = np.signbit(frames)
+    zero_crossing_rate = (signs[:, 1:] != signs[:, :-1]).mean(axis=1)
+
+    noise_floor, loud = np.percentile(energy_db, [5, 95])
+    margin = min(margin_db, max(float(loud - noise_floor) / 2, 3))
+    threshold = max(float(noise_floor) + margin, min_db)
+    voiced = ((energy_db > threshold) | (energy_db > speech_db)) & (zero_crossing_rate < 0.35)
+    unvoiced = (energy_db > threshold - 6) & (zero_crossing_rate >= 0.2)
+
+    # Frames within the hangover of a voiced frame, on either side
+    near_voiced = np.convolve(voiced, np.ones(2 * hangover_frames + 1), mode='same') > 0
+    return voiced | (unvoiced & near_voiced)
+
+def get_speech_segments(
+    samples: np.ndarray,
+    min_speech_seconds: float = 0.09,
+    min_pause_seconds: float = 0.3,
+    padding_seconds: float = 0.15,
+) -> List[Tuple[int, int]]:
+    """
+    Sample ranges of the speech in 16 kHz samples. Bursts shorter than `min_speech_seconds`
+    (clicks) are dropped, pauses shorter than `min_pause_seconds` do not split a segment, and
+    each segment is padded so the edges of words are kept.
+    """
+    speech = detect_speech_frames(samples)
+    edges = np.flatnonzero(np.diff(np.r_[0, speech.astype(np.int8), 0]))
+    starts, ends = edges[::2], edges[1::2]
+
+    seconds_per_frame = VAD_FRAME_LENGTH / SPEECH_SAMPLE_RATE
+    keep = (ends - starts) * seconds_per_frame >= min_speech_seconds
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts):
+        return []
+
+    # A new segment starts after every long enough pause
+    new_segment = np.r_[True, (starts[1:] - ends[:-1]) * seconds_per_frame >= min_pause_seconds]
+    starts = starts[new_segment]
+    ends = ends[np.r_[new_segment[1:], True]]
+
+    padding = int(padding_seconds * SPEECH_SAMPLE_RATE)
+    return [
+        (max(int(start) * VAD_FRAME_LENGTH - padding, 0), min(int(end) * VAD_FRAME_LENGTH + padding, len(samples)))
+        for start, end in zip(starts, ends)
+    ]
+
+def get_speech_seconds(segments: List[Tuple[int, int]]) -> float:
+    return sum(end - start for start, end in segments) / SPEECH_SAMPLE_RATE
+
+def is_silent(samples: np.ndarray, max_db: float = STT_VAD_SPEECH_DB) -> bool:
+    """True when no 30 ms frame reaches `max_db`, nothing in it can be speech worth a Whisper call."""
+    frames = get_frames(samples)
+    return not len(frames) or float(get_frame_energy_db(frames).max()) < max_db
+
+def get_speech_range(samples: np.ndarray, max_silent_db: float = STT_VAD_SPEECH_DB) -> List[Tuple[int, int]]:
+    """
+    Speech segments of `samples` to send, empty only when the audio is silent below `max_silent_db`.
+    When the VAD finds too little speech in audio that is not silent, it is unsure and the
+    whole audio is sent instead of rejecting it.
+    """
+    segments = get_speech_segments(samples)
+    if get_speech_seconds(segments) >= STT_VAD_MIN_SPEECH_SECONDS:
+        return segments
+    if is_silent(samples, max_silent_db):
+        return []
+    return [(0, len(samples))]
+
+def split_at_pauses(segments: List[Tuple[int, int]], max_seconds: float = STT_SPLIT_SECONDS) -> List[Tuple[int, int]]:
+    """
+    Group consecutive speech segments into pieces of at most `max_seconds`, cut in the pauses
+    between them. The silence inside a piece is kept, Whisper relies on it for punctuation.
+    A single segment longer than `max_seconds` stays one piece.
+    """
+    if not segments:
+        return []
+    if max_seconds <= 0:
+        return [(segments[0][0], segments[-1][1])]
+
+    max_samples = int(max_seconds * SPEECH_SAMPLE_RATE)
+    pieces = [list(segments[0])]
+    for start, end in segments[1:]:
+        if end - pieces[-1][0] <= max_samples:
+            pieces[-1][1] = end
+        else:
+            pieces.append([start, end])
+    return [(start, end) for start, end in pieces]
+
+class IncrementalTranscriber:
+    """
+    Transcribes one recording segment by segment while its chunks are uploaded.
+
+    Each chunk is decoded once by a StreamingSpeechDecoder, and every complete segment of
+    about `segment_seconds` is sent to Whisper, cut at the quietest point of its last 1.5 s
+    so a word is rarely split. At the end only the remaining tail is left to transcribe.
+    """
+    def __init__(self, recording_id: str, segment_seconds: float = STT_STREAMING_SEGMENT_SECONDS) -> None:
+        self.recording_id = recording_id
+        self.segment_samples = int(segment_seconds * SPEECH_SAMPLE_RATE)
+        self.search_samples = int(1.5 * SPEECH_SAMPLE_RATE)
+        self.committed_samples = 0
+        self.texts: List[str] = []
+        self.lock = asyncio.Lock()
+        try:
+            self.decoder: Optional[StreamingSpeechDecoder] = StreamingSpeechDecoder()
+        except OSError:
+            logger.warning("Starting FFmpeg failed, the recording is only transcribed when it ends", exc_info=True)
+            self.decoder = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.texts)
+
+    async def transcribe_segment(self, samples: np.ndarray) -> None:
+        # The transcriber moves past every segment, so only plain silence is left out and a
+        # segment the VAD is unsure about is sent whole; a word lost here cannot come back
+        segments = get_speech_range(samples, STT_VAD_MIN_DB)
+        if not segments:
+            return
+
+        # A segment only exists as decoded samples, there is no upload to pass through
+        segment_file = await run.io_bound(encode_speech_pcm, samples[segments[0][0]:segments[-1][1]], get_speech_codec(STT_AUDIO_POLICY))
+        # The text so far keeps Whisper consistent across the cuts
+        text = await transcribe_file(segment_file, self.text[-200:])
+        self.texts.append(text.strip())
+
+    async def update(self, chunk: bytes) -> Optional[str]:
+        """
+        Decode the next chunk of the recording; the partial transcript when new segments
+        were transcribed, None otherwise. Chunks must be passed in upload order.
+        """
+        if self.decoder is None:
+            return None
+        self.decoder.feed(chunk)
+        if self.lock.locked():
+            # The running update picks the new samples up on the next chunk
+            return None
 
-    # Load the audio data
-    audio_segment = AudioSegment.from_file(in_file, format=pydub_format)
+        async with self.lock:
+            transcribed = False
+            # A segment is only cut once the audio after it is there too
+            while self.decoder.decoded_samples - self.committed_samples >= self.segment_samples + self.search_samples:
+                samples = self.decoder.get_samples(self.committed_samples, self.committed_samples + self.segment_samples + self.search_samples)
+                cut = find_pause(samples, self.segment_samples - self.search_samples, self.segment_samples)
+                await self.transcribe_segment(samples[:cut])
+                self.committed_samples += cut
+                self.decoder.release(self.committed_samples)
+                transcribed = True
+            return self.text if transcribed else None
 
-    # Export to WAV in memory
-    wav_file = BytesIO()
-    wav_file.name = in_file.name.rsplit(".", 1)[0] + ".wav"
-    audio_segment.export(wav_file, format="wav")
-    wav_file.seek(0)
-    return wav_file
+    async def finish(self) -> str:
+        """Transcribe the tail once every chunk is decoded, the transcript of the whole recording."""
+        async with self.lock:
+            if self.decoder is not None:
+                await run.io_bound(self.decoder.close)
+                await self.transcribe_segment(self.decoder.get_samples(self.committed_samples))
+            return self.text
+
+    def cancel(self) -> None:
+        if self.decoder is not None:
+            self.decoder.cancel()
+
+def prepare_speech_audio(audio: bytes, mime_type: str, duration: float, policy: str = STT_AUDIO_POLICY) -> BytesIO:
+    """
+    Turn an uploaded recording into the file sent to Whisper according to `policy`:
+    - passthrough: the browser's webm/mp4 as is
+    - flac / opus: 16 kHz mono re-encoded with that codec
+    - smallest: the Opus encoding when it is smaller than the upload, the upload otherwise
+    If FFmpeg fails (e.g. an mp4 that cannot be read from a pipe) the upload is sent as is.
+    """
+    extension = get_audio_extension(mime_type)
+    started_at = time.perf_counter()
+
+    data = audio
+    if policy in ("flac", "opus", "smallest"):
+        codec = get_speech_codec(policy)
+        try:
+            encoded = encode_speech_audio(audio, codec)
+        except (OSError, subprocess.CalledProcessError):
+            logger.warning("Encoding speech audio to %s failed, sending the upload as is", codec, exc_info=True)
+            encoded = b""
+
+        if encoded and (policy != "smallest" or len(encoded) < len(audio)):
+            data = encoded
+            extension = "flac" if codec == "flac" else "ogg"
+
+    # Per second of audio, to compare the policies
+    conversion_time = time.perf_counter() - started_at
+    if duration > 0:
+        logger.info(
+            "Speech audio (%s, %s): %d -> %d bytes, %.1f KB and %.3f s of conversion per second of audio",
+            policy, extension, len(audio), len(data), len(data) / 1024 / duration, conversion_time / duration,
+        )
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # BytesIO shares the bytes object until it is written to, no copy here
+    audio_file = BytesIO(data)
+    audio_file.name = f"audio_{timestamp}.{extension}"
+    return audio_file
+
+async def prepare_recording_files(
+    audio: bytes,
+    mime_type: str,
+    duration: float,
+    policy: str = STT_AUDIO_POLICY,
+) -> Optional[List[BytesIO]]:
+    """
+    Files sent to Whisper for a whole recording, None when it is silent.
+
+    The VAD rejects silent recordings under every policy, what is sent follows `policy`:
+    - passthrough: the browser's upload as is
+    - flac / opus: the speech found by the VAD re-encoded with that codec, leading and
+      trailing silence trimmed and recordings longer than STT_SPLIT_SECONDS split at pauses
+      so the pieces can be transcribed in parallel
+    - smallest: like opus, unless the upload as is is smaller
+    Recordings FFmpeg cannot decode go to Whisper as prepared by prepare_speech_audio.
+    """
+    started_at = time.perf_counter()
+    try:
+        samples = await run.io_bound(decode_speech_pcm, audio)
+    except OSError:
+        logger.warning("Decoding speech audio failed, sending it without voice activity detection", exc_info=True)
+        samples = np.zeros(0, dtype=np.float32)
+
+    if not len(samples):
+        return [await run.io_bound(prepare_speech_audio, audio, mime_type, duration, policy)]
+
+    segments = get_speech_range(samples)
+    if not segments:
+        logger.info("No speech in %.1f s of audio, not transcribed", len(samples) / SPEECH_SAMPLE_RATE)
+        return None
+    if policy == "passthrough":
+        return [await run.io_bound(prepare_speech_audio, audio, mime_type, duration, policy)]
+
+    pieces = split_at_pauses(segments)
+    speech_files = await asyncio.gather(*(
+        run.io_bound(encode_speech_pcm, samples[start:end], get_speech_codec(policy)) for start, end in pieces
+    ))
+    size = sum(len(speech_file.getbuffer()) for speech_file in speech_files)
+    if policy == "smallest" and size >= len(audio):
+        return [await run.io_bound(prepare_speech_audio, audio, mime_type, duration, "passthrough")]
+
+    seconds = len(samples) / SPEECH_SAMPLE_RATE
+    logger.info(
+        "Speech audio (%s): %.1f s of %.1f s sent in %d piece(s), %d -> %d bytes, %.1f KB and %.3f s of conversion per second of audio",
+        policy, sum(end - start for start, end in pieces) / SPEECH_SAMPLE_RATE, seconds, len(pieces),
+        len(audio), size, size / 1024 / seconds, (time.perf_counter() - started_at) / seconds,
+    )
+    return speech_files
+
+async def transcribe_recording(
+    audio: bytes,
+    mime_type: str,
+    duration: float,
+    openai_speech_prompt: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    correction_policy: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Corrected transcript of a whole recording, None when it contains no speech.
+    `on_delta` receives the correction while it streams, `correction_policy` is the shop's.
+    The audio is sent as prepared by prepare_recording_files, pieces of a split recording in parallel.
+    """
+    speech_files = await prepare_recording_files(audio, mime_type, duration)
+    if speech_files is None:
+        return None
+
+    if len(speech_files) == 1:
+        return await generate_corrected_transcript(speech_files[0], openai_speech_prompt, on_delta, correction_policy)
+
+    texts = await asyncio.gather(*(transcribe_file(speech_file) for speech_file in speech_files))
+    return await correct_transcript("".join(text.strip() for text in texts), openai_speech_prompt, on_delta, correction_policy)
 
 async def handle_audio_data(
-    event: events.GenericEventArguments, 
+    audio: bytes,
+    mime_type: str,
+    audio_length: float,
     client_state: State,
     chat_input: ChatInput,
+    recording_id: Optional[str] = None,
 ) -> None:
-    """Process and store audio data received from the frontend."""
+    """Process the audio uploaded by the frontend to the session's /audio route."""
 
     chat_input.record_button.props(add='loading disable')
 
-    audio_base64 = event.args.get("audio")
-    audio_length: float = event.args.get("duration")
-    mime_type = event.args.get("mimeType", "audio/webm")  # default to webm if not given
+    transcriber = client_state.transcriber
+    client_state.transcriber = None
+    if transcriber is not None and not (audio and audio_length > 1 and transcriber.recording_id == recording_id and transcriber.texts):
+        # Nothing of this recording was transcribed yet, the whole recording is transcribed below
+        transcriber.cancel()
+        transcriber = None
 
-    if audio_base64:
+    if audio:
         client_state.is_processing_audio = True
 
-        # 1) Convert base64 -> in-memory file
-        original_file = await run.cpu_bound(convert_base64_to_bytesio, audio_base64, mime_type)
-        # 2) Convert in-memory file -> WAV
-        wav_file = await run.cpu_bound(convert_to_wav, original_file, mime_type)
+        # The correction fills the input box while it streams
+        def show_partial_text(text: str) -> None:
+            chat_input.input_question.set_value(value=text)
 
-        if audio_length > 1:
-            # 3) Transcribe the WAV file
-            text_from_speech = await run.io_bound(generate_corrected_transcript, wav_file, client_state.openai_speech_prompt)
+        text_from_speech = None
+        if transcriber is not None:
+            # Segments were transcribed while recording, only the tail and the correction are left
+            transcription_text = await transcriber.finish()
+            text_from_speech = await correct_transcript(
+                transcription_text, client_state.openai_speech_prompt, show_partial_text, client_state.stt_correction_policy,
+            )
+        elif audio_length > 1:
+            text_from_speech = await transcribe_recording(
+                audio, mime_type or "audio/webm", audio_length, client_state.openai_speech_prompt, show_partial_text,
+                client_state.stt_correction_policy,
+            )
+            if text_from_speech is None:
+                chat_input.input_question.set_value('')
+                # Background task of the upload route, the page's context comes from its element
+                with chat_input.record_button:
+                    ui.notify('音声が聞き取れませんでした。もう一度話してください！', type='warning', close_button=True, position='top')
+
+        if text_from_speech is not None:
             client_state.last_text_from_speech = text_from_speech
             chat_input.input_question.set_value(value=text_from_speech)
 
         client_state.is_processing_audio = False
     
-    chat_input.record_button.props(remove='loading disable')
\ No newline at end of file
+    chat_input.record_button.props(remove='loading disable')
+
+async def handle_audio_chunk(
+    recording_id: str,
+    chunk: bytes,
+    client_state: State,
+    chat_input: ChatInput,
+) -> None:
+    """Transcribe the next chunk of the recording and show the partial text while the user speaks."""
+    if STT_STREAMING_SEGMENT_SECONDS <= 0:
+        return
+
+    transcriber = client_state.transcriber
+    if transcriber is None or transcriber.recording_id != recording_id:
+        if transcriber is not None:
+            # A new recording replaces the previous one, like in AudioUploadSession
+            transcriber.cancel()
+        transcriber = client_state.transcriber = IncrementalTranscriber(recording_id)
+
+    partial_text = await transcriber.update(chunk)
+    # Ignored when the recording has already been finished meanwhile
+    if partial_text is not None and client_state.transcriber is transcriber:
+        chat_input.input_question.set_value(value=partial_text)
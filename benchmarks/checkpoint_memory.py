@@ -0,0 +1,84 @@
+"""
+Resident memory of the shared checkpointer over many simulated chat sessions.
+
+Every session is a new thread_id running a few turns through a one-node MessagesState
+graph compiled with BoundedCheckpointSaver, the way State/ShopGraph use it. The RSS and
+the saver's own accounting are printed every --report-every sessions; with a working
+budget both stay flat once the budget is reached. At the end the saver is closed and a
+new one reloads the first session from SQLite to check that its messages survived.
+
+    python benchmarks/checkpoint_memory.py --sessions 10000 --budget-kb 2048
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import StateGraph, MessagesState, START, END
+
+from components.checkpoint_store import BoundedCheckpointSaver
+
+
+def get_rss_kb() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        import resource
+        # Peak instead of current RSS where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def build_graph(saver: BoundedCheckpointSaver, answer_length: int):
+    def respond(state: MessagesState):
+        return {"messages": [AIMessage("回答" * (answer_length // 2))]}
+
+    graph_builder = StateGraph(MessagesState)
+    graph_builder.add_node("respond", respond)
+    graph_builder.add_edge(START, "respond")
+    graph_builder.add_edge("respond", END)
+    return graph_builder.compile(checkpointer=saver)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--answer-length', type=int, default=400)
+    parser.add_argument('--budget-kb', type=int, default=2048)
+    parser.add_argument('--report-every', type=int, default=1000)
+    args = parser.parse_args()
+
+    sqlite_path = os.path.join(tempfile.mkdtemp(), 'checkpoints.sqlite')
+    saver = BoundedCheckpointSaver(memory_budget_bytes=args.budget_kb * 1024, sqlite_path=sqlite_path)
+    graph = build_graph(saver, args.answer_length)
+
+    print(f"{'sessions':>8} {'rss_kb':>8} {'saver_kb':>8} {'threads':>7} {'blobs':>7} {'s':>6}")
+    started_at = time.perf_counter()
+    for session in range(1, args.sessions + 1):
+        config = {"configurable": {"thread_id": f"session-{session}"}}
+        for turn in range(args.turns):
+            graph.invoke({"messages": [HumanMessage(f"質問 {turn}")]}, config)
+
+        if session % args.report_every == 0:
+            print(
+                f"{session:>8} {get_rss_kb():>8} {saver.total_size // 1024:>8} "
+                f"{len(saver.thread_sizes):>7} {len(saver.blobs):>7} {time.perf_counter() - started_at:>6.1f}"
+            )
+
+    saver.close()
+
+    reloaded = BoundedCheckpointSaver(sqlite_path=sqlite_path)
+    messages = build_graph(reloaded, args.answer_length).get_state({"configurable": {"thread_id": "session-1"}}).values.get("messages", [])
+    reloaded.close()
+    print(f"session-1 reloaded from SQLite with {len(messages)} messages (expected {2 * args.turns})")
+    if len(messages) != 2 * args.turns:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
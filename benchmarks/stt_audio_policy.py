@@ -0,0 +1,96 @@
+"""
+Bytes and conversion time per second of audio for each STT_AUDIO_POLICY, without calling Whisper.
+
+Every recording goes through prepare_recording_files, the same path as a voice query: FFmpeg
+decode, VAD, and the encoding the policy asks for. Without arguments a recording is made up
+the way Chrome's MediaRecorder would send it (webm/Opus, 48 kHz): a voiced stand-in for
+speech with a pause in the middle and a second of room noise on both sides. FFmpeg must be
+installed, like for the app itself.
+
+    python benchmarks/stt_audio_policy.py [recording.webm ...] --repeat 5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import numpy as np
+from dotenv import load_dotenv
+
+# The page modules create their API clients when imported, like in main_page
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'), override=True)
+
+from utils.python_utils import SPEECH_SAMPLE_RATE, prepare_recording_files, run_ffmpeg
+
+POLICIES = ('passthrough', 'flac', 'opus', 'smallest')
+
+
+def make_recording(seconds: float) -> bytes:
+    """webm/Opus at 48 kHz: 1 s of noise, speech with a 1 s pause, 1 s of noise."""
+    rng = np.random.default_rng(0)
+    speech_seconds = max(seconds - 3, 1) / 2
+    t = np.arange(int(speech_seconds * SPEECH_SAMPLE_RATE)) / SPEECH_SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(150 + 30 * np.sin(2 * np.pi * 0.5 * t)) / SPEECH_SAMPLE_RATE
+    speech = sum(np.sin(k * phase) / k for k in range(1, 12)) * (0.6 - 0.4 * np.cos(2 * np.pi * 4 * t)) * 0.1
+
+    def silence(length: float) -> np.ndarray:
+        return np.zeros(int(length * SPEECH_SAMPLE_RATE))
+
+    samples = np.concatenate([silence(1), speech, silence(1), speech, silence(1)])
+    samples += rng.standard_normal(len(samples)) * 10 ** (-60 / 20)
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes()
+    return run_ffmpeg(
+        pcm,
+        ['-f', 's16le', '-ar', str(SPEECH_SAMPLE_RATE), '-ac', '1'],
+        ['-ar', '48000', '-c:a', 'libopus', '-b:a', '128k', '-f', 'webm'],
+    )
+
+
+def get_duration(audio: bytes) -> float:
+    return len(run_ffmpeg(audio, [], ['-ac', '1', '-ar', str(SPEECH_SAMPLE_RATE), '-f', 's16le'])) / 2 / SPEECH_SAMPLE_RATE
+
+
+async def measure(audio: bytes, mime_type: str, duration: float, policy: str, repeat: int):
+    times = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        speech_files = await prepare_recording_files(audio, mime_type, duration, policy)
+        times.append(time.perf_counter() - started_at)
+    sent = sum(len(speech_file.getbuffer()) for speech_file in speech_files or [])
+    return sent, statistics.median(times), len(speech_files or [])
+
+
+async def benchmark(recordings, repeat: int) -> None:
+    print(f"{'recording':<24} {'policy':<12} {'bytes':>9} {'KB/s audio':>10} {'s/s audio':>9} {'files':>5}")
+    for name, audio, mime_type in recordings:
+        duration = get_duration(audio)
+        print(f"{name:<24} {'upload':<12} {len(audio):>9} {len(audio) / 1024 / duration:>10.2f} {'':>9} {'':>5}  ({duration:.1f} s)")
+        for policy in POLICIES:
+            sent, seconds, files = await measure(audio, mime_type, duration, policy, repeat)
+            print(f"{'':<24} {policy:<12} {sent:>9} {sent / 1024 / duration:>10.2f} {seconds / duration:>9.4f} {files:>5}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recordings', nargs='*', help='webm/mp4/ogg recordings, a made-up one when none are given')
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.recordings:
+        recordings = []
+        for path in args.recordings:
+            with open(path, 'rb') as f:
+                recordings.append((os.path.basename(path), f.read(), f'audio/{os.path.splitext(path)[1].lstrip(".") or "webm"}'))
+    else:
+        recordings = [(f'made-up {args.seconds:.0f} s webm', make_recording(args.seconds), 'audio/webm')]
+
+    asyncio.run(benchmark(recordings, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Thread-pool vs async Supabase access at N concurrent page loads, against the local stand-in.
+
+A page load is one shop lookup, done either like before (`get_shop_information` in the
+default thread pool, what `run.io_bound` uses) or awaited with `aget_shop_information`.
+The stand-in adds --latency seconds to every request to mimic the network.
+
+    python benchmarks/supabase_concurrency.py --loads 100 --latency 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+from supabase_stub import SupabaseStub, STUB_API_KEY
+
+
+async def timed(coroutine) -> float:
+    started_at = time.perf_counter()
+    await coroutine
+    return time.perf_counter() - started_at
+
+
+async def run_loads(load, count: int):
+    started_at = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(load(f'shop_{i % 10}')) for i in range(count)))
+    return time.perf_counter() - started_at, sorted(latencies)
+
+
+def report(name: str, total: float, latencies, stub: SupabaseStub) -> None:
+    print(
+        f"{name:<12} total {total:6.3f} s  p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f} ms  "
+        f"max in flight {stub.max_concurrent_requests:3d}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loads', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    shops = [{'shop_name_en': f'shop_{i}', 'shop_name_jp': f'店{i}'} for i in range(10)]
+    with SupabaseStub(tables={'users': shops}, latency=args.latency) as stub:
+        os.environ['SUPABASE_URL'] = stub.url
+        os.environ['SUPABASE_ANON_KEY'] = STUB_API_KEY
+        from components import user_db
+
+        async def thread_pool_load(shop_name_en: str):
+            return await asyncio.get_running_loop().run_in_executor(None, user_db.get_shop_information, shop_name_en)
+
+        async def benchmark():
+            # Warm up both clients so connection setup is not measured
+            await thread_pool_load('shop_0')
+            await user_db.aget_shop_information('shop_0')
+
+            for name, load in (('thread pool', thread_pool_load), ('async', user_db.aget_shop_information)):
+                stub.max_concurrent_requests = 0
+                total, latencies = await run_loads(load, args.loads)
+                report(name, total, latencies, stub)
+
+        print(f"{args.loads} concurrent page loads, {args.latency * 1000:.0f} ms per request, "
+              f"SUPABASE_MAX_CONCURRENCY={user_db.supabase_semaphore._value}")
+        asyncio.run(benchmark())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app imports its modules as `components.x`, `utils.x`, like when run from app/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+sys.path.insert(0, os.path.dirname(__file__))
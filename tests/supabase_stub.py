@@ -0,0 +1,120 @@
+"""
+Local stand-in for the Supabase REST API (PostgREST), enough for components.user_db.
+
+Tables live in memory. Filters of the form `column=eq.value` are supported on select,
+update and delete, and every request can be delayed by `latency` seconds to mimic the
+network. Errors use the PostgREST error body, so the client raises its usual APIError.
+
+    with SupabaseStub(tables={'users': [...]}, latency=0.05) as stub:
+        os.environ['SUPABASE_URL'] = stub.url
+"""
+import copy
+import time
+import socket
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Shaped like a JWT, supabase-py rejects anything else before sending a request
+STUB_API_KEY = 'stub.eyJyb2xlIjoiYW5vbiJ9.stub'
+
+
+def postgrest_error(status_code: int, code: str, message: str) -> JSONResponse:
+    return JSONResponse({'code': code, 'message': message, 'details': None, 'hint': None}, status_code=status_code)
+
+
+class SupabaseStub:
+    def __init__(self, tables: Optional[Dict[str, List[dict]]] = None, latency: float = 0.0) -> None:
+        self.tables: Dict[str, List[dict]] = copy.deepcopy(tables or {})
+        self.latency = latency
+        self.request_count = 0
+        self.max_concurrent_requests = 0
+        self.concurrent_requests = 0
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.server = uvicorn.Server(uvicorn.Config(self.create_app(), host='127.0.0.1', port=self.port, log_level='warning'))
+        self.thread: Optional[threading.Thread] = None
+
+    def create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware('http')
+        async def simulate_network(request: Request, call_next):
+            self.request_count += 1
+            self.concurrent_requests += 1
+            self.max_concurrent_requests = max(self.max_concurrent_requests, self.concurrent_requests)
+            try:
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                return await call_next(request)
+            finally:
+                self.concurrent_requests -= 1
+
+        @app.get('/rest/v1/{table}')
+        async def select(table: str, request: Request):
+            if table not in self.tables:
+                return postgrest_error(404, '42P01', f'relation "public.{table}" does not exist')
+            return [row for row in self.tables[table] if self.matches(row, request)]
+
+        @app.post('/rest/v1/{table}')
+        async def insert(table: str, request: Request):
+            if table not in self.tables:
+                return postgrest_error(404, '42P01', f'relation "public.{table}" does not exist')
+            body = await request.json()
+            rows = body if isinstance(body, list) else [body]
+            self.tables[table].extend(copy.deepcopy(rows))
+            return JSONResponse(rows, status_code=201)
+
+        @app.patch('/rest/v1/{table}')
+        async def update(table: str, request: Request):
+            if table not in self.tables:
+                return postgrest_error(404, '42P01', f'relation "public.{table}" does not exist')
+            values = await request.json()
+            columns = set().union(*self.tables[table]) if self.tables[table] else set()
+            unknown = set(values) - columns
+            if unknown:
+                return postgrest_error(400, 'PGRST204', f"Could not find the '{sorted(unknown)[0]}' column of '{table}'")
+
+            updated = []
+            for row in self.tables[table]:
+                if self.matches(row, request):
+                    row.update(values)
+                    updated.append(row)
+            return updated
+
+        return app
+
+    @staticmethod
+    def matches(row: Dict[str, Any], request: Request) -> bool:
+        for column, condition in request.query_params.items():
+            if column == 'select':
+                continue
+            operator, _, value = condition.partition('.')
+            if operator != 'eq' or str(row.get(column)) != value:
+                return False
+        return True
+
+    def start(self) -> 'SupabaseStub':
+        self.thread = threading.Thread(target=self.server.run, name='supabase-stub', daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> 'SupabaseStub':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
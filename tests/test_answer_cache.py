@@ -0,0 +1,40 @@
+import asyncio
+
+from components.answer_cache import SemanticAnswerCache, get_answer_scope
+from components.text_embedding import NgramHashEmbeddings
+
+QUESTION = '営業時間を教えてください'
+
+
+def test_shops_sharing_a_namespace_keep_their_own_answers():
+    cache = SemanticAnswerCache(embeddings=NgramHashEmbeddings())
+    shop_a = get_answer_scope('shop_a', 'あなたは車屋のアシスタントです。')
+    shop_b = get_answer_scope('shop_b', 'あなたは美容室のアシスタントです。')
+    shop_a_new_prompt = get_answer_scope('shop_a', 'あなたは車屋の店長です。')
+
+    async def scenario():
+        cache.store('shared', shop_a, QUESTION, '10時から19時です。')
+        return (
+            cache.lookup('shared', shop_a, QUESTION),
+            cache.lookup('shared', shop_b, QUESTION),
+            cache.lookup('shared', shop_a_new_prompt, QUESTION),
+        )
+
+    assert asyncio.run(scenario()) == ('10時から19時です。', None, None)
+
+
+def test_namespace_change_drops_every_scope():
+    cache = SemanticAnswerCache(embeddings=NgramHashEmbeddings())
+    shop_a = get_answer_scope('shop_a', 'prompt a')
+    shop_b = get_answer_scope('shop_b', 'prompt b')
+
+    async def scenario():
+        cache.store('shared', shop_a, QUESTION, 'a')
+        cache.store('shared', shop_b, QUESTION, 'b')
+        cache.store('other', shop_a, QUESTION, 'other')
+        cache.invalidate('shared')
+        # The invalidation runs on the loop, like when it comes from an admin worker thread
+        await asyncio.sleep(0)
+        return cache.lookup('shared', shop_a, QUESTION), cache.lookup('shared', shop_b, QUESTION), cache.lookup('other', shop_a, QUESTION)
+
+    assert asyncio.run(scenario()) == (None, None, 'other')
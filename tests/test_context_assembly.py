@@ -0,0 +1,26 @@
+from langchain.docstore.document import Document
+
+from components import context_assembly
+from components.context_assembly import assemble_context
+from components.keyword_index import reciprocal_rank_fusion
+
+HOURS = Document(page_content='営業時間は10時から19時です。定休日は水曜日です。', metadata={'service': '店舗'})
+PARKING = Document(page_content='駐車場は店舗の裏に10台分あります。', metadata={'service': '店舗'})
+PAYMENT = Document(page_content='お支払いは現金とクレジットカードに対応しています。', metadata={'service': '決済'})
+
+
+def test_budget_cuts_the_lowest_scores_whatever_the_input_order(monkeypatch):
+    # tiktoken downloads its encoding on first use, one token per character is enough here
+    monkeypatch.setattr(context_assembly.token_counter, 'count_text', len)
+    budget = len(context_assembly.format_document(PAYMENT)) + len(context_assembly.format_document(HOURS)) + 2
+
+    context = assemble_context([(PARKING, 0.01), (HOURS, 0.02), (PAYMENT, 0.03)], token_budget=budget)
+
+    assert [document.page_content for document in context.documents] == [PAYMENT.page_content, HOURS.page_content]
+
+
+def test_fusion_scores_documents_found_by_both_searches_first():
+    fused = reciprocal_rank_fusion([[PARKING, HOURS], [HOURS, PAYMENT]])
+
+    assert [document.page_content for document, _ in fused] == [HOURS.page_content, PARKING.page_content, PAYMENT.page_content]
+    assert [score for _, score in fused] == sorted((score for _, score in fused), reverse=True)
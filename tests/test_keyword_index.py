@@ -0,0 +1,46 @@
+import asyncio
+import logging
+
+import pandas as pd
+
+from components import keyword_index
+from components.keyword_index import KeywordIndexRegistry
+
+
+def test_failed_build_is_logged_and_retried_after_a_cooldown(monkeypatch, caplog):
+    calls = []
+
+    async def acollect_vector_data(namespace):
+        calls.append(namespace)
+        if len(calls) == 1:
+            raise RuntimeError('Upstash is down')
+        return pd.DataFrame([{'vector_id': 'hours', 'text': '営業時間は10時から19時です。', 'service': '店舗'}])
+
+    monkeypatch.setattr(keyword_index, 'acollect_vector_data', acollect_vector_data)
+    registry = KeywordIndexRegistry()
+
+    async def build_once():
+        await asyncio.wait([registry.building['shop']])
+        # Let the done-callback run
+        await asyncio.sleep(0)
+
+    async def scenario():
+        assert registry.get('shop') is None
+        await build_once()
+        # Still cooling down, searches do not start another build
+        assert registry.get('shop') is None
+        assert not registry.building
+
+        failure_count, _ = registry.failures['shop']
+        registry.failures['shop'] = (failure_count, 0.0)
+        registry.get('shop')
+        await build_once()
+        return registry.get('shop')
+
+    with caplog.at_level(logging.ERROR, logger=keyword_index.__name__):
+        index = asyncio.run(scenario())
+
+    assert calls == ['shop', 'shop']
+    assert index.search('営業時間', k=1)[0][0].metadata == {'service': '店舗'}
+    assert 'shop' not in registry.failures
+    assert 'Building the keyword index of shop failed' in caplog.text
@@ -0,0 +1,61 @@
+import asyncio
+
+from upstash_vector.types import Data
+
+from components import vector_db
+from components.vector_db import UpstashBackend, create_backend, get_backend, set_namespace_backend
+from components.local_vector_store import LocalBackend
+from components.text_embedding import NgramHashEmbeddings
+
+QA = {
+    'hours': '営業時間は10時から19時です。定休日は水曜日です。',
+    'parking': '駐車場は店舗の裏に10台分あります。',
+    'payment': 'お支払いは現金とクレジットカードに対応しています。',
+}
+
+
+def add_qa(backend: LocalBackend, namespace: str) -> None:
+    vectors = [
+        Data(id=vector_id, data=text, metadata={'text': text, 'service': '店舗', 'chat_bot_type': 'q_and_a'})
+        for vector_id, text in QA.items()
+    ]
+    asyncio.run(backend.aupsert_vector_data(namespace, vectors))
+
+
+def test_memory_backend_add_search_delete():
+    backend = create_backend('memory')
+    add_qa(backend, 'shop')
+    store = backend.get_vector_store('shop')
+
+    assert store.similarity_search('駐車場はありますか', k=1)[0].page_content == QA['parking']
+    assert store.similarity_search('駐車場はありますか', k=3, filter={'service': 'その他'}) == []
+    assert set(backend.get_vector_data('shop')['vector_id']) == set(QA)
+
+    assert backend.remove_vectors('shop', ['parking'])
+    assert not backend.remove_vectors('shop', ['parking'])
+    assert QA['parking'] not in [document.page_content for document in store.similarity_search('駐車場はありますか', k=3)]
+    assert backend.get_vector_data('other').empty
+
+
+def test_local_backend_reloads_from_its_directory(tmp_path):
+    add_qa(LocalBackend(embeddings=NgramHashEmbeddings(), directory=str(tmp_path)), 'shop/ja')
+
+    reloaded = LocalBackend(embeddings=NgramHashEmbeddings(), directory=str(tmp_path))
+    rows = reloaded.get_specific_vector_data('shop/ja', ['hours', 'missing'])
+    assert rows.to_dict('records') == [{'service': '店舗', 'chat_bot_type': 'q_and_a', 'text': QA['hours'], 'vector_id': 'hours'}]
+    assert reloaded.get_vector_store('shop/ja').similarity_search('支払い方法', k=1)[0].page_content == QA['payment']
+
+
+def test_unknown_shop_backend_falls_back_to_the_default(monkeypatch):
+    monkeypatch.setattr(vector_db, 'vector_backends', {})
+    monkeypatch.setattr(vector_db, 'namespace_backends', {})
+
+    set_namespace_backend('typo', 'memroy')
+    assert get_backend('typo').name == get_backend('untouched').name
+    set_namespace_backend('typo', 'memory')
+    assert get_backend('typo').name == 'memory'
+
+
+def test_backends_implement_the_whole_interface():
+    assert not UpstashBackend.__abstractmethods__
+    assert not LocalBackend.__abstractmethods__
@@ -0,0 +1,45 @@
+import os
+import importlib
+
+import pytest
+
+# The module creates its AsyncOpenAI client when imported
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+from components import openai_speech_to_text
+from components.openai_speech_to_text import needs_correction
+
+SPEECH_PROMPT = 'ショップの商品名: エアリズム, ヒートテック'
+CLEAN_TRANSCRIPT = 'エアリズムの在庫はありますか？'
+
+
+@pytest.fixture
+def default_policy(monkeypatch):
+    """The module as loaded without STT_CORRECTION_POLICY, whatever the environment running the tests sets."""
+    monkeypatch.delenv('STT_CORRECTION_POLICY', raising=False)
+    yield importlib.reload(openai_speech_to_text)
+    monkeypatch.undo()
+    importlib.reload(openai_speech_to_text)
+
+
+def test_every_transcript_is_corrected_by_default(default_policy):
+    assert default_policy.STT_CORRECTION_POLICY == 'always'
+    assert default_policy.get_correction_policy(None) == 'always'
+    assert needs_correction(CLEAN_TRANSCRIPT, SPEECH_PROMPT)
+    assert needs_correction(CLEAN_TRANSCRIPT, SPEECH_PROMPT, policy=None)
+
+
+def test_shops_opt_in_to_skipping_clean_transcripts():
+    assert not needs_correction(CLEAN_TRANSCRIPT, SPEECH_PROMPT, policy='auto')
+    assert needs_correction('えーと、エアリズムの在庫はありますか？', SPEECH_PROMPT, policy='auto')
+    # A misheard product name is not in the prompt
+    assert needs_correction('エアリスムの在庫はありますか？', SPEECH_PROMPT, policy='auto')
+
+
+def test_unknown_shop_policy_falls_back_to_the_default(monkeypatch):
+    monkeypatch.setattr(openai_speech_to_text, 'STT_CORRECTION_POLICY', 'always')
+    assert needs_correction(CLEAN_TRANSCRIPT, SPEECH_PROMPT, policy='sometimes')
+
+    monkeypatch.setattr(openai_speech_to_text, 'STT_CORRECTION_POLICY', 'auto')
+    assert openai_speech_to_text.get_correction_policy('sometimes') == 'auto'
+    assert not needs_correction(CLEAN_TRANSCRIPT, SPEECH_PROMPT, policy='sometimes')
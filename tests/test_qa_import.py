@@ -0,0 +1,53 @@
+from components.qa_import import RowError, count_file_rows, detect_encoding, iter_batches
+
+HEADER = 'Q&A内容,商材\r\n'
+
+
+def write_csv(tmp_path, content: bytes) -> str:
+    path = str(tmp_path / 'qa.csv')
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_cp932_csv_is_detected_and_imported(tmp_path):
+    path = write_csv(tmp_path, (HEADER + '営業時間は何時ですか？10時から19時です。,店舗\r\n').encode('cp932'))
+
+    assert detect_encoding(path) == 'cp932'
+    errors = []
+    batches = list(iter_batches(path, 'ns', '', errors, encoding='cp932'))
+    assert errors == []
+    assert batches[0][0].data == '営業時間は何時ですか？10時から19時です。'
+
+
+def test_utf8_with_bom_is_preferred(tmp_path):
+    path = write_csv(tmp_path, (HEADER + '送料はいくらですか？,通販\r\n').encode('utf-8-sig'))
+
+    assert detect_encoding(path) == 'utf-8-sig'
+
+
+def test_undecodable_file_has_no_encoding(tmp_path):
+    # 0xFF is neither valid UTF-8 nor a cp932 lead byte
+    path = write_csv(tmp_path, HEADER.encode('utf-8') + b'\xff\xfe,x\r\n')
+
+    assert detect_encoding(path) is None
+
+
+def test_blank_lines_are_not_counted_and_keep_line_numbers(tmp_path):
+    path = write_csv(tmp_path, (HEADER + '\r\n,店舗\r\n\r\n,,\r\n質問と回答,店舗\r\n').encode('utf-8'))
+
+    assert count_file_rows(path) == 2
+    errors = []
+    batches = list(iter_batches(path, 'ns', '', errors))
+    assert errors == [RowError(3, 'Q&A内容がありません')]
+    assert [vector.data for vector in batches[0]] == ['質問と回答']
+
+
+def test_broken_row_ends_the_file_with_an_error(tmp_path):
+    # A field over csv.field_size_limit() makes the csv module raise part way through the file
+    path = write_csv(tmp_path, (HEADER + '一行目,店舗\r\n"' + 'あ' * 200000 + '",店舗\r\n').encode('utf-8'))
+
+    errors = []
+    batches = list(iter_batches(path, 'ns', '', errors))
+    assert [vector.data for vector in batches[0]] == ['一行目']
+    assert len(errors) == 1 and errors[0].line == 3
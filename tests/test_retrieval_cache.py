@@ -0,0 +1,25 @@
+import asyncio
+
+from langchain.docstore.document import Document
+
+from components.retrieval_cache import RetrievalCache
+
+
+def test_change_from_a_worker_thread_expires_cached_results():
+    cache = RetrievalCache()
+    fetched = []
+
+    async def fetch():
+        fetched.append(len(fetched))
+        return [Document(page_content=f'answer {len(fetched)}')]
+
+    async def scenario():
+        first = await cache.get_or_fetch('shop', '営業時間', 3, fetch)
+        assert await cache.get_or_fetch('shop', '営業時間', 3, fetch) is first
+        # Admin edits notify the listeners from run.io_bound
+        await asyncio.to_thread(cache.bump_generation, 'shop', {}, ['hours'])
+        await asyncio.sleep(0)
+        return await cache.get_or_fetch('shop', '営業時間', 3, fetch)
+
+    assert asyncio.run(scenario())[0].page_content == 'answer 2'
+    assert fetched == [0, 1]
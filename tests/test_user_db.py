@@ -0,0 +1,91 @@
+import os
+import asyncio
+
+import pytest
+
+from supabase_stub import SupabaseStub, STUB_API_KEY
+
+SHOPS = [
+    {'shop_name_en': 'car_shop', 'shop_name_jp': '車屋', 'vector_db_namespace': 'car', 'disabled': False},
+    {'shop_name_en': 'hair_salon', 'shop_name_jp': '美容室', 'vector_db_namespace': 'hair', 'disabled': False},
+]
+
+
+@pytest.fixture(scope='module')
+def stub():
+    with SupabaseStub(tables={'users': SHOPS}) as stub:
+        # user_db creates its clients from the environment when imported
+        os.environ['SUPABASE_URL'] = stub.url
+        os.environ['SUPABASE_ANON_KEY'] = STUB_API_KEY
+        yield stub
+
+
+@pytest.fixture
+def user_db(stub):
+    from components import user_db
+    stub.tables['users'] = [dict(row) for row in SHOPS]
+    user_db.shop_config_cache.invalidate()
+    # Another test module may have imported user_db first, against another URL
+    user_db.supabase = user_db.create_client(stub.url, STUB_API_KEY)
+    # The async client belongs to the event loop it was created on, every test runs its own
+    user_db.async_supabase = None
+    return user_db
+
+
+def test_sync_and_async_shop_information_match(user_db):
+    async def scenario():
+        return await user_db.aget_shop_information('car_shop'), await user_db.aget_shop_information('unknown')
+
+    user, unknown = asyncio.run(scenario())
+    assert user == user_db.get_shop_information('car_shop')
+    assert user.vector_db_namespace == 'car'
+    assert unknown is None
+
+
+def test_aget_table_data(user_db):
+    df = asyncio.run(user_db.aget_table_data('users'))
+    assert sorted(df['shop_name_en']) == ['car_shop', 'hair_salon']
+
+
+def test_aupdate_table_data_invalidates_shop_cache(user_db):
+    async def scenario():
+        assert (await user_db.shop_config_cache.get('car_shop')).vector_db_namespace == 'car'
+        df = await user_db.aupdate_table_data('users', {'shop_name_en': 'car_shop'}, {'vector_db_namespace': 'car2'})
+        return df, await user_db.shop_config_cache.get('car_shop')
+
+    df, user = asyncio.run(scenario())
+    assert df['vector_db_namespace'].tolist() == ['car2']
+    assert user.vector_db_namespace == 'car2'
+
+
+def test_aupdate_table_data_raises_on_error(user_db):
+    with pytest.raises(Exception):
+        asyncio.run(user_db.aupdate_table_data('users', {'shop_name_en': 'car_shop'}, {'no_such_column': 1}))
+    with pytest.raises(Exception):
+        user_db.update_table_data('users', {'shop_name_en': 'car_shop'}, {'no_such_column': 1})
+
+
+def test_new_shop_is_found_after_invalidating_a_miss(user_db, stub):
+    async def scenario():
+        assert await user_db.shop_config_cache.get('new_shop') is None
+        stub.tables['users'].append({'shop_name_en': 'new_shop', 'shop_name_jp': '新店'})
+        # The miss is remembered until the cache is told about the change
+        assert await user_db.shop_config_cache.get('new_shop') is None
+        user_db.shop_config_cache.invalidate('new_shop')
+        return await user_db.shop_config_cache.get('new_shop')
+
+    assert asyncio.run(scenario()).shop_name_jp == '新店'
+
+
+def test_update_from_a_worker_thread_invalidates_on_the_loop(user_db):
+    async def scenario():
+        assert (await user_db.shop_config_cache.get('hair_salon')).vector_db_namespace == 'hair'
+        # Like run.io_bound from the admin page
+        await asyncio.get_running_loop().run_in_executor(
+            None, user_db.update_table_data, 'users', {'shop_name_en': 'hair_salon'}, {'vector_db_namespace': 'hair2'},
+        )
+        # The invalidation was scheduled onto the loop, it runs before this coroutine continues
+        await asyncio.sleep(0)
+        return await user_db.shop_config_cache.get('hair_salon')
+
+    assert asyncio.run(scenario()).vector_db_namespace == 'hair2'
@@ -0,0 +1,87 @@
+import os
+import asyncio
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from supabase_stub import STUB_API_KEY
+
+# python_utils pulls in the page modules, which create their API clients when imported
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+os.environ.setdefault('SUPABASE_ANON_KEY', STUB_API_KEY)
+
+from utils import python_utils
+from utils.python_utils import SPEECH_SAMPLE_RATE, IncrementalTranscriber, get_speech_range, get_speech_seconds
+
+rng = np.random.default_rng(0)
+
+
+def speech(seconds: float, level_db: float = -20, depth: float = 0.2) -> np.ndarray:
+    """Voiced speech stand-in: a gliding 150 Hz harmonic tone with a 4 Hz syllable envelope."""
+    t = np.arange(int(seconds * SPEECH_SAMPLE_RATE)) / SPEECH_SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(150 + 30 * np.sin(2 * np.pi * 0.5 * t)) / SPEECH_SAMPLE_RATE
+    x = sum(np.sin(k * phase) / k for k in range(1, 12)) * (1 - depth - depth * np.cos(2 * np.pi * 4 * t))
+    return (x / np.sqrt(np.mean(x ** 2)) * 10 ** (level_db / 20)).astype(np.float32)
+
+
+def noise(seconds: float, level_db: float) -> np.ndarray:
+    return (rng.standard_normal(int(seconds * SPEECH_SAMPLE_RATE)) * 10 ** (level_db / 20)).astype(np.float32)
+
+
+def test_all_speech_clip_is_kept_whole():
+    # No quiet frames at all, the noise floor estimate is speech itself
+    samples = speech(3)
+
+    assert get_speech_range(samples) == [(0, len(samples))]
+
+
+def test_noisy_speech_is_detected_and_trimmed():
+    # 8 dB SNR, with a second of noise alone on both sides
+    samples = np.r_[noise(1, -28), speech(3, -20) + noise(3, -28), noise(1, -28)]
+
+    segments = get_speech_range(samples)
+    assert get_speech_seconds(segments) >= 3
+    assert segments[0][0] <= SPEECH_SAMPLE_RATE and segments[-1][1] >= 4 * SPEECH_SAMPLE_RATE
+    # Most of the noise around the speech is trimmed
+    assert get_speech_seconds(segments) < 4
+
+
+def test_silence_is_rejected_and_unsure_audio_sent_whole():
+    assert get_speech_range(noise(3, -60)) == []
+
+    # Loud, but nothing voiced in it: not silent, so Whisper decides
+    loud_noise = noise(3, -30)
+    assert get_speech_range(loud_noise) == [(0, len(loud_noise))]
+
+
+@pytest.fixture
+def sent_segments(monkeypatch):
+    sent = []
+
+    def encode_speech_pcm(samples, codec='opus'):
+        sent.append(len(samples))
+        return BytesIO()
+
+    async def transcribe_file(audio_file, prompt=''):
+        return 'テキスト'
+
+    monkeypatch.setattr(python_utils, 'encode_speech_pcm', encode_speech_pcm)
+    monkeypatch.setattr(python_utils, 'transcribe_file', transcribe_file)
+    return sent
+
+
+def test_rolling_segments_are_only_skipped_when_silent(sent_segments):
+    transcriber = IncrementalTranscriber('recording')
+    transcriber.cancel()
+
+    async def scenario():
+        await transcriber.transcribe_segment(speech(6, depth=0.1) + noise(6, -28))
+        await transcriber.transcribe_segment(noise(6, -30))
+        await transcriber.transcribe_segment(noise(6, -70))
+
+    asyncio.run(scenario())
+    # The noisy speech and the loud noise are both sent, only the silent segment is skipped
+    assert sent_segments == [6 * SPEECH_SAMPLE_RATE, 6 * SPEECH_SAMPLE_RATE]
+    assert transcriber.texts == ['テキスト', 'テキスト']